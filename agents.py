@@ -1,57 +1,146 @@
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+import tools
 from crewai import Agent
-from langchain_openai import ChatOpenAI
+from crew_registry import CrewConfigError, shared_registry
+from http_pool import shared_client
+from llm_cache import CachedChatOpenAI, ResponseCache
+from mock_llm import MockChatModel
+from model_router import ModelRouter
 
 class FinanceAgents:
-    def __init__(self):
-        self.llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0.1)
+    """Pools of agents built from the role specs of a CrewRegistry (crews.yaml by default)"""
     
-    def financial_analyst_agent(self):
+    def __init__(self, cache=None, pool_size=None, callbacks=None, verbose=False, llm=None, router=None,
+                 registry=None):
+        self.registry = registry or shared_registry()
+        # Tool names are checked here, since the registry itself imports no tools
+        for name, spec in self.registry.agents.items():
+            missing = [tool for tool in spec.tools if not hasattr(tools, tool)]
+            if missing:
+                raise CrewConfigError(f"agent {name}: unknown tools {', '.join(missing)}")
+        self.roles = tuple(self.registry.agents)
+        # Responses are cached on disk when FINANCE_CACHE_PATH is set;
+        # pass cache=False to bypass it explicitly
+        self.cache = ResponseCache.from_env() if cache is None else cache
+        self.callbacks = list(callbacks or [])
+        # An injected model (e.g. MockChatModel) replaces ChatOpenAI and its cache
+        if llm is not None:
+            llm.callbacks = list(llm.callbacks or []) + self.callbacks
+        # The default model is built when the first agent needs it
+        self._llm = llm
+        self._llm_lock = threading.Lock()
+        # Tasks run on the models FINANCE_ROUTING_PATH or FINANCE_MODEL_ROUTES pick
+        # for them; pass router=False to keep every task on `llm`
+        self.router = ModelRouter.from_env(cache=self.cache) if router is None else router
+        if self.router:
+            self.router.callbacks = self.router.callbacks + self.callbacks
+        self.verbose = verbose
+        self.pool_size = pool_size or int(os.getenv("FINANCE_AGENT_POOL_SIZE", 16))
+        self._pools = {role: queue.LifoQueue() for role in self.roles}
+        self._pool_counts = {role: 0 for role in self.roles}
+        self._pool_lock = threading.Lock()
+    
+    @property
+    def llm(self):
+        """The agents' model: the injected one, the mock LLM or a cached ChatOpenAI"""
+        with self._llm_lock:
+            if self._llm is None:
+                if os.getenv("FINANCE_LLM") == "mock":
+                    llm = MockChatModel.from_env()
+                else:
+                    # Connections are pooled process-wide and the pool's transport
+                    # does the retrying, so the OpenAI client must not retry as well
+                    llm = CachedChatOpenAI(
+                        model="gpt-3.5-turbo",
+                        temperature=0.1,
+                        cache=self.cache,
+                        http_client=shared_client(),
+                        max_retries=0
+                    )
+                llm.callbacks = list(llm.callbacks or []) + self.callbacks
+                self._llm = llm
+        return self._llm
+    
+    @contextmanager
+    def checkout(self, *roles):
+        """Lend pre-built agents for the given roles, returning them to the pool afterwards"""
+        # Acquire in a fixed order so concurrent checkouts cannot deadlock
+        acquired = {}
+        try:
+            for role in sorted(set(roles), key=self.roles.index):
+                acquired[role] = self._acquire(role)
+            yield tuple(acquired[role] for role in roles)
+        finally:
+            for role, agent in acquired.items():
+                self._release(role, agent)
+    
+    def _acquire(self, role):
+        try:
+            return self._pools[role].get_nowait()
+        except queue.Empty:
+            pass
+        with self._pool_lock:
+            grow = self._pool_counts[role] < self.pool_size
+            if grow:
+                self._pool_counts[role] += 1
+        if not grow:
+            return self._pools[role].get()
+        try:
+            return self.build(role)
+        except Exception:
+            with self._pool_lock:
+                self._pool_counts[role] -= 1
+            raise
+    
+    def warm(self, count=1):
+        """Pre-build `count` agents per role so the first requests skip construction"""
+        for role in self.roles:
+            agents = [self._acquire(role) for _ in range(min(count, self.pool_size))]
+            for agent in agents:
+                self._release(role, agent)
+    
+    def _release(self, role, agent):
+        # Drop per-request state; the next Crew installs its own cache handler
+        agent.crew = None
+        agent.step_callback = None
+        agent.formatting_errors = 0
+        agent.max_execution_time = None
+        if not agent.max_rpm:
+            agent._rpm_controller = None
+        # Reset in place: the agent's TokenCalcHandler holds this object
+        usage = agent._token_process
+        usage.total_tokens = usage.prompt_tokens = usage.completion_tokens = usage.successful_requests = 0
+        self._pools[role].put(agent)
+    
+    def build(self, role):
+        """Create a new agent for `role` from its spec"""
+        spec = self.registry.agents[role]
+        # CrewAI appends each agent's token counter to its model's callbacks, so every
+        # agent gets its own shallow copy of the shared model (client, cache and all)
+        llm = self.llm
+        llm = llm.copy(update={**llm.__dict__, "callbacks": list(llm.callbacks or [])})
         return Agent(
-            role='Financial Analyst',
-            goal='Analyze financial data, market trends, and provide insights on stocks, bonds, and market conditions',
-            backstory="""You are a seasoned financial analyst with 10+ years of experience in equity research 
-            and market analysis. You excel at interpreting financial statements, calculating key ratios, 
-            and identifying investment opportunities. Your analysis is thorough, data-driven, and actionable.""",
-            verbose=True,
+            role=spec.role,
+            goal=spec.goal,
+            backstory=spec.backstory,
+            verbose=self.verbose,
             allow_delegation=False,
-            llm=self.llm
+            tools=[getattr(tools, name) for name in spec.tools],
+            llm=llm
         )
     
+    def financial_analyst_agent(self):
+        return self.build("financial_analyst")
+    
     def risk_assessment_agent(self):
-        return Agent(
-            role='Risk Assessment Specialist',
-            goal='Evaluate investment risks, portfolio volatility, and provide risk mitigation strategies',
-            backstory="""You are a risk management expert with deep knowledge of quantitative risk models, 
-            portfolio theory, and regulatory compliance. You specialize in identifying potential risks 
-            in investments and portfolios, calculating VaR, beta, and other risk metrics. Your recommendations 
-            help investors make informed decisions about risk tolerance and diversification.""",
-            verbose=True,
-            allow_delegation=False,
-            llm=self.llm
-        )
+        return self.build("risk_assessment")
     
     def budget_planner_agent(self):
-        return Agent(
-            role='Budget Planning Advisor',
-            goal='Create comprehensive budgets, track expenses, and provide financial planning guidance',
-            backstory="""You are a certified financial planner who specializes in personal and corporate 
-            budgeting. You have helped hundreds of clients create realistic budgets, track spending patterns, 
-            and achieve their financial goals. You excel at breaking down complex financial situations into 
-            manageable budget categories and providing practical advice for financial discipline.""",
-            verbose=True,
-            allow_delegation=False,
-            llm=self.llm
-        )
+        return self.build("budget_planner")
     
     def investment_advisor_agent(self):
-        return Agent(
-            role='Investment Advisor',
-            goal='Provide investment recommendations, portfolio optimization, and wealth building strategies',
-            backstory="""You are a licensed investment advisor with expertise in portfolio construction, 
-            asset allocation, and wealth management. You understand different investment vehicles including 
-            stocks, bonds, ETFs, mutual funds, and alternative investments. You provide personalized 
-            investment strategies based on client goals, risk tolerance, and time horizon.""",
-            verbose=True,
-            allow_delegation=False,
-            llm=self.llm
-        )
\ No newline at end of file
+        return self.build("investment_advisor")
@@ -0,0 +1,194 @@
+"""
+Batch analysis of many companies with bounded concurrency, a token budget
+and a resumable checkpoint file
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+
+def load_companies(source):
+    """Yield company names from a list, or from a .csv, .jsonl or plain text file"""
+    if not isinstance(source, str):
+        for company in source:
+            yield str(company).strip()
+        return
+
+    with open(source, newline="") as f:
+        if source.endswith(".csv"):
+            reader = csv.DictReader(f)
+            column = next(
+                (name for name in ("company", "ticker", "name") if name in (reader.fieldnames or [])),
+                reader.fieldnames[0] if reader.fieldnames else None,
+            )
+            for row in reader:
+                if row.get(column):
+                    yield row[column].strip()
+        elif source.endswith(".jsonl"):
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if isinstance(record, dict):
+                    record = record.get("company") or record.get("ticker") or record.get("name")
+                if record:
+                    yield str(record).strip()
+        else:
+            for line in f:
+                if line.strip():
+                    yield line.strip()
+
+
+class TokenBudget:
+    """Token bucket that limits how many LLM tokens are spent per minute"""
+
+    def __init__(self, tokens_per_minute):
+        self.capacity = tokens_per_minute
+        self.available = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self.updated_at = time.monotonic()
+        self._cond = threading.Condition()
+
+    def acquire(self, tokens):
+        """Block until `tokens` can be spent without exceeding the budget"""
+        tokens = min(tokens, self.capacity)
+        with self._cond:
+            while True:
+                self._refill()
+                if self.available >= tokens:
+                    self.available -= tokens
+                    return
+                self._cond.wait((tokens - self.available) / self.rate)
+
+    def settle(self, reserved, used):
+        """Charge the tokens a run actually used in place of the `reserved` estimate"""
+        with self._cond:
+            self._refill()
+            # Overruns push the balance below zero, delaying the next runs until repaid
+            self.available = min(self.capacity, self.available + reserved - used)
+            self._cond.notify_all()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+
+class BatchAnalyzer:
+    """Run a FinanceCrew service over many inputs and stream results as they finish"""
+
+    def __init__(self, finance_crew=None, concurrency=4, tokens_per_minute=None,
+                 tokens_per_run=8000, checkpoint_path=None, service="run_financial_analysis"):
+        if finance_crew is None:
+            from main import FinanceCrew
+            finance_crew = FinanceCrew()
+        self.finance_crew = finance_crew
+        self.concurrency = concurrency
+        self.budget = TokenBudget(tokens_per_minute) if tokens_per_minute else None
+        self.tokens_per_run = tokens_per_run
+        self.checkpoint_path = checkpoint_path
+        self.service = getattr(finance_crew, service)
+        self._checkpoint_lock = threading.Lock()
+
+    def completed(self):
+        """Return the inputs already analysed successfully according to the checkpoint"""
+        done = set()
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A crash can leave a truncated last line behind
+                        continue
+                    if record.get("status") == "ok":
+                        done.add(record["company"])
+        return done
+
+    def run(self, companies):
+        """Yield one result record per company, in completion order"""
+        done = self.completed()
+        pending = (company for company in load_companies(companies) if company and company not in done)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            in_flight = set()
+            for company in pending:
+                in_flight.add(pool.submit(self._analyze, company))
+                if len(in_flight) >= self.concurrency:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        yield self._record(future.result())
+            while in_flight:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    yield self._record(future.result())
+
+    def _analyze(self, company):
+        if self.budget:
+            self.budget.acquire(self.tokens_per_run)
+        started = time.time()
+        with self._measure() as usage:
+            try:
+                result = self.service(company)
+                record = {"company": company, "status": "ok", "result": str(result)}
+            except Exception as e:
+                record = {"company": company, "status": "error", "error": str(e)}
+        record["elapsed"] = round(time.time() - started, 3)
+        if usage is not None:
+            fields = usage.fields()
+            record["tokens"] = fields["prompt_tokens"] + fields["completion_tokens"]
+            if self.budget:
+                self.budget.settle(self.tokens_per_run, record["tokens"])
+        return record
+
+    def _measure(self):
+        # Crews without telemetry (e.g. test stubs) keep the fixed per-run reservation
+        telemetry = getattr(self.finance_crew, "telemetry", None)
+        return telemetry.measure() if telemetry is not None else nullcontext()
+
+    def _record(self, record):
+        if self.checkpoint_path:
+            with self._checkpoint_lock, open(self.checkpoint_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        return record
+
+
+def main():
+    """Analyse every company in a file and print one JSON line per result"""
+    parser = argparse.ArgumentParser(description="Batch financial analysis")
+    parser.add_argument("source", help="CSV, JSONL or text file with one company per row")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--tokens-per-minute", type=int, default=None)
+    parser.add_argument("--tokens-per-run", type=int, default=8000,
+                        help="Tokens reserved from the budget before each crew run; its actual usage is charged afterwards")
+    parser.add_argument("--checkpoint", default=None,
+                        help="JSONL file that records results; completed companies are skipped on restart")
+    args = parser.parse_args()
+
+    analyzer = BatchAnalyzer(
+        concurrency=args.concurrency,
+        tokens_per_minute=args.tokens_per_minute,
+        tokens_per_run=args.tokens_per_run,
+        checkpoint_path=args.checkpoint,
+    )
+    for record in analyzer.run(args.source):
+        print(json.dumps(record), flush=True)
+        print(f"{record['status']}: {record['company']} ({record['elapsed']}s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+End-to-end benchmark of the finance crews against the local mock LLM
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+
+from main import FinanceCrew
+from mock_llm import MockChatModel
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SERVICES = {
+    "run_financial_analysis": "Microsoft Corporation",
+    "run_personal_finance_planning": (
+        "Age: 35, Income: $85,000, Savings: $30,000, Goals: Retirement planning and emergency fund"
+    ),
+    "run_investment_analysis": "Apple Inc. (AAPL) stock for long-term growth portfolio",
+}
+
+# Cold-start stages of a CLI invocation, each timed in a fresh interpreter
+STARTUP_STAGES = {
+    "menu": "import main; main.FinanceCrew()",
+    "first_crew": "import main; main.FinanceCrew().agents.warm()",
+}
+
+
+class LLMIntervals(BaseCallbackHandler):
+    """Record the wall-clock interval of every LLM call"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = {}
+        self.intervals = []
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        ended = time.perf_counter()
+        with self._lock:
+            started = self._started.pop(run_id, None)
+            if started is not None:
+                self.intervals.append((started, ended))
+
+    def between(self, start, end):
+        with self._lock:
+            return sorted((s, e) for s, e in self.intervals if s >= start and e <= end)
+
+
+def union_length(intervals):
+    """Total time covered by sorted, possibly overlapping intervals"""
+    total, current_start, current_end = 0.0, None, None
+    for start, end in intervals:
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class CrewBenchmark:
+    """Run each crew service N times and collect latency, throughput and phase timings.
+
+    Phases split each run into `setup` (agent checkout, task and crew
+    construction up to the first LLM call), `llm` (time inside the model) and
+    `framework` (everything else, i.e. CrewAI overhead). They are only
+    recorded at concurrency 1, where LLM calls can be attributed to a run.
+    """
+
+    def __init__(self, iterations=10, concurrency=1, warmup=1, latency=0.0,
+                 tokens_per_second=0.0, response_tokens=60, services=None):
+        self.iterations = iterations
+        self.concurrency = concurrency
+        self.warmup = warmup
+        self.services = services or list(SERVICES)
+        self.intervals = LLMIntervals()
+        llm = MockChatModel(
+            latency=latency,
+            tokens_per_second=tokens_per_second,
+            response_tokens=response_tokens,
+            callbacks=[self.intervals],
+        )
+        # Every iteration sends the same input, so coalescing would time shared results
+        # instead of crew runs
+        self.finance_crew = FinanceCrew(llm=llm, single_flight=False)
+
+    def run(self):
+        started = time.perf_counter()
+        self.finance_crew.agents.warm(self.concurrency)
+        report = {
+            "iterations": self.iterations,
+            "concurrency": self.concurrency,
+            "warm_pool_ms": (time.perf_counter() - started) * 1000,
+            "services": {},
+        }
+        for service in self.services:
+            report["services"][service] = self.run_service(service)
+        report["peak_rss_mb"] = peak_rss_mb()
+        return report
+
+    def run_service(self, service):
+        run = getattr(self.finance_crew, service)
+        argument = SERVICES[service]
+        for _ in range(self.warmup):
+            run(argument)
+
+        samples = []
+        crew_runs = self._crew_runs(service)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            samples = list(pool.map(lambda _: self._timed(run, argument), range(self.iterations)))
+        wall = time.perf_counter() - started
+        crew_runs = self._crew_runs(service) - crew_runs
+        if crew_runs != len(samples):
+            raise RuntimeError(
+                f"{service}: {len(samples)} iterations ran {crew_runs} crews; results were reused "
+                f"(result store, plan cache or coalescing), so the timings would not measure crew runs"
+            )
+
+        latencies = np.array([end - start for start, end in samples]) * 1000
+        stats = {
+            "runs": len(samples),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "mean_ms": float(latencies.mean()),
+            "throughput_per_s": len(samples) / wall,
+        }
+        if self.concurrency == 1:
+            stats["phases_ms"] = self._phases(samples)
+        return stats
+
+    def _crew_runs(self, service):
+        metrics = self.finance_crew.telemetry.metrics
+        return sum(
+            metrics.value("finance_crew_runs_total", service=service.removeprefix("run_"), status=status)
+            for status in ("ok", "error", "cancelled")
+        )
+
+    def _timed(self, run, argument):
+        start = time.perf_counter()
+        run(argument)
+        return start, time.perf_counter()
+
+    def _phases(self, samples):
+        totals = {"setup": 0.0, "llm": 0.0, "framework": 0.0}
+        for start, end in samples:
+            calls = self.intervals.between(start, end)
+            llm = union_length(calls)
+            totals["setup"] += (calls[0][0] - start) if calls else end - start
+            totals["llm"] += llm
+            totals["framework"] += (end - start) - llm
+        return {phase: total / len(samples) * 1000 for phase, total in totals.items()}
+
+
+def startup_times(statement, top=8):
+    """Run `statement` in a new interpreter and return its wall time and slowest top-level imports"""
+    env = dict(os.environ, FINANCE_LLM="mock", FINANCE_LOG_MODE="quiet")
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    wall = time.perf_counter() - started
+    if completed.returncode:
+        raise RuntimeError(f"{statement!r} failed:\n{completed.stderr[-2000:]}")
+    # Lines look like "import time:  self [us] |  cumulative | imported package",
+    # with nested imports indented under the module that imported them
+    modules = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name[1:].startswith(" "):
+            modules[name.strip()] = int(cumulative) / 1000
+    slowest = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {"wall_ms": wall * 1000, "imports_ms": sum(modules.values()), "slowest_imports_ms": dict(slowest)}
+
+
+def startup_report():
+    return {stage: startup_times(statement) for stage, statement in STARTUP_STAGES.items()}
+
+
+def format_startup(report):
+    lines = [f"{'Stage':<16}{'wall ms':>10}{'imports ms':>12}"]
+    for stage, times in report.items():
+        lines.append(f"{stage:<16}{times['wall_ms']:>10.1f}{times['imports_ms']:>12.1f}")
+        for module, ms in times["slowest_imports_ms"].items():
+            lines.append(f"  {module:<30}{ms:>10.1f} ms")
+    return "\n".join(lines)
+
+
+def format_report(report):
+    lines = [
+        f"Iterations: {report['iterations']}  Concurrency: {report['concurrency']}  "
+        f"Pool warm-up: {report['warm_pool_ms']:.1f} ms",
+        f"{'Service':<32}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'runs/s':>10}",
+    ]
+    for service, stats in report["services"].items():
+        lines.append(
+            f"{service:<32}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}"
+            f"{stats['p99_ms']:>10.1f}{stats['throughput_per_s']:>10.2f}"
+        )
+        if "phases_ms" in stats:
+            phases = ", ".join(f"{phase} {ms:.1f} ms" for phase, ms in stats["phases_ms"].items())
+            lines.append(f"  mean phases: {phases}")
+    if report["peak_rss_mb"] is not None:
+        lines.append(f"Peak RSS: {report['peak_rss_mb']:.1f} MB")
+    return "\n".join(lines)
+
+
+def main():
+    """Benchmark the crews offline and optionally fail when p95 latency regresses"""
+    parser = argparse.ArgumentParser(description="Finance crew benchmark with a mock LLM")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed runs per service")
+    parser.add_argument("--latency", type=float, default=0.0, help="Mock time to first token (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0,
+                        help="Mock streaming rate; 0 streams instantly")
+    parser.add_argument("--response-tokens", type=int, default=60)
+    parser.add_argument("--service", action="append", choices=list(SERVICES),
+                        help="Service to benchmark (repeatable, default: all)")
+    parser.add_argument("--json", dest="json_path", default=None, help="Write the report as JSON")
+    parser.add_argument("--max-p95-ms", type=float, default=None,
+                        help="Exit with status 1 when any service's p95 latency exceeds this")
+    parser.add_argument("--startup", action="store_true",
+                        help="Time cold starts and per-module imports instead of crew runs")
+    parser.add_argument("--max-startup-ms", type=float, default=None,
+                        help="With --startup, exit with status 1 when the menu takes longer than this")
+    args = parser.parse_args()
+    # Run logs would add console I/O to every timed run unless asked for
+    os.environ.setdefault("FINANCE_LOG_MODE", "quiet")
+
+    if args.startup:
+        report = startup_report()
+        print(format_startup(report))
+        if args.json_path:
+            with open(args.json_path, "w") as f:
+                json.dump(report, f, indent=2)
+        if args.max_startup_ms is not None and report["menu"]["wall_ms"] > args.max_startup_ms:
+            print(f"Startup above {args.max_startup_ms} ms: {report['menu']['wall_ms']:.0f} ms", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    report = CrewBenchmark(
+        iterations=args.iterations,
+        concurrency=args.concurrency,
+        warmup=args.warmup,
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+        services=args.service,
+    ).run()
+    print(format_report(report))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.max_p95_ms is not None:
+        slow = [s for s, stats in report["services"].items() if stats["p95_ms"] > args.max_p95_ms]
+        if slow:
+            print(f"p95 latency above {args.max_p95_ms} ms: {', '.join(slow)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+LangChain callback handlers attached to the shared agent LLM
+"""
+
+import re
+import sys
+import threading
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# CrewAI renders every agent prompt as "You are {role}. {backstory}..."
+ROLE_PATTERN = re.compile(r"You are (.+?)\.\s")
+
+
+class RoleAwareHandler(BaseCallbackHandler):
+    """Callback handler that knows which agent role issued each LLM run"""
+
+    @staticmethod
+    def role_from_prompt(prompt):
+        match = ROLE_PATTERN.search(prompt)
+        return match.group(1) if match else "Agent"
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        prompt = "\n".join(str(message.content) for message in messages[0])
+        self.on_agent_llm_start(run_id, self.role_from_prompt(prompt), prompt)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self.on_agent_llm_start(run_id, self.role_from_prompt(prompts[0]), prompts[0])
+
+    def on_agent_llm_start(self, run_id, role, prompt):
+        """Hook for subclasses, called once the run's role is known"""
+
+
+class _StreamedRun:
+    def __init__(self, role):
+        self.role = role
+        self.text = ""
+        self.printed = 0
+        self.done = False
+
+    @property
+    def answer(self):
+        index = self.text.find(StreamingPrinter.FINAL_ANSWER)
+        if index < 0:
+            return None
+        return self.text[index + len(StreamingPrinter.FINAL_ANSWER):].lstrip(" ")
+
+
+class StreamingPrinter(RoleAwareHandler):
+    """Print each agent's final answer token by token under a section header.
+
+    Only the text after "Final Answer:" is printed, so intermediate thoughts and
+    tool calls stay hidden. When tasks run concurrently, one answer streams
+    live while the others are buffered and printed as soon as it finishes.
+    """
+
+    FINAL_ANSWER = "Final Answer:"
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+        self._runs = {}
+        self._active = None
+        self._waiting = []
+        self._last_role = None
+
+    def on_agent_llm_start(self, run_id, role, prompt):
+        with self._lock:
+            self._runs[run_id] = _StreamedRun(role)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is not None:
+                run.text += token
+                self._emit(run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is None:
+                return
+            if not run.text and response.generations and response.generations[0]:
+                # Cached responses arrive whole, without token events
+                run.text = response.generations[0][0].text
+            run.done = True
+            self._emit(run_id)
+            if run_id not in (self._active, *self._waiting):
+                self._runs.pop(run_id, None)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            self._runs.pop(run_id, None)
+            if run_id in self._waiting:
+                self._waiting.remove(run_id)
+            if self._active == run_id:
+                self._active = None
+                self._promote()
+
+    def _emit(self, run_id):
+        run = self._runs[run_id]
+        if run.answer is None:
+            return
+        if self._active is None:
+            self._activate(run_id)
+        elif self._active != run_id:
+            if run_id not in self._waiting:
+                self._waiting.append(run_id)
+            return
+        self._write(run)
+        if run.done:
+            self._finish(run_id)
+            self._promote()
+
+    def _activate(self, run_id):
+        self._active = run_id
+        run = self._runs[run_id]
+        if run.role != self._last_role:
+            self.stream.write(f"\n{'-' * 50}\n{run.role}\n{'-' * 50}\n")
+            self._last_role = run.role
+
+    def _write(self, run):
+        answer = run.answer
+        self.stream.write(answer[run.printed:])
+        self.stream.flush()
+        run.printed = len(answer)
+
+    def _finish(self, run_id):
+        self.stream.write("\n")
+        self.stream.flush()
+        self._runs.pop(run_id, None)
+        self._active = None
+
+    def _promote(self):
+        while self._active is None and self._waiting:
+            run_id = self._waiting.pop(0)
+            self._activate(run_id)
+            run = self._runs[run_id]
+            self._write(run)
+            if run.done:
+                self._finish(run_id)
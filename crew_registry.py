@@ -0,0 +1,303 @@
+"""
+Crews, agents and tasks declared in crews.yaml, compiled once into prompt templates and task graphs
+"""
+
+import os
+import sys
+import threading
+from string import Formatter
+
+import yaml
+
+import schemas
+from prompt_budget import compact
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "crews.yaml")
+
+# Slots a task description and a crew's task input can use
+DESCRIPTION_SLOTS = {"subject"}
+INPUT_SLOTS = {"request"}
+
+# How a crew's result can be post-processed (see FinanceCrew.run)
+FINISH_HOOKS = {"reconcile"}
+
+# Separates the literal text and slot names of a compiled template
+_SLOT_MARK = "\x00"
+
+
+class CrewConfigError(ValueError):
+    """Raised when a crew definition is malformed or its task graph is invalid"""
+
+
+class Template:
+    """Prompt text compacted and split around its {slot}s once, so filling it is a join.
+
+    Names in `constants` are substituted at compile time; any other {name}
+    must be one of `slots` and is filled per request.
+    """
+
+    def __init__(self, text, constants=None, slots=()):
+        constants = constants or {}
+        marked = []
+        try:
+            parsed = list(Formatter().parse(str(text)))
+        except ValueError as e:
+            raise CrewConfigError(f"Malformed template {text!r}: {e}") from None
+        for literal, name, spec, conversion in parsed:
+            marked.append(literal)
+            if name is None:
+                continue
+            if spec or conversion:
+                raise CrewConfigError(f"Template slot {{{name}}} cannot have a format spec or conversion")
+            if name in constants:
+                marked.append(str(constants[name]))
+            elif name in slots:
+                marked.append(f"{_SLOT_MARK}{name}{_SLOT_MARK}")
+            else:
+                raise CrewConfigError(f"Unknown template slot {{{name}}}, expected one of: {', '.join(sorted(slots))}")
+        # Literal text and slot names alternate, starting and ending with text
+        self.parts = tuple(compact("".join(marked)).split(_SLOT_MARK))
+        self.slots = self.parts[1::2]
+
+    def fill(self, **values):
+        if not self.slots:
+            return self.parts[0]
+        parts = list(self.parts)
+        parts[1::2] = [str(values[name]) for name in self.slots]
+        return "".join(parts)
+
+    def __repr__(self):
+        return f"Template({''.join(self.parts)!r})"
+
+
+class AgentSpec:
+    def __init__(self, name, role, goal, backstory, tools=()):
+        self.name = name
+        self.role = role
+        self.goal = goal
+        self.backstory = compact(backstory)
+        self.tools = tuple(tools)
+
+
+class TaskSpec:
+    def __init__(self, name, description, expected_output, route=None, schema=None, fields=None):
+        self.name = name
+        # Tasks share a model route when they do the same kind of work
+        self.route = route or name
+        self.description = description
+        self.expected_output = expected_output
+        self.schema = schema
+        # Profile fields the task quotes, or None to quote the whole request
+        self.fields = fields
+
+
+class TaskNode:
+    def __init__(self, name, task, agent, input, context=(), async_execution=False):
+        self.name = name
+        self.task = task
+        self.agent = agent
+        self.input = input
+        self.context = tuple(context)
+        self.async_execution = async_execution
+
+
+class CrewGraph:
+    """One crew's tasks in run order, validated and analysed for parallelism.
+
+    `stages` groups the tasks by dependency depth: tasks in one stage read
+    nothing from each other and could run together, and the number of stages
+    is the length of the critical path. `warnings` lists tasks that run one
+    after the other although neither reads the other's output.
+    """
+
+    def __init__(self, service, nodes, plan_cache=False, finish=None):
+        self.service = service
+        self.nodes = tuple(nodes)
+        # Roles in the order their first task runs
+        self.agents = tuple(dict.fromkeys(node.agent for node in self.nodes))
+        self.plan_cache = plan_cache
+        self.finish = finish
+        self.stages, self.warnings = self._analyse()
+
+    @property
+    def critical_path(self):
+        return len(self.stages)
+
+    def _analyse(self):
+        depth, upstream = {}, {}
+        for node in self.nodes:
+            depth[node.name] = 1 + max((depth[name] for name in node.context), default=-1)
+            upstream[node.name] = set(node.context).union(*(upstream[name] for name in node.context))
+        stages = [[] for _ in range(max(depth.values(), default=-1) + 1)]
+        for node in self.nodes:
+            stages[depth[node.name]].append(node.name)
+
+        warnings = []
+        for node, following in zip(self.nodes, self.nodes[1:]):
+            # A sync task holds up the next one even when that one does not read it
+            if not node.async_execution and node.name not in upstream[following.name]:
+                warnings.append(
+                    f"{self.service}: {following.name} waits for {node.name} without reading its output; "
+                    f"mark {node.name} async to run them concurrently"
+                )
+        return tuple(tuple(stage) for stage in stages), warnings
+
+    def describe(self, label=None):
+        """Stages and warnings of the graph as text, one line each"""
+        lines = [f"{label or self.service}: {len(self.nodes)} tasks, critical path {self.critical_path}"]
+        for i, stage in enumerate(self.stages, 1):
+            lines.append(f"  stage {i}: {', '.join(stage)}")
+        lines.extend(f"  warning: {warning}" for warning in self.warnings)
+        return "\n".join(lines)
+
+
+class CrewRegistry:
+    """Agent specs, compiled task templates and validated crew graphs from one config.
+
+    Everything is parsed and checked when the registry is built, so a broken
+    reference, a task that depends on a later one or an async task nobody
+    waits for fails at startup rather than mid-request.
+    """
+
+    def __init__(self, config):
+        config = config or {}
+        self.constants = dict(config.get("constants") or {})
+        groups = config.get("profile_fields") or {}
+        self.profile_fields = {name: frozenset(fields) for name, fields in groups.items()}
+        # Fields some task claims; the rest are quoted to every task
+        self.known_fields = frozenset().union(*self.profile_fields.values())
+        self.agents = {
+            name: AgentSpec(name, **self._keys(spec, f"agent {name}", {"role", "goal", "backstory"}, {"tools"}))
+            for name, spec in (config.get("agents") or {}).items()
+        }
+        self.tasks = {name: self._compile_task(name, spec) for name, spec in (config.get("tasks") or {}).items()}
+        self.crews = {}
+        for service, spec in (config.get("crews") or {}).items():
+            spec = self._keys(spec, f"crew {service}", {"tasks"}, {"plan_cache", "variants"})
+            self.crews[service] = {None: self._compile_crew(service, spec)}
+            for variant, variant_spec in (spec.get("variants") or {}).items():
+                variant_spec = self._keys(variant_spec, f"crew {service} variant {variant}", {"tasks"}, {"finish"})
+                self.crews[service][variant] = self._compile_crew(
+                    service, {"plan_cache": spec.get("plan_cache", False), **variant_spec}
+                )
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(yaml.safe_load(f))
+
+    def services(self):
+        return list(self.crews)
+
+    def crew(self, service, variant=None):
+        """The task graph of `service`, in `variant` when the crew declares one"""
+        if service not in self.crews:
+            raise ValueError(f"Unknown service {service!r}, expected one of: {', '.join(self.crews)}")
+        variants = self.crews[service]
+        return variants.get(variant, variants[None])
+
+    def _keys(self, spec, where, required, optional=()):
+        if not isinstance(spec, dict):
+            raise CrewConfigError(f"{where} must be a mapping")
+        missing = required - spec.keys()
+        unknown = spec.keys() - required - set(optional)
+        if missing or unknown:
+            problems = [f"missing {', '.join(sorted(missing))}"] if missing else []
+            problems += [f"unknown {', '.join(sorted(unknown))}"] if unknown else []
+            raise CrewConfigError(f"{where}: {'; '.join(problems)}")
+        return spec
+
+    def _compile_task(self, name, spec):
+        spec = self._keys(spec, f"task {name}", {"description", "expected_output"}, {"route", "schema", "fields"})
+        expected_output = Template(spec["expected_output"], self.constants).fill()
+        schema = None
+        if spec.get("schema"):
+            schema = getattr(schemas, spec["schema"], None)
+            if not isinstance(schema, type) or not issubclass(schema, schemas.BaseModel):
+                raise CrewConfigError(f"task {name}: unknown schema {spec['schema']!r}")
+            expected_output += f". Answer with only a JSON object of this form: {schemas.describe(schema)}"
+        fields = spec.get("fields")
+        if fields is not None and fields not in self.profile_fields:
+            raise CrewConfigError(f"task {name}: unknown profile_fields group {fields!r}")
+        return TaskSpec(
+            name,
+            Template(spec["description"], self.constants, DESCRIPTION_SLOTS),
+            expected_output,
+            route=spec.get("route"),
+            schema=schema,
+            fields=self.profile_fields.get(fields),
+        )
+
+    def _compile_crew(self, service, spec):
+        nodes = {}
+        for i, node in enumerate(spec["tasks"] or []):
+            where = f"crew {service} task {i + 1}"
+            node = self._keys(node, where, {"task", "agent"}, {"name", "input", "context", "async"})
+            name = node.get("name", node["task"])
+            if node["task"] not in self.tasks:
+                raise CrewConfigError(f"{where}: unknown task {node['task']!r}")
+            if node["agent"] not in self.agents:
+                raise CrewConfigError(f"{where}: unknown agent {node['agent']!r}")
+            if name in nodes:
+                raise CrewConfigError(f"{where}: {name!r} is already a task of this crew; give it a distinct name")
+            for dependency in node.get("context") or ():
+                if dependency not in nodes:
+                    raise CrewConfigError(
+                        f"{where}: {name} reads {dependency!r}, which is not a task declared before it"
+                    )
+            nodes[name] = TaskNode(
+                name, node["task"], node["agent"],
+                Template(node.get("input", "{request}"), slots=INPUT_SLOTS),
+                node.get("context") or (), bool(node.get("async", False)),
+            )
+        if not nodes:
+            raise CrewConfigError(f"crew {service} has no tasks")
+
+        # CrewAI does not wait for async tasks at the end of a crew, so every one
+        # must be read by a later task, and the crew's result is its last task
+        read = {dependency for node in nodes.values() for dependency in node.context}
+        for node in nodes.values():
+            if node.async_execution and node.name not in read:
+                raise CrewConfigError(f"crew {service}: async task {node.name} is not read by any later task")
+
+        finish = spec.get("finish")
+        if finish is not None:
+            if not isinstance(finish, dict) or len(finish) != 1:
+                raise CrewConfigError(f"crew {service}: finish must be one {{hook: task}} pair")
+            ((hook, target),) = finish.items()
+            if hook not in FINISH_HOOKS:
+                raise CrewConfigError(f"crew {service}: unknown finish hook {hook!r}")
+            if target not in nodes:
+                raise CrewConfigError(f"crew {service}: finish hook {hook} names unknown task {target!r}")
+            finish = (hook, target)
+        return CrewGraph(service, nodes.values(), plan_cache=bool(spec.get("plan_cache")), finish=finish)
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def shared_registry():
+    """The process-wide registry compiled from FINANCE_CREWS_PATH (crews.yaml by default)"""
+    path = os.getenv("FINANCE_CREWS_PATH") or DEFAULT_PATH
+    with _registries_lock:
+        if path not in _registries:
+            _registries[path] = CrewRegistry.load(path)
+        return _registries[path]
+
+
+def main():
+    """Validate a crews file and print each crew's stages and warnings"""
+    path = sys.argv[1] if len(sys.argv) > 1 else os.getenv("FINANCE_CREWS_PATH") or DEFAULT_PATH
+    try:
+        registry = CrewRegistry.load(path)
+    except CrewConfigError as e:
+        print(f"{path}: {e}")
+        sys.exit(1)
+    for service, variants in registry.crews.items():
+        for variant, graph in variants.items():
+            print(graph.describe(service if variant is None else f"{service} ({variant})"))
+
+
+if __name__ == "__main__":
+    main()
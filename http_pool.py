@@ -0,0 +1,184 @@
+"""
+Process-wide HTTP connection pool for LLM clients, with retry/backoff and a circuit breaker
+"""
+
+import email.utils
+import os
+import random
+import threading
+import time
+
+import httpx
+
+# Rate limited or overloaded: worth another attempt after a pause
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Failures before the request reached the model, so a retry cannot run it twice
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Raised without calling the API while its circuit is open"""
+
+
+def retry_after(headers):
+    """Seconds the server asked us to wait (retry-after-ms or Retry-After), or None"""
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """Fail fast after `threshold` consecutive failures until `cooldown` has passed.
+
+    After the cooldown a single request is let through; its success closes
+    the circuit and its failure opens it again.
+    """
+
+    def __init__(self, threshold=5, cooldown=30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.open_until = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() >= self.open_until:
+                self.state = "half_open"
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def failure(self, wait=None):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.threshold:
+                self.state = "open"
+                self.open_until = time.monotonic() + max(self.cooldown, wait or 0.0)
+
+
+class RetryTransport(httpx.BaseTransport):
+    """Retry 429/5xx responses and connection failures with jittered exponential backoff.
+
+    A Retry-After header sets the wait (plus jitter) when it is at most
+    `max_backoff`; longer waits return the response so the caller can fall
+    back instead of blocking. Every host has a CircuitBreaker shared by all
+    requests in the process, so an unhealthy API gets no retry storms.
+    """
+
+    def __init__(self, transport=None, max_retries=3, backoff=0.5, max_backoff=30.0,
+                 breaker_threshold=5, breaker_cooldown=30.0, sleep=time.sleep):
+        self.transport = transport or httpx.HTTPTransport()
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.sleep = sleep
+        self.retries = 0
+        self.rejected = 0
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, host):
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_cooldown)
+            return self._breakers[host]
+
+    def delay(self, attempt, wait=None):
+        if wait is not None:
+            return wait + random.uniform(0, self.backoff)
+        # Full jitter keeps concurrent clients from retrying in lockstep
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def handle_request(self, request):
+        breaker = self.breaker(request.url.host)
+        for attempt in range(self.max_retries + 1):
+            if not breaker.allow():
+                self.rejected += 1
+                raise CircuitOpenError(f"Circuit open for {request.url.host}", request=request)
+            try:
+                response = self.transport.handle_request(request)
+            except RETRY_ERRORS:
+                breaker.failure()
+                if attempt == self.max_retries:
+                    raise
+                wait = None
+            except httpx.TransportError:
+                # Read timeouts and dropped streams may leave the request running
+                # server-side, so a retry could pay for it twice
+                breaker.failure()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    breaker.success()
+                    return response
+                wait = retry_after(response.headers)
+                breaker.failure(wait)
+                if attempt == self.max_retries or (wait is not None and wait > self.max_backoff):
+                    return response
+                response.close()
+            self.retries += 1
+            self.sleep(self.delay(attempt, wait))
+
+    def stats(self):
+        with self._lock:
+            circuits = {host: breaker.state for host, breaker in self._breakers.items()}
+        return {"retries": self.retries, "rejected": self.rejected, "circuits": circuits}
+
+    def close(self):
+        self.transport.close()
+
+
+def build_client(max_connections=100, max_keepalive=20, keepalive_expiry=60.0, **retry):
+    """Return an httpx.Client with a bounded keep-alive pool behind a RetryTransport"""
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive,
+        keepalive_expiry=keepalive_expiry,
+    )
+    return httpx.Client(transport=RetryTransport(httpx.HTTPTransport(limits=limits), **retry))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def shared_client():
+    """Return the process-wide client, built from FINANCE_HTTP_* settings on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = build_client(
+                max_connections=int(os.getenv("FINANCE_HTTP_MAX_CONNECTIONS", 100)),
+                max_keepalive=int(os.getenv("FINANCE_HTTP_MAX_KEEPALIVE", 20)),
+                keepalive_expiry=float(os.getenv("FINANCE_HTTP_KEEPALIVE_EXPIRY", 60.0)),
+                max_retries=int(os.getenv("FINANCE_HTTP_MAX_RETRIES", 3)),
+                backoff=float(os.getenv("FINANCE_HTTP_BACKOFF", 0.5)),
+                max_backoff=float(os.getenv("FINANCE_HTTP_MAX_BACKOFF", 30.0)),
+                breaker_threshold=int(os.getenv("FINANCE_HTTP_BREAKER_THRESHOLD", 5)),
+                breaker_cooldown=float(os.getenv("FINANCE_HTTP_BREAKER_COOLDOWN", 30.0)),
+            )
+        return _client
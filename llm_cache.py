@@ -0,0 +1,198 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Union
+
+from langchain_core.caches import BaseCache
+from langchain_core.callbacks import CallbackManager
+from langchain_core.load import dumpd, dumps, loads
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, LLMResult
+from langchain_core.pydantic_v1 import Field
+from langchain_openai import ChatOpenAI
+
+
+class ResponseCache(BaseCache):
+    """Persistent SQLite cache for LLM responses with TTL and LRU eviction.
+
+    Entries are keyed by a hash of the llm string (model, temperature and the
+    other invocation parameters) and the rendered prompt, which carries the
+    agent role, backstory and task description.
+    """
+
+    def __init__(self, path, ttl=24 * 60 * 60, max_entries=10000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)"
+        )
+        self._conn.commit()
+
+    @classmethod
+    def from_env(cls):
+        """Build a cache from FINANCE_CACHE_* settings, or None if disabled"""
+        path = os.getenv("FINANCE_CACHE_PATH")
+        if not path:
+            return None
+        return cls(
+            path,
+            ttl=float(os.getenv("FINANCE_CACHE_TTL", 24 * 60 * 60)),
+            max_entries=int(os.getenv("FINANCE_CACHE_MAX_ENTRIES", 10000)),
+        )
+
+    @staticmethod
+    def key(prompt, llm_string):
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt, llm_string):
+        key = self.key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                if row is not None:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+        return loads(row[0])
+
+    def update(self, prompt, llm_string, return_val):
+        key = self.key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, dumps(list(return_val)), now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def purge_expired(self):
+        """Drop every entry older than the TTL"""
+        if not self.ttl:
+            return 0
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def stats(self):
+        """Return hit/miss counters and the current number of entries"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+        }
+
+    def _evict(self):
+        if not self.max_entries:
+            return
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                (excess,),
+            )
+            self.evictions += excess
+
+
+class CachedStreamMixin:
+    """Serve streamed chat completions from the model's cache.
+
+    CrewAI agents call ``stream()`` on their LLM, and LangChain only consults
+    ``cache`` on the non-streaming path, so this mixin does the lookup and
+    write-back around ``stream()`` as well.
+    """
+
+    def stream(self, input, config=None, *, stop=None, **kwargs):
+        if not isinstance(self.cache, BaseCache):
+            yield from super().stream(input, config=config, stop=stop, **kwargs)
+            return
+
+        messages = self._convert_input(input).to_messages()
+        prompt = dumps(messages)
+        llm_string = self._get_llm_string(stop=stop, **kwargs)
+
+        cached = self.cache.lookup(prompt, llm_string)
+        if cached:
+            yield self._replay(cached[0], messages, config, stop, **kwargs)
+            return
+
+        generation = None
+        for chunk in super().stream(input, config=config, stop=stop, **kwargs):
+            generation = chunk if generation is None else generation + chunk
+            yield chunk
+        if generation is not None:
+            message = AIMessage(content=generation.content)
+            self.cache.update(prompt, llm_string, [ChatGeneration(message=message)])
+
+    def _replay(self, cached, messages, config, stop, **kwargs):
+        config = config or {}
+        callback_manager = CallbackManager.configure(
+            config.get("callbacks"),
+            self.callbacks,
+            self.verbose,
+            config.get("tags"),
+            self.tags,
+            config.get("metadata"),
+            self.metadata,
+        )
+        (run_manager,) = callback_manager.on_chat_model_start(
+            dumpd(self),
+            [messages],
+            invocation_params=self._get_invocation_params(stop=stop, **kwargs),
+            options={"stop": stop, **kwargs},
+            batch_size=1,
+        )
+        run_manager.on_llm_end(
+            LLMResult(generations=[[cached]], llm_output={"cache_hit": True})
+        )
+        return AIMessageChunk(content=cached.message.content)
+
+
+class CachedChatOpenAI(CachedStreamMixin, ChatOpenAI):
+    """ChatOpenAI whose streamed responses are served from ``cache``"""
+
+    # Transport settings do not change responses, so they stay out of cache keys
+    http_client: Union[Any, None] = Field(default=None, exclude=True)
+    max_retries: int = Field(default=2, exclude=True)
@@ -1,119 +1,359 @@
+import asyncio
+import contextvars
 import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from dotenv import load_dotenv
-from crewai import Crew, Process
-from agents import FinanceAgents
-from tasks import FinanceTasks
+
+from result_store import subject_key
+from single_flight import SingleFlight, SingleFlightTimeout
+
+# CrewAI, LangChain and the modules built on them are imported on first use
+# (see FinanceCrew._setup), so the CLI menu appears without waiting for them
 
 # Load environment variables
 load_dotenv()
 
+# Limits for the crew run in the current async request, see FinanceCrew._arun
+_run_limits = contextvars.ContextVar("run_limits", default=None)
+
+
+class CrewCancelled(Exception):
+    """Raised inside a crew run after its async caller cancelled or timed out"""
+
+
+class RunLimits:
+    """Cancellation flag and per-task time limit for one crew run"""
+    
+    def __init__(self, task_timeout=None):
+        self.task_timeout = task_timeout
+        self.cancelled = threading.Event()
+    
+    def check(self, step_output):
+        """Crew step callback that aborts the run once it has been cancelled"""
+        if self.cancelled.is_set():
+            raise CrewCancelled("Crew run was cancelled")
+
 
 class FinanceCrew:
-    def __init__(self):
-        self.agents = FinanceAgents()
-        self.tasks = FinanceTasks()
+    # Built by _setup on first access, so creating a FinanceCrew imports no
+    # framework and builds no LLM client until a crew actually runs
+    LAZY = frozenset({"token_usage", "telemetry", "budget", "agents", "task_memo", "tasks", "plan_cache", "results", "registry"})
     
-    def run_financial_analysis(self, company_name):
-        """Run a complete financial analysis for a company"""
-        
-        # Initialize agents
-        financial_analyst = self.agents.financial_analyst_agent()
-        risk_analyst = self.agents.risk_assessment_agent()
-        budget_planner = self.agents.budget_planner_agent()
-        investment_advisor = self.agents.investment_advisor_agent()
-        
-        # Create tasks
-        analysis_task = self.tasks.financial_analysis_task(
-            agent=financial_analyst,
-            company_or_data=company_name
+    def __init__(self, stream=False, llm=None, plan_cache=None, task_memo=None, router=None,
+                 speculative_review=None, result_store=None, result_max_age=None, registry=None,
+                 single_flight=None, single_flight_timeout=None):
+        # Streaming prints each agent's answer as it is generated
+        self.stream = stream
+        # Personal planning drafts its review while the investment task runs when
+        # FINANCE_SPECULATIVE_REVIEW=1 (see the speculative variant in crews.yaml)
+        self.speculative_review = (
+            os.getenv("FINANCE_SPECULATIVE_REVIEW") == "1" if speculative_review is None else speculative_review
         )
-        
-        risk_task = self.tasks.risk_assessment_task(
-            agent=risk_analyst,
-            investment_or_portfolio=f"{company_name} stock investment"
+        # Requests repeated within this many seconds are answered from the result store
+        self.result_max_age = (
+            float(os.getenv("FINANCE_RESULT_MAX_AGE", 0)) if result_max_age is None else result_max_age
         )
+        # Concurrent identical requests share one crew run (see run). FINANCE_SINGLE_FLIGHT=0
+        # turns this off; FINANCE_SINGLE_FLIGHT_TIMEOUT caps the seconds a caller waits for it
+        if single_flight is None:
+            single_flight = os.getenv("FINANCE_SINGLE_FLIGHT", "1") != "0"
+        if single_flight_timeout is None:
+            single_flight_timeout = float(os.getenv("FINANCE_SINGLE_FLIGHT_TIMEOUT", 0)) or None
+        # A run cancelled by its own caller is started again by the callers sharing it
+        self.flights = SingleFlight(single_flight_timeout, retry_on=(CrewCancelled,)) if single_flight else None
+        self.max_workers = int(os.getenv("FINANCE_ASYNC_WORKERS", 32))
+        self._executor = None
+        self._options = (llm, plan_cache, task_memo, router, result_store, registry)
+        self._setup_lock = threading.Lock()
+    
+    def __getattr__(self, name):
+        # Only reached for attributes that are not set yet
+        if name not in FinanceCrew.LAZY:
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+        self._setup()
+        return self.__dict__[name]
+    
+    def _setup(self):
+        from agents import FinanceAgents
+        from callbacks import StreamingPrinter
+        from crew_registry import shared_registry
+        from prompt_budget import PromptBudget, TokenUsageTracker
+        from result_store import ResultStore
+        from semantic_cache import SemanticPlanCache
+        from task_memo import TaskMemo
+        from tasks import FinanceTasks
+        from telemetry import Telemetry
         
-        # Create and run crew
-        crew = Crew(
-            agents=[financial_analyst, risk_analyst],
-            tasks=[analysis_task, risk_task],
-            verbose=2,
-            process=Process.sequential
+        with self._setup_lock:
+            if "agents" in self.__dict__:
+                return
+            llm, plan_cache, task_memo, router, result_store, registry = self._options
+            # Crews, agents and task templates from FINANCE_CREWS_PATH (crews.yaml by default)
+            registry = registry or shared_registry()
+            token_usage = TokenUsageTracker()
+            # Spans go to FINANCE_TRACE_PATH, metrics to FINANCE_METRICS_PORT and run
+            # logs to FINANCE_LOG_PATH (stderr by default) in FINANCE_LOG_MODE
+            telemetry = Telemetry.from_env()
+            callbacks = [token_usage, telemetry.handler] + ([StreamingPrinter()] if self.stream else [])
+            agents = FinanceAgents(callbacks=callbacks, llm=llm, router=router, registry=registry)
+            # Tasks whose input is unchanged reuse their stored output when
+            # FINANCE_TASK_MEMO_PATH is set; pass task_memo=False to bypass it
+            task_memo = TaskMemo.from_env() if task_memo is None else task_memo
+            built = {
+                "token_usage": token_usage,
+                "telemetry": telemetry,
+                # Upstream outputs are trimmed to this budget before downstream tasks read them
+                "budget": PromptBudget(),
+                "task_memo": task_memo,
+                "tasks": FinanceTasks(memo=task_memo or None, router=agents.router or None, registry=registry),
+                # Opt-in reuse of plans for near-duplicate client profiles when
+                # FINANCE_SEMANTIC_CACHE_PATH is set; pass plan_cache=False to bypass it
+                "plan_cache": SemanticPlanCache.from_env() if plan_cache is None else plan_cache,
+                # Every result is saved with its task outputs and usage when
+                # FINANCE_RESULT_STORE_PATH is set; pass result_store=False to bypass it
+                "results": ResultStore.from_env() if result_store is None else result_store,
+                "agents": agents,
+                "registry": registry,
+            }
+            # Attributes assigned before setup (e.g. plan_cache = None) are kept
+            for name, value in built.items():
+                self.__dict__.setdefault(name, value)
+    
+    def _crew(self, agents, tasks):
+        from crewai import Crew, Process
+        return Crew(
+            agents=agents,
+            tasks=tasks,
+            process=Process.sequential,
+            task_callback=self.budget.task_callback
         )
+    
+    def run(self, service, request, client_id=None, wait_timeout=None):
+        """Run the crew crews.yaml declares for `service` on one request.
         
-        result = crew.kickoff()
+        Calls for the same service, client and request (ignoring case and
+        spacing) that arrive while one is running wait for it and return its
+        result, for at most `wait_timeout` seconds (default
+        FINANCE_SINGLE_FLIGHT_TIMEOUT) before raising SingleFlightTimeout.
+        """
+        if not self.flights:
+            return self._run_crew(service, request, client_id)
+        limits = _run_limits.get()
+        try:
+            result, shared = self.flights.do(
+                (service, subject_key(request), client_id), self._run_crew, service, request, client_id,
+                timeout=wait_timeout,
+                # Async callers that time out or are cancelled stop waiting too
+                check=None if limits is None else partial(limits.check, None)
+            )
+        except SingleFlightTimeout:
+            self._count_flight(service, "timeout")
+            raise
+        self._count_flight(service, "shared" if shared else "leader")
         return result
     
-    def run_personal_finance_planning(self, client_profile):
-        """Run personal financial planning for an individual"""
-        
-        # Initialize agents
-        budget_planner = self.agents.budget_planner_agent()
-        risk_analyst = self.agents.risk_assessment_agent()
-        investment_advisor = self.agents.investment_advisor_agent()
-        financial_analyst = self.agents.financial_analyst_agent()
-        
-        # Create tasks
-        budget_task = self.tasks.budget_planning_task(
-            agent=budget_planner,
-            financial_situation=client_profile
+    def _count_flight(self, service, outcome):
+        self.telemetry.metrics.inc(
+            "finance_single_flight_total", {"service": service, "outcome": outcome},
+            help="Requests that ran a crew, shared an identical in-flight run or timed out waiting for one"
         )
+    
+    def _run_crew(self, service, request, client_id=None):
+        stored = self._stored(service, request, client_id)
+        if stored is not None:
+            return stored
         
-        investment_task = self.tasks.investment_advisory_task(
-            agent=investment_advisor,
-            investor_profile=client_profile
-        )
+        # The speculative variant of a crew, when it has one, drafts its result early
+        graph = self.registry.crew(service, "speculative" if self.speculative_review else None)
         
-        comprehensive_review = self.tasks.comprehensive_financial_review_task(
-            agent=financial_analyst,
-            client_data=client_profile
-        )
+        if graph.plan_cache and self.plan_cache:
+            plan = self.plan_cache.lookup(request)
+            self.telemetry.metrics.inc(
+                "finance_plan_cache_total", {"outcome": "miss" if plan is None else "hit"},
+                help="Personal finance plans served from the semantic plan cache"
+            )
+            if plan is not None:
+                return plan
         
-        # Create and run crew
-        crew = Crew(
-            agents=[budget_planner, investment_advisor, financial_analyst],
-            tasks=[budget_task, investment_task, comprehensive_review],
-            verbose=2,
-            process=Process.sequential
-        )
-        
-        result = crew.kickoff()
+        # Borrow pooled agents for the duration of this request
+        with self.agents.checkout(*graph.agents) as agents:
+            agents = dict(zip(graph.agents, agents))
+            
+            # Create tasks; each reads the output of the earlier tasks in its context
+            tasks = {}
+            for node in graph.nodes:
+                tasks[node.name] = self.tasks.build(
+                    node.task,
+                    agents[node.agent],
+                    node.input.fill(request=request),
+                    context=[tasks[name] for name in node.context] or None,
+                    async_execution=node.async_execution
+                )
+            
+            # Create and run crew
+            crew = self._crew(agents=list(agents.values()), tasks=list(tasks.values()))
+            
+            finish = None
+            if graph.finish is not None:
+                hook, target = graph.finish
+                finish = partial(getattr(self, f"_{hook}"), tasks[target])
+            result = self._kickoff(crew, service, request, client_id, finish=finish)
+        if graph.plan_cache and self.plan_cache:
+            self.plan_cache.store(request, result)
         return result
     
+    def run_financial_analysis(self, company_name):
+        """Run a complete financial analysis for a company"""
+        return self.run("financial_analysis", company_name)
+    
+    def run_personal_finance_planning(self, client_profile, client_id=None):
+        """Run personal financial planning for an individual"""
+        return self.run("personal_finance_planning", client_profile, client_id)
+    
     def run_investment_analysis(self, investment_details):
         """Run comprehensive investment analysis"""
-        
-        # Initialize all agents
-        financial_analyst = self.agents.financial_analyst_agent()
-        risk_analyst = self.agents.risk_assessment_agent()
-        investment_advisor = self.agents.investment_advisor_agent()
-        
-        # Create tasks
-        analysis_task = self.tasks.financial_analysis_task(
-            agent=financial_analyst,
-            company_or_data=investment_details
-        )
-        
-        risk_task = self.tasks.risk_assessment_task(
-            agent=risk_analyst,
-            investment_or_portfolio=investment_details
+        return self.run("investment_analysis", investment_details)
+    
+    def _reconcile(self, draft, result):
+        """Return the draft review when its reconciliation approved it, else the corrected review"""
+        verdict = re.escape(self.registry.constants["approved"])
+        approved = re.fullmatch(rf"\W*{verdict}\W*", str(result), re.IGNORECASE) is not None
+        self.telemetry.metrics.inc(
+            "finance_speculative_review_total", {"outcome": "kept" if approved else "replaced"},
+            help="Speculative review drafts kept or replaced after reconciliation"
         )
+        return draft.output.exported_output if approved else result
+    
+    def full_trace(self):
+        """Log every agent step and LLM call of the requests run inside this block"""
+        return self.telemetry.log.full_trace()
+    
+    async def arun(self, service, request, timeout=None, task_timeout=None):
+        """Async variant of run"""
+        return await self._arun(partial(self.run, service), request, timeout, task_timeout)
+    
+    async def arun_financial_analysis(self, company_name, timeout=None, task_timeout=None):
+        """Async variant of run_financial_analysis"""
+        return await self._arun(self.run_financial_analysis, company_name, timeout, task_timeout)
+    
+    async def arun_personal_finance_planning(self, client_profile, timeout=None, task_timeout=None):
+        """Async variant of run_personal_finance_planning"""
+        return await self._arun(self.run_personal_finance_planning, client_profile, timeout, task_timeout)
+    
+    async def arun_investment_analysis(self, investment_details, timeout=None, task_timeout=None):
+        """Async variant of run_investment_analysis"""
+        return await self._arun(self.run_investment_analysis, investment_details, timeout, task_timeout)
+    
+    async def _arun(self, run, argument, timeout, task_timeout):
+        # CrewAI agents execute synchronously, so crews run on a bounded thread
+        # pool shared by every request on the event loop
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="finance-crew"
+            )
+        limits = RunLimits(task_timeout)
+        token = _run_limits.set(limits)
+        context = contextvars.copy_context()
+        _run_limits.reset(token)
         
-        advisory_task = self.tasks.investment_advisory_task(
-            agent=investment_advisor,
-            investor_profile=f"Analysis for {investment_details}"
+        future = asyncio.get_running_loop().run_in_executor(self._executor, context.run, run, argument)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except BaseException:
+            # Cancelled or timed out: the worker thread stops at its next agent step
+            limits.cancelled.set()
+            raise
+    
+    def _kickoff(self, crew, service, inputs, client_id=None, finish=None):
+        """Run a crew and return its result, passed through `finish` and saved to the result store"""
+        limits = _run_limits.get()
+        crew.step_callback = self._step_callback(limits)
+        if limits is not None:
+            for agent in crew.agents:
+                agent.max_execution_time = limits.task_timeout
+        started = time.perf_counter()
+        with self.telemetry.crew_span(service, crew) as run:
+            result = crew.kickoff()
+        duration = time.perf_counter() - started
+        # A final task with an output schema returns a model; callers get its JSON
+        if hasattr(result, "model_dump_json"):
+            result = result.model_dump_json(indent=2)
+        if finish is not None:
+            result = finish(result)
+        if self.results:
+            self._save(service, inputs, client_id, crew, run, duration, result)
+        return result
+    
+    def _stored(self, service, inputs, client_id=None):
+        """The stored result of the same request if it is newer than result_max_age, else None"""
+        if not self.results or not self.result_max_age:
+            return None
+        record = self.results.latest(service, inputs, client_id=client_id, max_age=self.result_max_age)
+        self.telemetry.metrics.inc(
+            "finance_result_store_total", {"service": service, "outcome": "miss" if record is None else "hit"},
+            help="Requests answered from the result store"
         )
-        
-        # Create and run crew
-        crew = Crew(
-            agents=[financial_analyst, risk_analyst, investment_advisor],
-            tasks=[analysis_task, risk_task, advisory_task],
-            verbose=2,
-            process=Process.sequential
+        return record["result"] if record is not None else None
+    
+    def _save(self, service, inputs, client_id, crew, run, duration, result):
+        tasks = []
+        for task in crew.tasks:
+            trace = task._task_trace
+            tasks.append({
+                "name": task._route,
+                "role": task.agent.role,
+                "model": self._model_name(task),
+                "output": task.output.raw_output if task.output is not None else None,
+                "status": trace.status if trace else None,
+                "duration_s": round(trace.duration, 4) if trace else None,
+                **(trace.fields() if trace else {}),
+            })
+        self.results.save(
+            service, inputs, result, tasks=tasks,
+            model=",".join(dict.fromkeys(task["model"] for task in tasks)),
+            duration_s=round(duration, 4), usage=run.fields(), run_id=run.run_id, client_id=client_id,
         )
-        
-        result = crew.kickoff()
-        return result
+    
+    def _model_name(self, task):
+        """The model a task ran on: its route's first choice, else its agent's model"""
+        router = self.agents.router
+        route = router.route_for(task._route, task.agent.role) if router else None
+        if route is not None:
+            return router.rank(route)[0]
+        llm = task.agent.llm
+        return getattr(llm, "model_name", None) or type(llm).__name__
+    
+    def _step_callback(self, limits):
+        def step_callback(step_output):
+            self.telemetry.step_callback(step_output)
+            if limits is not None:
+                limits.check(step_output)
+        return step_callback
+
+def print_result(title, run, finance_crew):
+    """Run a crew and print its result and token usage under a title banner"""
+    finance_crew.token_usage.reset()
+    # In streaming mode the banner comes first and the answers print as they arrive
+    result = None if finance_crew.stream else run()
+    print("\n" + "="*50)
+    print(title)
+    print("="*50)
+    if finance_crew.stream:
+        result = run()
+        # Results reused from the result store, plan cache or an identical run in
+        # flight made no LLM calls here, so nothing was streamed
+        if not any(entry["calls"] for entry in finance_crew.token_usage.report().values()):
+            print(result)
+    else:
+        print(result)
+    print("\nToken usage:")
+    print(finance_crew.token_usage.format_report())
+    return result
 
 def main():
     """Main function to demonstrate the finance crew capabilities"""
@@ -121,7 +361,8 @@ def main():
     print("🏦 Welcome to the Finance Crew AI System!")
     print("=" * 50)
     
-    finance_crew = FinanceCrew()
+    stream = "--stream" in sys.argv[1:] or os.getenv("FINANCE_STREAM") == "1"
+    finance_crew = FinanceCrew(stream=stream)
     
     while True:
         print("\nAvailable Services:")
@@ -137,11 +378,11 @@ def main():
             if company:
                 print(f"\n🔍 Running financial analysis for {company}...")
                 try:
-                    result = finance_crew.run_financial_analysis(company)
-                    print("\n" + "="*50)
-                    print("FINANCIAL ANALYSIS RESULTS")
-                    print("="*50)
-                    print(result)
+                    print_result(
+                        "FINANCIAL ANALYSIS RESULTS",
+                        lambda: finance_crew.run_financial_analysis(company),
+                        finance_crew
+                    )
                 except Exception as e:
                     print(f"Error: {e}")
             else:
@@ -159,11 +400,11 @@ def main():
             
             print(f"\n💰 Creating personal financial plan...")
             try:
-                result = finance_crew.run_personal_finance_planning(client_profile)
-                print("\n" + "="*50)
-                print("PERSONAL FINANCIAL PLAN")
-                print("="*50)
-                print(result)
+                print_result(
+                    "PERSONAL FINANCIAL PLAN",
+                    lambda: finance_crew.run_personal_finance_planning(client_profile),
+                    finance_crew
+                )
             except Exception as e:
                 print(f"Error: {e}")
         
@@ -172,12 +413,11 @@ def main():
             if investment:
                 print(f"\n📊 Analyzing investment: {investment}...")
                 try:
-                    result = finance_crew.run_investment_analysis(investment)
-                    print("\n" + "="*50)
-                    print("INVESTMENT A
-                    1NALYSIS RESULTS")
-                    print("="*50)
-                    print(result)
+                    print_result(
+                        "INVESTMENT ANALYSIS RESULTS",
+                        lambda: finance_crew.run_investment_analysis(investment),
+                        finance_crew
+                    )
                 except Exception as e:
                     print(f"Error: {e}")
             else:
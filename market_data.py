@@ -0,0 +1,216 @@
+"""
+Columnar, memory-mapped store of daily prices and company fundamentals
+"""
+
+import argparse
+import csv
+import json
+import os
+import shutil
+from collections.abc import Mapping
+
+import numpy as np
+
+PRICE_COLUMNS = ("open", "high", "low", "close", "volume")
+FUNDAMENTAL_COLUMNS = (
+    "revenue", "net_income", "operating_cash_flow", "total_assets", "total_equity",
+    "total_debt", "current_assets", "current_liabilities", "shares_outstanding",
+)
+TABLES = {"prices": PRICE_COLUMNS, "fundamentals": FUNDAMENTAL_COLUMNS}
+STORE_VERSION = 1
+
+
+def read_rows(path, numeric=()):
+    """Return {column: values} from a CSV or Parquet file"""
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Reading Parquet files requires pyarrow (pip install pyarrow)") from e
+        table = pq.read_table(path)
+        return {name.lower(): table.column(name).to_numpy() for name in table.column_names}
+
+    with open(path, newline="") as f:
+        header = [name.strip().lower() for name in next(csv.reader(f), [])]
+    numbers = [i for i, name in enumerate(header) if name in numeric]
+    others = [i for i, name in enumerate(header) if name not in numeric]
+    try:
+        # NumPy's C parser is several times faster than the csv module, but
+        # only handles well-formed files: one pass for numbers, one for text
+        rows = {}
+        for usecols, dtype in ((numbers, np.float64), (others, str)):
+            if usecols:
+                values = np.loadtxt(path, delimiter=",", skiprows=1, usecols=usecols,
+                                    dtype=dtype, quotechar='"', ndmin=2, encoding="utf-8")
+                rows.update((header[i], values[:, j]) for j, i in enumerate(usecols))
+        return rows
+    except ValueError:
+        pass
+    # Blanks, thousands separators or currency symbols need the slow path
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        columns = [[] for _ in header]
+        appends = [column.append for column in columns]
+        for row in reader:
+            for append, value in zip(appends, row):
+                append(value)
+    return dict(zip(header, columns))
+
+
+def _columnar(rows, columns):
+    """Sort rows by (ticker, date) and return column arrays plus ticker offsets"""
+    # Normalise each distinct ticker once rather than every row
+    raw, inverse = np.unique(np.asarray(rows["ticker"]).astype(str), return_inverse=True)
+    names, codes = np.unique([name.strip().upper() for name in raw], return_inverse=True)
+    tickers = codes[inverse]
+    dates = np.asarray(rows["date"])
+    if dates.dtype.kind != "M":
+        # Keep the date part of timestamps such as "2024-01-31 00:00:00"
+        dates = dates.astype(str).astype("U10")
+    dates = dates.astype("datetime64[D]")
+    order = np.lexsort((dates, tickers))
+    tickers, dates = tickers[order], dates[order]
+    arrays = {"date": dates}
+    for name in columns:
+        if name in rows:
+            arrays[name] = _numbers(rows[name])[order]
+    starts = np.searchsorted(tickers, np.arange(len(names)))
+    ends = np.append(starts[1:], len(tickers))
+    index = {str(name): [int(start), int(end)] for name, start, end in zip(names, starts, ends)}
+    return arrays, index
+
+
+def _numbers(values):
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        # Blanks, thousands separators or currency symbols need a slow pass
+        return np.array([_number(value) for value in values], dtype=np.float64)
+
+
+def _number(value):
+    if value is None or value == "":
+        return np.nan
+    return float(str(value).replace(",", "").replace("$", ""))
+
+
+def ingest(root, prices=None, fundamentals=None):
+    """Build a store at `root` from long-format CSV/Parquet files.
+
+    Prices need date, ticker and close (open, high, low and volume are
+    optional). Fundamentals need date (the period end), ticker and any of
+    FUNDAMENTAL_COLUMNS. The store is written next to `root` and swapped in
+    at the end, so readers never see a half-written store.
+    """
+    staging = f"{root}.staging"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    index = {"version": STORE_VERSION}
+    for table, path in (("prices", prices), ("fundamentals", fundamentals)):
+        if not path:
+            continue
+        arrays, index[table] = _columnar(read_rows(path, TABLES[table]), TABLES[table])
+        os.makedirs(os.path.join(staging, table))
+        for name, values in arrays.items():
+            np.save(os.path.join(staging, table, f"{name}.npy"), values)
+    with open(os.path.join(staging, "index.json"), "w") as f:
+        json.dump(index, f)
+
+    previous = f"{root}.previous"
+    shutil.rmtree(previous, ignore_errors=True)
+    if os.path.exists(root):
+        os.replace(root, previous)
+    os.replace(staging, root)
+    shutil.rmtree(previous, ignore_errors=True)
+    return MarketDataStore(root)
+
+
+class MarketDataStore:
+    """Read-only view of an ingested store.
+
+    Columns are memory-mapped .npy files sorted by ticker then date, so a
+    query is two binary searches and returns zero-copy slices.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        with open(os.path.join(root, "index.json")) as f:
+            self.index = json.load(f)
+        self._columns = {}
+
+    def tickers(self, table="prices"):
+        return sorted(self.index.get(table, {}))
+
+    def column(self, table, name):
+        key = (table, name)
+        if key not in self._columns:
+            path = os.path.join(self.root, table, f"{name}.npy")
+            self._columns[key] = np.load(path, mmap_mode="r") if os.path.exists(path) else None
+        return self._columns[key]
+
+    def query(self, table, ticker, start=None, end=None, columns=None):
+        """Return {"date": ..., column: ...} views for `ticker` between start and end (inclusive)"""
+        bounds = self.index.get(table, {}).get(ticker.strip().upper())
+        if bounds is None:
+            return None
+        first, last = bounds
+        dates = self.column(table, "date")[first:last]
+        lo = np.searchsorted(dates, np.datetime64(start, "D")) if start else 0
+        hi = np.searchsorted(dates, np.datetime64(end, "D"), side="right") if end else len(dates)
+        result = {"date": dates[lo:hi]}
+        for name in columns or TABLES[table]:
+            values = self.column(table, name)
+            if values is not None:
+                result[name] = values[first:last][lo:hi]
+        return result
+
+    def prices(self, ticker, start=None, end=None, columns=None):
+        return self.query("prices", ticker, start, end, columns)
+
+    def fundamentals(self, ticker, start=None, end=None):
+        return self.query("fundamentals", ticker, start, end)
+
+    def closes(self):
+        """Mapping of ticker to (dates, close prices), in the shape the risk tool expects"""
+        return _Closes(self)
+
+
+class _Closes(Mapping):
+    def __init__(self, store):
+        self.store = store
+
+    def __getitem__(self, ticker):
+        result = self.store.prices(ticker, columns=("close",))
+        if result is None:
+            raise KeyError(ticker)
+        return result["date"], result["close"]
+
+    def __iter__(self):
+        return iter(self.store.tickers())
+
+    def __len__(self):
+        return len(self.store.index.get("prices", {}))
+
+    def __contains__(self, ticker):
+        return ticker in self.store.index.get("prices", {})
+
+
+def main():
+    """Ingest price and fundamentals files into a market data store"""
+    parser = argparse.ArgumentParser(description="Build the local market data store")
+    parser.add_argument("root", help="Store directory (FINANCE_MARKET_DATA)")
+    parser.add_argument("--prices", help="CSV or Parquet with date, ticker, close[, open, high, low, volume]")
+    parser.add_argument("--fundamentals", help=f"CSV or Parquet with date, ticker and {', '.join(FUNDAMENTAL_COLUMNS)}")
+    args = parser.parse_args()
+    if not args.prices and not args.fundamentals:
+        parser.error("pass --prices and/or --fundamentals")
+
+    store = ingest(args.root, prices=args.prices, fundamentals=args.fundamentals)
+    for table in TABLES:
+        if table in store.index:
+            print(f"{table}: {len(store.tickers(table))} tickers")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Deterministic local chat model that stands in for ChatOpenAI in tests and benchmarks
+"""
+
+import hashlib
+import os
+import time
+from typing import Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from callbacks import RoleAwareHandler
+
+WORDS = (
+    "revenue margin liquidity leverage growth valuation exposure volatility "
+    "allocation diversification cashflow outlook guidance drawdown yield"
+).split()
+
+
+class MockChatModel(BaseChatModel):
+    """Answer every prompt with a canned "Final Answer" after a simulated delay.
+
+    `latency` is the time to first token in seconds and `tokens_per_second`
+    the streaming rate (0 streams instantly). Responses depend only on the
+    prompt, so repeated runs produce identical output. A `latency` above
+    `timeout` raises TimeoutError after `timeout` seconds, like a request
+    that times out.
+    """
+
+    latency: float = 0.0
+    tokens_per_second: float = 0.0
+    response_tokens: int = 60
+    timeout: Optional[float] = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            latency=float(os.getenv("FINANCE_MOCK_LATENCY", 0.0)),
+            tokens_per_second=float(os.getenv("FINANCE_MOCK_TOKENS_PER_SECOND", 0.0)),
+            response_tokens=int(os.getenv("FINANCE_MOCK_RESPONSE_TOKENS", 60)),
+        )
+
+    @property
+    def _llm_type(self):
+        return "finance-mock"
+
+    @property
+    def _identifying_params(self):
+        return {
+            "latency": self.latency,
+            "tokens_per_second": self.tokens_per_second,
+            "response_tokens": self.response_tokens,
+        }
+
+    def respond(self, prompt):
+        """Return the canned response for `prompt`"""
+        role = RoleAwareHandler.role_from_prompt(prompt)
+        seed = int(hashlib.sha256(prompt.encode()).hexdigest(), 16)
+        words = [WORDS[(seed >> (4 * i)) % len(WORDS)] for i in range(self.response_tokens)]
+        return f"Thought: I now know the final answer\nFinal Answer: {role} summary: {' '.join(words)}."
+
+    def _tokens(self, messages):
+        prompt = "\n".join(str(message.content) for message in messages)
+        text = self.respond(prompt)
+        # Split after each space so the chunks join back into the exact text
+        return [word + " " for word in text.split(" ")[:-1]] + [text.split(" ")[-1]]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = "".join(self._stream_tokens(messages))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for token in self._stream_tokens(messages):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    def _stream_tokens(self, messages):
+        if self.timeout is not None and self.latency > self.timeout:
+            time.sleep(self.timeout)
+            raise TimeoutError(f"Mock response timed out after {self.timeout}s")
+        if self.latency:
+            time.sleep(self.latency)
+        for token in self._tokens(messages):
+            if self.tokens_per_second:
+                time.sleep(1.0 / self.tokens_per_second)
+            yield token
@@ -0,0 +1,283 @@
+"""
+Per-task and per-agent model routing with timeout fallbacks and recorded latency and cost
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import openai
+from crewai import Task
+from langchain_core.callbacks import BaseCallbackHandler
+from pydantic import PrivateAttr
+
+from http_pool import shared_client
+from llm_cache import CachedChatOpenAI
+from mock_llm import MockChatModel
+from prompt_budget import count_tokens
+
+# USD per million prompt and completion tokens; a model spec's "prices" overrides these
+PRICES = {
+    "gpt-3.5-turbo": (0.5, 1.5),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4-turbo": (10.0, 30.0),
+}
+
+# Errors that hand a call to the next model in its route (APITimeoutError is an APIConnectionError)
+FALLBACK_ERRORS = (TimeoutError, openai.APIConnectionError)
+
+
+class ModelStats(BaseCallbackHandler):
+    """Record the latency, tokens, cost and timeouts of one model's calls.
+
+    Latency and timeouts are judged over the last `window` calls made within
+    `max_age` seconds, so routing follows the model's current behaviour and a
+    model demoted for timing out is tried first again once those calls age
+    out. Cache hits are not counted.
+    """
+
+    def __init__(self, name, prices=(0.0, 0.0), window=200, max_age=300):
+        self.name = name
+        self.prices = prices
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.max_age = max_age
+        # (time, seconds) per completed call, (time, None) per timed out one
+        self.recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._started = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        prompt = "\n".join(str(message.content) for message in messages[0])
+        self._started[run_id] = (time.perf_counter(), prompt)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = (time.perf_counter(), prompts[0])
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        llm_output = response.llm_output or {}
+        if started is None or llm_output.get("cache_hit"):
+            return
+        duration = time.perf_counter() - started[0]
+        usage = llm_output.get("token_usage") or {}
+        text = "".join(g.text for gens in response.generations for g in gens)
+        prompt_tokens = usage.get("prompt_tokens") or count_tokens(started[1])
+        completion_tokens = usage.get("completion_tokens") or count_tokens(text)
+        cost = (prompt_tokens * self.prices[0] + completion_tokens * self.prices[1]) / 1e6
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cost += cost
+            self.recent.append((time.time(), duration))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
+        with self._lock:
+            self.errors += 1
+            if isinstance(error, FALLBACK_ERRORS):
+                self.timeouts += 1
+                self.recent.append((time.time(), None))
+
+    def samples(self):
+        """Latencies of the recent calls, None for timeouts"""
+        cutoff = time.time() - self.max_age
+        with self._lock:
+            return [latency for at, latency in self.recent if at >= cutoff]
+
+    def p95(self):
+        latencies = [latency for latency in self.samples() if latency is not None]
+        return float(np.percentile(latencies, 95)) if latencies else None
+
+    def timeout_rate(self):
+        samples = self.samples()
+        return sum(latency is None for latency in samples) / len(samples) if samples else 0.0
+
+    def mean_cost(self):
+        with self._lock:
+            return self.cost / self.calls if self.calls else 0.0
+
+    def snapshot(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "p95_s": self.p95(),
+            "timeout_rate": self.timeout_rate(),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost_usd": self.cost,
+            "mean_cost_usd": self.mean_cost(),
+        }
+
+
+class ModelRouter:
+    """Pick the model each task runs on from a routing policy.
+
+    The policy maps task names (e.g. "budget_planning"), then agent roles,
+    then "default" to a route: the models to try in order, where the later
+    ones take over when a call times out or cannot connect. A route may set
+    `max_latency_s` and `max_cost` (USD per call); models whose recorded p95
+    latency or mean cost exceeds them, or that time out on most recent
+    calls, are moved to the back of the route (see ModelStats).
+    """
+
+    def __init__(self, policy, cache=None, callbacks=None, temperature=0.1, min_samples=5):
+        self.policy = policy
+        self.cache = cache
+        self.callbacks = list(callbacks or [])
+        self.temperature = temperature
+        self.min_samples = min_samples
+        self.default_timeout = policy.get("timeout")
+        self._models = {}
+        self._stats = {}
+        self._chains = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, cache=None):
+        """Build a router from FINANCE_ROUTING_PATH or FINANCE_MODEL_ROUTES, or None if neither is set"""
+        path = os.getenv("FINANCE_ROUTING_PATH")
+        if path:
+            with open(path) as f:
+                policy = json.load(f)
+        elif os.getenv("FINANCE_MODEL_ROUTES"):
+            policy = cls.parse_routes(os.getenv("FINANCE_MODEL_ROUTES"))
+        else:
+            return None
+        timeout = os.getenv("FINANCE_MODEL_TIMEOUT")
+        if timeout:
+            policy.setdefault("timeout", float(timeout))
+        return cls(policy, cache=cache)
+
+    @staticmethod
+    def parse_routes(text):
+        """Parse "default=gpt-3.5-turbo;comprehensive_financial_review=gpt-4o|gpt-3.5-turbo"
+
+        Keys are task names or agent roles; "|" separates a model from its fallbacks.
+        """
+        policy = {"tasks": {}, "agents": {}}
+        for item in text.split(";"):
+            if not item.strip():
+                continue
+            key, _, models = item.partition("=")
+            route = [model.strip() for model in models.split("|") if model.strip()]
+            if key.strip() == "default":
+                policy["default"] = route
+            else:
+                policy["tasks"][key.strip()] = policy["agents"][key.strip()] = route
+        return policy
+
+    def route_for(self, task_name, role):
+        """Return the route ({"models": [...], ...}) for a task, or None to keep the agent's model"""
+        route = (
+            self.policy.get("tasks", {}).get(task_name)
+            or self.policy.get("agents", {}).get(role)
+            or self.policy.get("default")
+        )
+        if not route:
+            return None
+        return {"models": route} if isinstance(route, list) else route
+
+    def llm_for(self, task_name, role):
+        """Return the model, with its fallbacks, that `task_name` should run on"""
+        route = self.route_for(task_name, role)
+        if route is None:
+            return None
+        return self._chain(tuple(self.rank(route)))
+
+    def rank(self, route):
+        """Order a route's models, moving those over its latency or cost limits to the back"""
+        within, over = [], []
+        for name in route["models"]:
+            (over if self._over_limits(self.stats_for(name), route) else within).append(name)
+        return within + over
+
+    def _over_limits(self, stats, route):
+        if len(stats.samples()) < self.min_samples:
+            return False
+        if stats.timeout_rate() > 0.5:
+            return True
+        max_latency = route.get("max_latency_s")
+        if max_latency is not None and (stats.p95() or 0.0) > max_latency:
+            return True
+        max_cost = route.get("max_cost")
+        return max_cost is not None and stats.mean_cost() > max_cost
+
+    def _chain(self, names):
+        with self._lock:
+            chain = self._chains.get(names)
+            if chain is None:
+                models = [self._model(name) for name in names]
+                chain = models[0] if len(models) == 1 else models[0].with_fallbacks(
+                    models[1:], exceptions_to_handle=FALLBACK_ERRORS
+                )
+                self._chains[names] = chain
+        return chain
+
+    def _model(self, name):
+        if name in self._models:
+            return self._models[name]
+        spec = self.policy.get("models", {}).get(name, {"model": name})
+        model = spec.get("model", name)
+        timeout = spec.get("timeout", self.default_timeout)
+        if spec.get("provider") == "mock":
+            llm = MockChatModel(
+                latency=spec.get("latency", 0.0),
+                tokens_per_second=spec.get("tokens_per_second", 0.0),
+                response_tokens=spec.get("response_tokens", 60),
+                timeout=timeout,
+            )
+        else:
+            # base_url points at any OpenAI-compatible server, e.g. a local model
+            llm = CachedChatOpenAI(
+                model=model,
+                temperature=spec.get("temperature", self.temperature),
+                cache=self.cache,
+                request_timeout=timeout,
+                base_url=spec.get("base_url"),
+                http_client=shared_client(),
+                max_retries=0,
+            )
+        stats = self.stats_for(name)
+        stats.prices = tuple(spec.get("prices", PRICES.get(model, (0.0, 0.0))))
+        llm.callbacks = self.callbacks + [stats]
+        self._models[name] = llm
+        return llm
+
+    def stats_for(self, name):
+        if name not in self._stats:
+            self._stats.setdefault(name, ModelStats(name))
+        return self._stats[name]
+
+    def stats(self):
+        """Recorded calls, p95 latency, timeouts, tokens and cost per model"""
+        return {name: stats.snapshot() for name, stats in self._stats.items()}
+
+
+class RoutedTask(Task):
+    """Task that runs its agent on the model its router picks for it"""
+
+    _router = PrivateAttr(default=None)
+    _route = PrivateAttr(default=None)
+
+    def _execute(self, agent, task, context, tools):
+        llm = self._router.llm_for(self._route, agent.role) if self._router else None
+        if llm is None:
+            return super()._execute(agent, task, context, tools)
+        # Agents are checked out per request, so the swap is private to this task
+        # and CrewAI rebuilds the agent's executor from `llm` on every task
+        default, agent.llm = agent.llm, llm
+        try:
+            return super()._execute(agent, task, context, tools)
+        finally:
+            agent.llm = default
@@ -0,0 +1,174 @@
+"""
+Vectorized loan, debt payoff, savings and portfolio allocation calculations
+"""
+
+import numpy as np
+
+from risk_metrics import MIN_OBSERVATIONS, TRADING_DAYS, joined_returns
+
+# Rebalance when a weight drifts this many percentage points or this share of its target,
+# whichever is smaller
+REBALANCE_ABSOLUTE = 0.05
+REBALANCE_RELATIVE = 0.25
+
+
+def monthly_payment(principal, annual_rate, months):
+    """Fixed monthly payment that repays `principal` in `months`"""
+    rate = annual_rate / 12
+    if rate == 0:
+        return principal / months
+    return principal * rate / (1 - (1 + rate) ** -months)
+
+
+def amortization_schedule(principal, annual_rate, months):
+    """Per-month payment, interest, principal and remaining balance arrays of a fixed-payment loan"""
+    rate = annual_rate / 12
+    payment = monthly_payment(principal, annual_rate, months)
+    growth = (1 + rate) ** np.arange(months + 1)
+    # Closed-form balance after k payments, so no month-by-month loop is needed
+    if rate == 0:
+        balance = principal - payment * np.arange(months + 1)
+    else:
+        balance = principal * growth - payment * (growth - 1) / rate
+    balance = np.maximum(balance, 0.0)
+    interest = balance[:-1] * rate
+    return {
+        "payment": np.full(months, payment),
+        "interest": interest,
+        "principal": balance[:-1] - balance[1:],
+        "balance": balance[1:],
+    }
+
+
+def debt_payoff(balances, annual_rates, minimum_payments, monthly_budget, strategy="avalanche", max_months=600):
+    """Pay several debts from one monthly budget.
+
+    Every debt gets its minimum payment and the rest of the budget goes to the
+    highest-rate debt (avalanche) or the smallest balance (snowball). Payments
+    of paid-off debts roll over to the next target. Returns the months needed,
+    total interest, the month each debt is paid off and the payoff order.
+    """
+    balances = np.array(balances, dtype=np.float64)
+    rates = np.asarray(annual_rates, dtype=np.float64) / 12
+    minimums = np.asarray(minimum_payments, dtype=np.float64)
+    if strategy not in ("avalanche", "snowball"):
+        raise ValueError(f"Unknown strategy {strategy!r}, expected avalanche or snowball")
+    if monthly_budget < minimums.sum():
+        raise ValueError(f"Monthly budget {monthly_budget:,.2f} is below the minimum payments {minimums.sum():,.2f}")
+    # Avalanche targets the highest rate, snowball the smallest starting balance
+    priority = np.argsort(-rates if strategy == "avalanche" else balances, kind="stable")
+    payoff_month = np.zeros(balances.size, dtype=np.int64)
+    total_interest = 0.0
+    month = 0
+    while (balances > 0.005).any():
+        if month == max_months:
+            raise ValueError(f"Debts are not repaid within {max_months} months at this budget")
+        month += 1
+        open_ = balances > 0.005
+        interest = balances * rates * open_
+        total_interest += interest.sum()
+        balances += interest
+        payment = np.minimum(minimums * open_, balances)
+        extra = monthly_budget - payment.sum()
+        for i in priority:
+            if extra <= 0:
+                break
+            top_up = min(extra, balances[i] - payment[i])
+            payment[i] += top_up
+            extra -= top_up
+        balances -= payment
+        payoff_month[open_ & (balances <= 0.005)] = month
+    return {
+        "strategy": strategy,
+        "months": month,
+        "total_interest": float(total_interest),
+        "payoff_month": payoff_month,
+        "order": [int(i) for i in np.argsort(payoff_month, kind="stable")],
+    }
+
+
+def savings_projection(current, monthly_contribution, annual_return, months, target=None):
+    """Month-end balances of a savings plan, and when and with what contribution it reaches `target`"""
+    rate = annual_return / 12
+    k = np.arange(1, months + 1)
+    growth = (1 + rate) ** k
+    # Future value of 1 paid in at the end of each month so far
+    annuity = (growth - 1) / rate if rate else k.astype(np.float64)
+    balances = current * growth + monthly_contribution * annuity
+    projection = {
+        "balances": balances,
+        "final_balance": float(balances[-1]),
+        "contributed": float(current + monthly_contribution * months),
+    }
+    if target is not None:
+        reached = np.flatnonzero(balances >= target)
+        projection["months_to_target"] = int(reached[0] + 1) if reached.size else None
+        # Contribution that reaches the target exactly at the end of the horizon
+        projection["required_contribution"] = max(float((target - current * growth[-1]) / annuity[-1]), 0.0)
+    return projection
+
+
+def return_moments(histories):
+    """Annualized mean returns and covariance of price series joined on their shared dates"""
+    returns = joined_returns(histories)
+    if returns.shape[0] < MIN_OBSERVATIONS:
+        raise ValueError(
+            f"Insufficient shared price history: {returns.shape[0]} daily returns, "
+            f"at least {MIN_OBSERVATIONS} are needed"
+        )
+    return returns.mean(axis=0) * TRADING_DAYS, np.cov(returns, rowvar=False) * TRADING_DAYS, returns.shape[0]
+
+
+def _project_simplex(weights):
+    # Euclidean projection onto {w >= 0, sum(w) = 1}
+    ordered = np.sort(weights)[::-1]
+    cumulative = np.cumsum(ordered) - 1
+    index = np.flatnonzero(ordered - cumulative / np.arange(1, weights.size + 1) > 0)[-1]
+    return np.maximum(weights - cumulative[index] / (index + 1), 0.0)
+
+
+def mean_variance_weights(mean, cov, risk_aversion=3.0, iterations=5000, tol=1e-10):
+    """Long-only weights maximizing mean - risk_aversion / 2 * variance, by projected gradient ascent"""
+    mean, cov = np.asarray(mean, dtype=np.float64), np.asarray(cov, dtype=np.float64)
+    weights = np.full(mean.size, 1.0 / mean.size)
+    step = 1.0 / (risk_aversion * np.linalg.eigvalsh(cov).max())
+    for _ in range(iterations):
+        updated = _project_simplex(weights + step * (mean - risk_aversion * cov @ weights))
+        if np.abs(updated - weights).max() < tol:
+            return updated
+        weights = updated
+    return weights
+
+
+def risk_parity_weights(cov, iterations=1000, tol=1e-10):
+    """Long-only weights whose assets contribute equally to portfolio variance"""
+    cov = np.asarray(cov, dtype=np.float64)
+    weights = 1.0 / np.sqrt(np.diag(cov))
+    weights /= weights.sum()
+    for _ in range(iterations):
+        contributions = weights * (cov @ weights)
+        updated = weights * np.sqrt(contributions.mean() / contributions)
+        updated /= updated.sum()
+        if np.abs(updated - weights).max() < tol:
+            return updated
+        weights = updated
+    return weights
+
+
+def portfolio_stats(weights, mean, cov):
+    """Expected return, volatility and each asset's share of the portfolio's risk"""
+    weights = np.asarray(weights)
+    variance = float(weights @ cov @ weights)
+    return {
+        "expected_return": float(weights @ mean),
+        "volatility": float(np.sqrt(variance)),
+        "risk_contributions": weights * (cov @ weights) / variance,
+    }
+
+
+def rebalance_bands(weights):
+    """Lower and upper weights outside which a position should be rebalanced"""
+    weights = np.asarray(weights)
+    # The tighter of the two, so small positions are not left to double before a trade
+    width = np.minimum(REBALANCE_ABSOLUTE, REBALANCE_RELATIVE * weights)
+    return np.maximum(weights - width, 0.0), np.minimum(weights + width, 1.0)
@@ -0,0 +1,127 @@
+"""
+Token counting, prompt compaction and context budgets for crew prompts
+"""
+
+import os
+import re
+import threading
+from functools import lru_cache
+
+from callbacks import RoleAwareHandler
+
+
+@lru_cache(maxsize=8)
+def _encoding(model):
+    """Return the tiktoken encoding for `model`, or None when it cannot be loaded"""
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # tiktoken downloads encodings on first use, which fails offline
+        return None
+
+
+def count_tokens(text, model="gpt-3.5-turbo"):
+    """Count tokens with tiktoken, estimating four characters per token without it"""
+    encoding = _encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+
+def compact(text):
+    """Strip the indentation and blank-line padding of triple-quoted prompt text"""
+    lines = [line.strip() for line in text.strip().splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines))
+
+
+class PromptBudget:
+    """Fit upstream task outputs into a token budget before they become context.
+
+    Outputs over the budget are passed to `summarizer(text, max_tokens)` when
+    one is given, otherwise the head and tail are kept and the middle dropped.
+    """
+
+    def __init__(self, context_tokens=None, model="gpt-3.5-turbo", summarizer=None):
+        self.context_tokens = context_tokens or int(os.getenv("FINANCE_CONTEXT_TOKENS", 1200))
+        self.model = model
+        self.summarizer = summarizer
+
+    def fit(self, text):
+        if count_tokens(text, self.model) <= self.context_tokens:
+            return text
+        if self.summarizer is not None:
+            return self.summarizer(text, self.context_tokens)
+        return self._truncate(text)
+
+    def task_callback(self, output):
+        """Crew task callback that trims what downstream tasks read as context"""
+        output.raw_output = self.fit(output.raw_output)
+
+    def _truncate(self, text):
+        encoding = _encoding(self.model)
+        if encoding is None:
+            tokens, decode, budget = text, "".join, self.context_tokens * 4
+        else:
+            tokens, decode, budget = encoding.encode(text), encoding.decode, self.context_tokens
+        head = budget * 2 // 3
+        tail = budget - head
+        return f"{decode(tokens[:head])}\n[... trimmed to fit the context budget ...]\n{decode(tokens[-tail:])}"
+
+
+class TokenUsageTracker(RoleAwareHandler):
+    """Accumulate prompt and completion tokens per agent role (and so per task)"""
+
+    def __init__(self, model="gpt-3.5-turbo"):
+        self.model = model
+        self._lock = threading.Lock()
+        self._usage = {}
+        self._runs = {}
+
+    def on_agent_llm_start(self, run_id, role, prompt):
+        with self._lock:
+            self._runs[run_id] = (role, count_tokens(prompt, self.model))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            role, prompt_tokens = self._runs.pop(run_id, (None, 0))
+            if role is None:
+                return
+            llm_output = response.llm_output or {}
+            entry = self._usage.setdefault(
+                role, {"calls": 0, "cache_hits": 0, "prompt_tokens": 0, "completion_tokens": 0}
+            )
+            entry["calls"] += 1
+            if llm_output.get("cache_hit"):
+                # Served from the response cache, so no tokens were spent
+                entry["cache_hits"] += 1
+                return
+            usage = llm_output.get("token_usage") or {}
+            text = "".join(g.text for gens in response.generations for g in gens)
+            entry["prompt_tokens"] += usage.get("prompt_tokens", prompt_tokens)
+            entry["completion_tokens"] += usage.get("completion_tokens", count_tokens(text, self.model))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            self._runs.pop(run_id, None)
+
+    def report(self):
+        """Return {role: {"calls", "cache_hits", "prompt_tokens", "completion_tokens"}}"""
+        with self._lock:
+            return {role: dict(entry) for role, entry in self._usage.items()}
+
+    def reset(self):
+        with self._lock:
+            self._usage.clear()
+
+    def format_report(self):
+        lines = [f"{'Agent':<30}{'Calls':>6}{'Cached':>8}{'Prompt':>10}{'Completion':>12}"]
+        for role, entry in self.report().items():
+            lines.append(
+                f"{role:<30}{entry['calls']:>6}{entry['cache_hits']:>8}"
+                f"{entry['prompt_tokens']:>10}{entry['completion_tokens']:>12}"
+            )
+        return "\n".join(lines)
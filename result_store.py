@@ -0,0 +1,243 @@
+"""
+SQLite store of crew results, indexed by ticker, client, service and time and full-text searchable
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# All-caps words in a request that are not tickers
+NOT_TICKERS = {"A", "I", "AI", "CEO", "CFO", "ETF", "ETFS", "EPS", "GDP", "IPO", "IRA", "LLC", "PE", "UK", "US", "USA", "USD"}
+TICKER_PATTERN = re.compile(r"\b[A-Z]{1,5}(?:[.-][A-Z])?\b")
+
+COLUMNS = (
+    "id", "run_id", "service", "inputs", "ticker", "client_id", "result", "tasks", "model",
+    "duration_s", "llm_calls", "cache_hits", "prompt_tokens", "completion_tokens", "created_at",
+)
+
+
+def subject_key(inputs):
+    """Normalise a request so case and spacing differences find the same results"""
+    return " ".join(str(inputs).split()).lower()
+
+
+def ticker_of(inputs):
+    """The first ticker a request names, e.g. "AAPL" in "AAPL stock investment", or None"""
+    for match in TICKER_PATTERN.finditer(str(inputs)):
+        if match.group() not in NOT_TICKERS:
+            return match.group()
+    return None
+
+
+class ResultStore:
+    """Every crew result with its inputs, per-task outputs, model, timings and token counts.
+
+    Lookups by ticker, client id, service and request text use indexes on
+    (key, created_at), so "the latest analysis of AAPL newer than 6 hours"
+    is one index seek. Results and task outputs are also indexed with FTS5
+    for text search.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                id INTEGER PRIMARY KEY,
+                run_id TEXT,
+                service TEXT NOT NULL,
+                inputs TEXT NOT NULL,
+                subject_key TEXT NOT NULL,
+                ticker TEXT,
+                client_id TEXT,
+                result TEXT NOT NULL,
+                tasks TEXT NOT NULL,
+                model TEXT,
+                duration_s REAL,
+                llm_calls INTEGER,
+                cache_hits INTEGER,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS results_subject ON results (service, subject_key, created_at);
+            CREATE INDEX IF NOT EXISTS results_ticker ON results (ticker, created_at);
+            CREATE INDEX IF NOT EXISTS results_client ON results (client_id, created_at);
+            CREATE INDEX IF NOT EXISTS results_service ON results (service, created_at);
+            CREATE INDEX IF NOT EXISTS results_created ON results (created_at);
+            CREATE VIRTUAL TABLE IF NOT EXISTS results_fts USING fts5(
+                inputs, result, tasks, content='results', content_rowid='id'
+            );
+            CREATE TRIGGER IF NOT EXISTS results_fts_insert AFTER INSERT ON results BEGIN
+                INSERT INTO results_fts (rowid, inputs, result, tasks)
+                VALUES (new.id, new.inputs, new.result, new.tasks);
+            END;
+            CREATE TRIGGER IF NOT EXISTS results_fts_delete AFTER DELETE ON results BEGIN
+                INSERT INTO results_fts (results_fts, rowid, inputs, result, tasks)
+                VALUES ('delete', old.id, old.inputs, old.result, old.tasks);
+            END;
+            """
+        )
+        self._conn.commit()
+
+    @classmethod
+    def from_env(cls):
+        """Build a store from FINANCE_RESULT_STORE_PATH, or None if it is unset"""
+        path = os.getenv("FINANCE_RESULT_STORE_PATH")
+        return cls(path) if path else None
+
+    def save(self, service, inputs, result, tasks=(), model=None, duration_s=None, usage=None,
+             run_id=None, ticker=None, client_id=None, created_at=None):
+        """Store one crew result and return its id.
+
+        `tasks` is a list of dicts (name, role, output, duration_s, tokens...)
+        and `usage` the run's llm_calls, cache_hits and token totals. The
+        ticker defaults to the first ticker-like word of `inputs`.
+        """
+        usage = usage or {}
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO results (run_id, service, inputs, subject_key, ticker, client_id, result, tasks, "
+                "model, duration_s, llm_calls, cache_hits, prompt_tokens, completion_tokens, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    run_id, service, str(inputs), subject_key(inputs), ticker or ticker_of(inputs), client_id,
+                    str(result), json.dumps(list(tasks)), model, duration_s,
+                    usage.get("llm_calls"), usage.get("cache_hits"),
+                    usage.get("prompt_tokens"), usage.get("completion_tokens"),
+                    time.time() if created_at is None else created_at,
+                ),
+            )
+            self._conn.commit()
+        return cursor.lastrowid
+
+    def latest(self, service=None, inputs=None, ticker=None, client_id=None, max_age=None):
+        """The newest result matching every given filter and at most `max_age` seconds old, or None"""
+        rows = self.history(service, inputs, ticker, client_id, max_age=max_age, limit=1)
+        with self._lock:
+            if rows:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return rows[0] if rows else None
+
+    def history(self, service=None, inputs=None, ticker=None, client_id=None, since=None, until=None,
+                max_age=None, limit=50):
+        """Results matching every given filter, newest first.
+
+        `since` and `until` are Unix times; `max_age` (seconds) is a shorthand
+        for since=now - max_age.
+        """
+        if max_age is not None:
+            since = max(since or 0.0, time.time() - max_age)
+        where, params = [], []
+        for column, value in (
+            ("service", service),
+            ("subject_key", None if inputs is None else subject_key(inputs)),
+            ("ticker", ticker.upper() if ticker else None),
+            ("client_id", client_id),
+        ):
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            where.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("created_at < ?")
+            params.append(until)
+        query = f"SELECT {', '.join(COLUMNS)} FROM results"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(query, params + [limit]).fetchall()
+        return [self._row(row) for row in rows]
+
+    def search(self, text, service=None, limit=20):
+        """Results whose inputs, result or task outputs contain every word of `text`, best match first"""
+        # Quoted words are matched literally, so user text cannot break the FTS query syntax
+        match = " ".join('"' + word.replace('"', '""') + '"' for word in text.split())
+        if not match:
+            return []
+        query = (
+            f"SELECT {', '.join('r.' + column for column in COLUMNS)} FROM results_fts "
+            "JOIN results r ON r.id = results_fts.rowid WHERE results_fts MATCH ?"
+        )
+        params = [match]
+        if service is not None:
+            query += " AND r.service = ?"
+            params.append(service)
+        query += " ORDER BY results_fts.rank LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(query, params + [limit]).fetchall()
+        return [self._row(row) for row in rows]
+
+    def get(self, result_id):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM results WHERE id = ?", (result_id,)
+            ).fetchone()
+        return self._row(row) if row is not None else None
+
+    def purge(self, older_than):
+        """Delete results stored more than `older_than` seconds ago and return how many there were"""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM results WHERE created_at < ?", (time.time() - older_than,))
+            self._conn.commit()
+        return cursor.rowcount
+
+    def _row(self, row):
+        record = dict(row)
+        record["tasks"] = json.loads(record["tasks"])
+        return record
+
+    def stats(self):
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        total = self.hits + self.misses
+        return {"results": count, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def main():
+    """Print stored results as JSON lines"""
+    parser = argparse.ArgumentParser(description="Query the crew result store")
+    parser.add_argument("path", help="Result store file (FINANCE_RESULT_STORE_PATH)")
+    parser.add_argument("--service", help="financial_analysis, personal_finance_planning or investment_analysis")
+    parser.add_argument("--ticker")
+    parser.add_argument("--client-id")
+    parser.add_argument("--inputs", help="Request text, matched ignoring case and spacing")
+    parser.add_argument("--max-age-hours", type=float, help="Only results newer than this")
+    parser.add_argument("--search", help="Words that must appear in the request, result or task outputs")
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    store = ResultStore(args.path)
+    if args.search:
+        records = store.search(args.search, service=args.service, limit=args.limit)
+    else:
+        records = store.history(
+            service=args.service, inputs=args.inputs, ticker=args.ticker, client_id=args.client_id,
+            max_age=args.max_age_hours * 3600 if args.max_age_hours is not None else None, limit=args.limit,
+        )
+    for record in records:
+        print(json.dumps(record))
+
+
+if __name__ == "__main__":
+    main()
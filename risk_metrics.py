@@ -0,0 +1,172 @@
+"""
+Vectorized risk metrics computed from daily price history
+"""
+
+import csv
+from statistics import NormalDist
+
+import numpy as np
+
+TRADING_DAYS = 252
+ROLLING_WINDOW = 21
+# Fewer daily returns than this give meaningless quantiles and ratios
+MIN_OBSERVATIONS = ROLLING_WINDOW + 1
+
+
+def load_price_history(path):
+    """Load a long-format CSV (date, ticker, close) into {ticker: (dates, close prices)}"""
+    rows = {}
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            rows.setdefault(row["ticker"].upper(), []).append((row["date"][:10], float(row["close"])))
+    history = {}
+    for ticker, values in rows.items():
+        values.sort()
+        history[ticker] = (
+            np.array([date for date, _ in values], dtype="datetime64[D]"),
+            np.array([close for _, close in values], dtype=np.float64),
+        )
+    return history
+
+
+def align(dates, prices, other_dates, other_prices):
+    """Keep only the dates both series have, so their returns cover the same days"""
+    _, mine, theirs = np.intersect1d(dates, other_dates, assume_unique=True, return_indices=True)
+    return np.asarray(prices)[mine], np.asarray(other_prices)[theirs]
+
+
+def joined_returns(histories):
+    """Daily returns of several (dates, prices) series over the dates they all share, one column each"""
+    # Dates are sorted and unique, so binary searches join them without re-sorting,
+    # and series on the shared calendar already (the usual case) are used as they are
+    shared = histories[0][0]
+    for dates, _ in histories[1:]:
+        if not np.array_equal(dates, shared):
+            found = np.minimum(np.searchsorted(dates, shared), len(dates) - 1)
+            shared = shared[dates[found] == shared]
+    return np.column_stack([
+        simple_returns(prices if np.array_equal(dates, shared) else np.asarray(prices)[np.searchsorted(dates, shared)])
+        for dates, prices in histories
+    ])
+
+
+def simple_returns(prices):
+    prices = np.asarray(prices, dtype=np.float64)
+    return prices[1:] / prices[:-1] - 1.0
+
+
+def historical_var(returns, level=0.95):
+    """One-day VaR as a positive loss fraction, from the empirical return quantile"""
+    return float(-np.quantile(returns, 1.0 - level))
+
+
+def parametric_var(returns, level=0.95):
+    """One-day VaR assuming normally distributed returns"""
+    z = NormalDist().inv_cdf(1.0 - level)
+    return float(-(returns.mean() + z * returns.std(ddof=1)))
+
+
+def monte_carlo_var(returns, level=0.95, simulations=100_000, seed=0):
+    """One-day VaR from simulated normal returns with the sample mean and volatility"""
+    rng = np.random.default_rng(seed)
+    simulated = rng.normal(returns.mean(), returns.std(ddof=1), simulations)
+    return historical_var(simulated, level)
+
+
+def conditional_var(returns, level=0.95):
+    """Expected shortfall: the mean loss on days at or beyond the historical VaR"""
+    var = historical_var(returns, level)
+    tail = returns[returns <= -var]
+    return float(-tail.mean()) if tail.size else var
+
+
+def beta(returns, market_returns):
+    """Beta of date-aligned returns (see align)"""
+    if returns.size != market_returns.size:
+        raise ValueError("Returns must cover the same dates; align the price series first")
+    covariance = np.cov(returns, market_returns, ddof=1)
+    return float(covariance[0, 1] / covariance[1, 1])
+
+
+def rolling_volatility(returns, window=ROLLING_WINDOW):
+    """Annualized volatility over each trailing `window`-day period"""
+    if returns.size < window:
+        return np.array([])
+    windows = np.lib.stride_tricks.sliding_window_view(returns, window)
+    return windows.std(axis=1, ddof=1) * np.sqrt(TRADING_DAYS)
+
+
+def sharpe_ratio(returns, risk_free_rate=0.0):
+    excess = returns - risk_free_rate / TRADING_DAYS
+    return float(excess.mean() / excess.std(ddof=1) * np.sqrt(TRADING_DAYS))
+
+
+def sortino_ratio(returns, risk_free_rate=0.0):
+    excess = returns - risk_free_rate / TRADING_DAYS
+    downside = np.sqrt(np.mean(np.minimum(excess, 0.0) ** 2))
+    if downside == 0:
+        return float("inf")
+    return float(excess.mean() / downside * np.sqrt(TRADING_DAYS))
+
+
+def max_drawdown(prices):
+    prices = np.asarray(prices, dtype=np.float64)
+    return float(np.max(1.0 - prices / np.maximum.accumulate(prices)))
+
+
+def risk_summary(prices, market_prices=None, level=0.95, risk_free_rate=0.0, seed=0,
+                 dates=None, market_dates=None):
+    """Compute every risk metric for one price series.
+
+    Beta needs `dates` and `market_dates` unless both series already share
+    one calendar. Raises ValueError with fewer than MIN_OBSERVATIONS returns.
+    """
+    returns = simple_returns(prices)
+    if returns.size < MIN_OBSERVATIONS:
+        raise ValueError(
+            f"Insufficient price history: {returns.size} daily returns, at least {MIN_OBSERVATIONS} are needed"
+        )
+    volatility = rolling_volatility(returns)
+    summary = {
+        "observations": int(returns.size),
+        "annual_volatility": float(returns.std(ddof=1) * np.sqrt(TRADING_DAYS)),
+        "rolling_21d_volatility": float(volatility[-1]) if volatility.size else None,
+        "historical_var": historical_var(returns, level),
+        "parametric_var": parametric_var(returns, level),
+        "monte_carlo_var": monte_carlo_var(returns, level, seed=seed),
+        "cvar": conditional_var(returns, level),
+        "sharpe_ratio": sharpe_ratio(returns, risk_free_rate),
+        "sortino_ratio": sortino_ratio(returns, risk_free_rate),
+        "max_drawdown": max_drawdown(prices),
+        "confidence_level": level,
+    }
+    if market_prices is not None:
+        if dates is not None and market_dates is not None:
+            prices, market_prices = align(dates, prices, market_dates, market_prices)
+        elif len(prices) != len(market_prices):
+            raise ValueError("Dates are needed to align price series of different lengths")
+        # Too few shared days leave beta out rather than report noise
+        if len(prices) > MIN_OBSERVATIONS:
+            summary["beta"] = beta(simple_returns(prices), simple_returns(market_prices))
+    return summary
+
+
+def format_summary(ticker, summary):
+    """Render a risk summary as a compact block for the agent prompt"""
+    level = int(summary["confidence_level"] * 100)
+    lines = [f"Risk metrics for {ticker} ({summary['observations']} daily returns):"]
+    if "beta" in summary:
+        lines.append(f"- Beta: {summary['beta']:.2f}")
+    lines.append(f"- Annualized volatility: {summary['annual_volatility']:.2%}")
+    if summary["rolling_21d_volatility"] is not None:
+        lines.append(f"- 21-day rolling volatility: {summary['rolling_21d_volatility']:.2%}")
+    lines += [
+        f"- 1-day {level}% VaR (historical/parametric/Monte Carlo): "
+        f"{summary['historical_var']:.2%} / {summary['parametric_var']:.2%} / {summary['monte_carlo_var']:.2%}",
+        f"- 1-day {level}% CVaR: {summary['cvar']:.2%}",
+        f"- Sharpe ratio: {summary['sharpe_ratio']:.2f}",
+        f"- Sortino ratio: {summary['sortino_ratio']:.2f}" if np.isfinite(summary["sortino_ratio"])
+        else "- Sortino ratio: n/a (no down days)",
+        f"- Maximum drawdown: {summary['max_drawdown']:.2%}",
+    ]
+    return "\n".join(lines)
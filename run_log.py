@@ -0,0 +1,123 @@
+"""
+Buffered, asynchronous JSONL logging of crew runs with quiet / summary / full modes
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import random
+import sys
+from contextlib import contextmanager
+from logging.handlers import MemoryHandler, QueueHandler, QueueListener
+from queue import SimpleQueue
+
+MODES = ("quiet", "summary", "full")
+
+# Set by RunLog.full_trace() to force full traces for the requests inside it
+_full_trace = contextvars.ContextVar("full_trace", default=False)
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        event = {"ts": round(record.created, 6), "level": record.levelname.lower()}
+        event.update(record.msg)
+        return json.dumps(event, default=str)
+
+
+class _StderrHandler(logging.StreamHandler):
+    # Resolve sys.stderr on every write so a replaced stderr is followed
+    @property
+    def stream(self):
+        return sys.stderr
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class _DeferredQueueHandler(QueueHandler):
+    # Skip QueueHandler's formatting so JSON encoding happens on the writer thread
+    def prepare(self, record):
+        return record
+
+
+class RunLog:
+    """Structured log of crew runs written off the request path.
+
+    `summary` logs one event per crew run and per task. `full` also logs every
+    agent step and LLM call, including prompts and responses, for a sampled
+    fraction of requests (`sample_rate`). Requests run inside `full_trace()`
+    are always traced in full, even in quiet and summary mode. Events are
+    queued to a writer thread and buffered there, `buffer` events per write.
+    """
+
+    def __init__(self, mode="summary", sample_rate=1.0, path=None, stream=None, buffer=64):
+        if mode not in MODES:
+            raise ValueError(f"Unknown log mode {mode!r}, expected one of {', '.join(MODES)}")
+        self.mode = mode
+        self.sample_rate = sample_rate
+        if path:
+            target = logging.FileHandler(path, encoding="utf-8")
+        else:
+            target = logging.StreamHandler(stream) if stream else _StderrHandler()
+        target.setFormatter(JsonLinesFormatter())
+        self._buffer = MemoryHandler(buffer, flushLevel=logging.ERROR, target=target)
+        self._queue = SimpleQueue()
+        self._listener = QueueListener(self._queue, self._buffer)
+        self._listener.start()
+        self._closed = False
+        self._logger = logging.Logger("finance_crew.runs")
+        self._logger.addHandler(_DeferredQueueHandler(self._queue))
+        atexit.register(self.close)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            mode=os.getenv("FINANCE_LOG_MODE", "summary"),
+            sample_rate=float(os.getenv("FINANCE_LOG_SAMPLE_RATE", 1.0)),
+            path=os.getenv("FINANCE_LOG_PATH") or None,
+        )
+
+    @contextmanager
+    def full_trace(self):
+        """Log every step and LLM call of the requests run inside this block"""
+        token = _full_trace.set(True)
+        try:
+            yield
+        finally:
+            _full_trace.reset(token)
+
+    def wants_full_trace(self):
+        """Decide, once per request, whether to log its steps and LLM calls"""
+        if _full_trace.get():
+            return True
+        return self.mode == "full" and random.random() < self.sample_rate
+
+    def summary(self, event, **fields):
+        if self.mode != "quiet":
+            self._log(logging.INFO, event, fields)
+
+    def trace(self, event, **fields):
+        self._log(logging.DEBUG, event, fields)
+
+    def error(self, event, **fields):
+        self._log(logging.ERROR, event, fields)
+
+    def _log(self, level, event, fields):
+        self._logger.log(level, {"event": event, **fields})
+
+    def flush(self):
+        """Block until every queued event has been written"""
+        # Stopping the listener drains the queue; restart it once flushed
+        self._listener.stop()
+        self._buffer.flush()
+        self._listener.start()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._listener.stop()
+        self._buffer.close()
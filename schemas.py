@@ -0,0 +1,114 @@
+"""
+Typed outputs of the finance tasks, passed to downstream tasks as compact JSON
+"""
+
+import json
+import typing
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field, ValidationError
+
+
+class Risk(BaseModel):
+    category: str
+    level: str = Field(description="low, medium or high")
+    note: str = ""
+
+
+class Scenario(BaseModel):
+    name: str
+    portfolio_return_pct: float
+
+
+class BudgetLine(BaseModel):
+    category: str
+    kind: str = Field(description="fixed, variable, discretionary, savings or debt")
+    monthly_amount: float
+    percent_of_income: float
+
+
+class SavingsGoal(BaseModel):
+    name: str
+    target_amount: float
+    months: int
+    monthly_contribution: float
+
+
+class Allocation(BaseModel):
+    asset_class: str
+    weight_pct: float
+    vehicles: List[str] = []
+
+
+class FinancialAnalysis(BaseModel):
+    company: str
+    metrics: Dict[str, float] = Field(description="ratio or figure, e.g. pe_ratio, roe, debt_to_equity, revenue_growth_pct")
+    trends: List[str] = []
+    strengths: List[str] = []
+    weaknesses: List[str] = []
+    summary: str
+
+
+class RiskAssessment(BaseModel):
+    subject: str
+    metrics: Dict[str, float] = Field(description="beta, annual_volatility, var_95, cvar_95, sharpe, sortino, max_drawdown")
+    risks: List[Risk] = []
+    stress_scenarios: List[Scenario] = []
+    mitigations: List[str] = []
+    summary: str
+
+
+class BudgetPlan(BaseModel):
+    monthly_income: float
+    line_items: List[BudgetLine]
+    emergency_fund_target: float
+    savings_goals: List[SavingsGoal] = []
+    debt_strategy: Optional[str] = None
+    recommendations: List[str] = []
+
+
+class InvestmentStrategy(BaseModel):
+    risk_profile: str
+    allocation: List[Allocation]
+    rebalancing: str
+    milestones: List[str] = []
+    recommendations: List[str] = []
+
+
+def describe(model):
+    """Compact JSON skeleton of a model, cheaper in a prompt than its JSON Schema"""
+    return json.dumps(_skeleton(model), separators=(",", ":"))
+
+
+def _skeleton(annotation):
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+    if origin is typing.Union:
+        return _skeleton(next(arg for arg in args if arg is not type(None)))
+    if origin in (list, List):
+        return [_skeleton(args[0])]
+    if origin in (dict, Dict):
+        return {"<name>": _skeleton(args[1])}
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return {name: _field(field) for name, field in annotation.model_fields.items()}
+    return {str: "string", float: "number", int: "integer"}.get(annotation, "string")
+
+
+def _field(field):
+    skeleton = _skeleton(field.annotation)
+    if field.description and isinstance(skeleton, str):
+        return f"{skeleton}: {field.description}"
+    if field.description and isinstance(skeleton, dict) and list(skeleton) == ["<name>"]:
+        return {f"<{field.description}>": skeleton["<name>"]}
+    return skeleton
+
+
+def parse_output(model, text):
+    """Validate the JSON object in an agent's answer, or return None when there is none"""
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        return None
+    try:
+        return model.model_validate_json(text[start:end + 1])
+    except ValidationError:
+        return None
@@ -0,0 +1,378 @@
+"""
+Reuse of personal finance plans across near-duplicate client profiles
+"""
+
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# "Age: 35, Income: $85,000, ..." -> field names and where their values start
+FIELD_PATTERN = re.compile(r"(?:^|[,;\n])\s*([A-Za-z][A-Za-z ]{0,30}?)\s*:\s*")
+AMOUNT_PATTERN = re.compile(r"\$?\s*(\d[\d,]*(?:\.\d+)?)\s*([kKmM])?\b")
+WORD_PATTERN = re.compile(r"[a-z]+")
+STOPWORDS = {"a", "an", "and", "for", "in", "my", "of", "on", "the", "to", "with", "i", "want"}
+
+NUMERIC_FIELDS = {
+    "age": "age",
+    "annual income": "income",
+    "income": "income",
+    "current savings": "savings",
+    "savings": "savings",
+    "debt": "debt",
+    "monthly expenses": "expenses",
+    "expenses": "expenses",
+}
+
+
+def parse_amount(text):
+    """Parse "$85,000", "85k" or "1.2m" into a float, or None"""
+    match = AMOUNT_PATTERN.search(text)
+    if not match:
+        return None
+    value = float(match.group(1).replace(",", ""))
+    suffix = (match.group(2) or "").lower()
+    return value * {"k": 1e3, "m": 1e6}.get(suffix, 1)
+
+
+def parse_profile(profile):
+    """Split a free-text client profile into numeric fields and sorted text terms.
+
+    Returns (numbers, texts, raw) where `raw` keeps each numeric field's
+    original text so reused plans can be adapted to the new values.
+    """
+    matches = list(FIELD_PATTERN.finditer(profile))
+    numbers, texts, raw = {}, {}, {}
+    if not matches:
+        texts["profile"] = _terms(profile)
+    for i, match in enumerate(matches):
+        key = match.group(1).strip().lower()
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(profile)
+        value = profile[match.end():end].strip()
+        field = NUMERIC_FIELDS.get(key)
+        amount = parse_amount(value) if field else None
+        if amount is not None:
+            numbers[field] = amount
+            raw[field] = value
+        else:
+            # Goals and other free text are order-insensitive
+            texts[key] = _terms(value)
+    return numbers, texts, raw
+
+
+def profile_fields(profile, fields, known=()):
+    """Keep the "Field: value" parts of a profile named in `fields`.
+
+    Parts named in neither `fields` nor `known` are kept too, so a field no
+    task claims is never dropped. Whitespace is normalised, and text with no
+    fields is returned unchanged.
+    """
+    matches = list(FIELD_PATTERN.finditer(profile))
+    if not matches:
+        return profile
+    parts = [profile[:matches[0].start()].strip(" ,;\n")]
+    for i, match in enumerate(matches):
+        key = " ".join(match.group(1).lower().split())
+        if key in fields or key not in known:
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(profile)
+            value = " ".join(profile[match.end():end].split()).rstrip(",;")
+            parts.append(f"{match.group(1).strip()}: {value}")
+    return ", ".join(part for part in parts if part)
+
+
+def _terms(text):
+    words = [word.rstrip("s") if len(word) > 3 else word for word in WORD_PATTERN.findall(text.lower())]
+    return sorted({word for word in words if word not in STOPWORDS})
+
+
+class ProfileVectorizer:
+    """Hash profile fields into a fixed-size unit vector.
+
+    Numeric fields are placed on a bucket scale (5-year age bands, 10% wide
+    money bands) and split linearly between the two nearest buckets, so
+    $85,000 and $86,000 land almost on the same features.
+    """
+
+    def __init__(self, dimensions=4096, numeric_weight=2.0, money_step=0.1, age_step=5):
+        self.dimensions = dimensions
+        self.numeric_weight = numeric_weight
+        self.money_step = money_step
+        self.age_step = age_step
+
+    def scale(self, field, value):
+        if field == "age":
+            return value / self.age_step
+        return math.log1p(max(value, 0.0)) / math.log1p(self.money_step)
+
+    def vector(self, numbers, texts):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for field, value in numbers.items():
+            position = self.scale(field, value)
+            bucket = math.floor(position)
+            fraction = position - bucket
+            self._add(vector, f"{field}={bucket}", self.numeric_weight * (1 - fraction))
+            self._add(vector, f"{field}={bucket + 1}", self.numeric_weight * fraction)
+        for field, terms in texts.items():
+            for term in terms:
+                self._add(vector, f"{field}:{term}", 1.0)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _add(self, vector, feature, weight):
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "little") % self.dimensions
+        sign = 1.0 if digest[4] & 1 else -1.0
+        vector[index] += sign * weight
+
+
+class SemanticPlanCache:
+    """SQLite-backed vector index of past personal finance plans.
+
+    A plan is reused when its profile vector has cosine similarity of at least
+    `threshold` with the new one and every numeric field is within
+    `tolerance` (relative; ages within `age_tolerance` years). Reused plans
+    have the old profile's figures replaced with the new ones.
+
+    Storing a profile that parses to the same fields as a stored one replaces
+    its plan. Expired plans are deleted, and beyond `max_entries` the least
+    recently used ones are evicted, as in ResponseCache.
+    """
+
+    def __init__(self, path, threshold=0.9, tolerance=0.1, age_tolerance=3, ttl=7 * 24 * 60 * 60,
+                 vectorizer=None, max_entries=1000):
+        self.path = path
+        self.threshold = threshold
+        self.tolerance = tolerance
+        self.age_tolerance = age_tolerance
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.vectorizer = vectorizer or ProfileVectorizer()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS plans (
+                id INTEGER PRIMARY KEY,
+                profile TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )"""
+        )
+        # Caches created before deduplication and eviction lack these columns
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(plans)")}
+        if "profile_key" not in columns:
+            self._conn.execute("ALTER TABLE plans ADD COLUMN profile_key TEXT")
+            self._conn.execute("ALTER TABLE plans ADD COLUMN accessed_at REAL")
+            self._conn.execute("UPDATE plans SET accessed_at = created_at")
+        self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS plans_profile_key ON plans (profile_key)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS plans_accessed_at ON plans (accessed_at)")
+        self._conn.commit()
+        self._load()
+
+    @classmethod
+    def from_env(cls):
+        """Build a cache from FINANCE_SEMANTIC_CACHE_* settings, or None if disabled"""
+        path = os.getenv("FINANCE_SEMANTIC_CACHE_PATH")
+        if not path:
+            return None
+        return cls(
+            path,
+            threshold=float(os.getenv("FINANCE_SEMANTIC_CACHE_THRESHOLD", 0.9)),
+            tolerance=float(os.getenv("FINANCE_SEMANTIC_CACHE_TOLERANCE", 0.1)),
+            ttl=float(os.getenv("FINANCE_SEMANTIC_CACHE_TTL", 7 * 24 * 60 * 60)),
+            max_entries=int(os.getenv("FINANCE_SEMANTIC_CACHE_MAX_ENTRIES", 1000)),
+        )
+
+    @staticmethod
+    def profile_key(numbers, texts):
+        """Hash of a parsed profile; rewordings and reorderings of one profile share it"""
+        fields = sorted(numbers.items()) + sorted((field, tuple(terms)) for field, terms in texts.items())
+        return hashlib.sha256(repr(fields).encode("utf-8")).hexdigest()
+
+    def _load(self):
+        # Expired and excess rows are deleted first, so startup reads at most max_entries
+        if self.ttl:
+            self._conn.execute("DELETE FROM plans WHERE created_at < ?", (time.time() - self.ttl,))
+        if self.max_entries:
+            self._conn.execute(
+                "DELETE FROM plans WHERE id NOT IN "
+                "(SELECT id FROM plans ORDER BY accessed_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+        self._conn.commit()
+        rows = self._conn.execute(
+            "SELECT id, profile, vector, created_at, accessed_at, profile_key FROM plans ORDER BY id"
+        ).fetchall()
+        # Plans live in slots of arrays that double when full, so a store does
+        # not copy the index and evicted slots are reused
+        capacity = max(64, len(rows))
+        self._matrix = np.zeros((capacity, self.vectorizer.dimensions), dtype=np.float32)
+        self._created = np.zeros(capacity, dtype=np.float64)
+        self._accessed = np.zeros(capacity, dtype=np.float64)
+        self._live = np.zeros(capacity, dtype=bool)
+        self._ids = [None] * capacity
+        self._profiles = [None] * capacity
+        self._keys = [None] * capacity
+        self._by_key = {}
+        self._free = []
+        self._size = 0
+        for plan_id, profile, vector, created_at, accessed_at, key in rows:
+            self._put(self._slot(), plan_id, profile, np.frombuffer(vector, dtype=np.float32),
+                      created_at, accessed_at or created_at, key)
+
+    def _slot(self):
+        if self._free:
+            return self._free.pop()
+        if self._size == len(self._ids):
+            grow = len(self._ids)
+            self._matrix = np.concatenate([self._matrix, np.zeros_like(self._matrix)])
+            self._created = np.concatenate([self._created, np.zeros(grow)])
+            self._accessed = np.concatenate([self._accessed, np.zeros(grow)])
+            self._live = np.concatenate([self._live, np.zeros(grow, dtype=bool)])
+            self._ids += [None] * grow
+            self._profiles += [None] * grow
+            self._keys += [None] * grow
+        self._size += 1
+        return self._size - 1
+
+    def _put(self, slot, plan_id, profile, vector, created_at, accessed_at, key):
+        self._matrix[slot] = vector
+        self._created[slot] = created_at
+        self._accessed[slot] = accessed_at
+        self._live[slot] = True
+        self._ids[slot] = plan_id
+        self._profiles[slot] = profile
+        self._keys[slot] = key
+        if key is not None:
+            self._by_key[key] = slot
+
+    def _drop(self, slots):
+        if not len(slots):
+            return
+        self._conn.executemany("DELETE FROM plans WHERE id = ?", [(self._ids[slot],) for slot in slots])
+        for slot in slots:
+            self._by_key.pop(self._keys[slot], None)
+            self._live[slot] = False
+            self._ids[slot] = self._profiles[slot] = self._keys[slot] = None
+            self._free.append(int(slot))
+
+    def lookup(self, profile):
+        """Return a plan adapted from the closest matching profile, or None"""
+        numbers, texts, raw = parse_profile(profile)
+        vector = self.vectorizer.vector(numbers, texts)
+        with self._lock:
+            size = self._size
+            similarities = self._matrix[:size] @ vector
+            live = self._live[:size].copy()
+            if self.ttl:
+                live &= self._created[:size] >= time.time() - self.ttl
+            similarities[~live] = -1.0
+            # Most similar first, newest first among equals
+            for index in np.lexsort((-self._created[:size], -similarities)):
+                if similarities[index] < self.threshold:
+                    break
+                old_numbers, _, old_raw = parse_profile(self._profiles[index])
+                if self._compatible(old_numbers, numbers):
+                    now = time.time()
+                    row = self._conn.execute(
+                        "SELECT result FROM plans WHERE id = ?", (self._ids[index],)
+                    ).fetchone()
+                    self._conn.execute("UPDATE plans SET accessed_at = ? WHERE id = ?", (now, self._ids[index]))
+                    self._conn.commit()
+                    self._accessed[index] = now
+                    self.hits += 1
+                    return adapt_plan(row[0], old_raw, raw)
+            self.misses += 1
+        return None
+
+    def store(self, profile, result):
+        numbers, texts, _ = parse_profile(profile)
+        vector = self.vectorizer.vector(numbers, texts)
+        key = self.profile_key(numbers, texts)
+        now = time.time()
+        with self._lock:
+            # The same profile again replaces its plan instead of adding a row
+            slot = self._by_key.get(key)
+            if slot is not None:
+                self._drop([slot])
+            cursor = self._conn.execute(
+                "INSERT INTO plans (profile, vector, result, created_at, accessed_at, profile_key) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (profile, vector.tobytes(), str(result), now, now, key),
+            )
+            self._put(self._slot(), cursor.lastrowid, profile, vector, now, now, key)
+            self._purge_expired(now)
+            self._evict()
+            self._conn.commit()
+
+    def purge_expired(self):
+        """Drop every plan older than the TTL"""
+        with self._lock:
+            dropped = self._purge_expired(time.time())
+            self._conn.commit()
+        return dropped
+
+    def _purge_expired(self, now):
+        if not self.ttl:
+            return 0
+        expired = np.flatnonzero(self._live[:self._size] & (self._created[:self._size] < now - self.ttl))
+        self._drop(expired)
+        return len(expired)
+
+    def _evict(self):
+        live = np.flatnonzero(self._live[:self._size])
+        excess = len(live) - self.max_entries if self.max_entries else 0
+        if excess > 0:
+            # Least recently used first
+            self._drop(live[np.argsort(self._accessed[live])[:excess]])
+            self.evictions += excess
+
+    def _compatible(self, old, new):
+        if old.keys() != new.keys():
+            return False
+        for field, value in new.items():
+            if field == "age":
+                if abs(old[field] - value) > self.age_tolerance:
+                    return False
+            elif abs(old[field] - value) > self.tolerance * max(abs(old[field]), abs(value), 1.0):
+                return False
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM plans")
+            self._conn.commit()
+            self._load()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "entries": int(self._live.sum()),
+        }
+
+
+def adapt_plan(plan, old_raw, new_raw):
+    """Replace the figures quoted from the old profile with the new profile's"""
+    for field, old_value in old_raw.items():
+        new_value = new_raw.get(field)
+        if not new_value or new_value == old_value:
+            continue
+        if field == "age":
+            plan = re.sub(rf"\b{re.escape(old_value)}(?=-year-old\b)", new_value, plan)
+            plan = re.sub(rf"(?i)\b(age[d:]?\s+){re.escape(old_value)}\b", rf"\g<1>{new_value}", plan)
+        else:
+            plan = plan.replace(old_value, new_value)
+    return plan
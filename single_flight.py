@@ -0,0 +1,93 @@
+"""
+Single-flight coalescing: concurrent identical calls share one execution and its result
+"""
+
+import threading
+import time
+from concurrent.futures import Future, wait
+
+# How often a waiting caller checks whether it has been cancelled itself
+POLL_INTERVAL = 0.05
+
+
+class SingleFlightTimeout(TimeoutError):
+    """Raised to a caller that gave up waiting for a shared in-flight call"""
+
+
+class SingleFlight:
+    """Run at most one call per key at a time and hand its result to every caller waiting on it.
+
+    The first caller for a key runs the call; callers arriving while it runs
+    wait up to `timeout` seconds (None waits for as long as it takes) and get
+    the same result or exception. A key is forgotten as soon as its call
+    finishes, so later callers start a fresh call. When the call fails with
+    one of `retry_on` (e.g. its own caller cancelled it), waiting callers
+    start it again instead of failing with it.
+    """
+
+    def __init__(self, timeout=None, retry_on=()):
+        self.timeout = timeout
+        self.retry_on = tuple(retry_on)
+        self.leaders = 0
+        self.shared = 0
+        self.timeouts = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, timeout=None, check=None):
+        """Return (result, shared): fn(*args), or the result of the identical call already running.
+
+        `timeout` overrides the instance's wait limit for this caller, and
+        `check()` is called while waiting so the caller can abort by raising.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = Future()
+                    self.leaders += 1
+                else:
+                    self.shared += 1
+            if leader:
+                return self._lead(key, call, fn, args), False
+            self._wait(key, call, deadline, check)
+            try:
+                return call.result(), True
+            except self.retry_on:
+                continue
+
+    def _lead(self, key, call, fn, args):
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            self._forget(key)
+            call.set_exception(e)
+            raise
+        self._forget(key)
+        call.set_result(result)
+        return result
+
+    def _forget(self, key):
+        with self._lock:
+            del self._calls[key]
+
+    def _wait(self, key, call, deadline, check):
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                with self._lock:
+                    self.timeouts += 1
+                raise SingleFlightTimeout(f"Gave up waiting for the in-flight call {key!r}")
+            if check is not None:
+                check()
+                remaining = POLL_INTERVAL if remaining is None else min(remaining, POLL_INTERVAL)
+            if wait((call,), remaining).done:
+                return
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._calls), "leaders": self.leaders, "shared": self.shared,
+                    "timeouts": self.timeouts}
@@ -0,0 +1,202 @@
+"""
+Monte Carlo stress testing, historical replays and factor and rate shocks for a portfolio
+"""
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from risk_metrics import MIN_OBSERVATIONS, conditional_var, historical_var, joined_returns
+
+# Paths drawn per chunk, so memory stays at chunk x horizon floats whatever the path count
+CHUNK_PATHS = 20_000
+
+# Peak-to-trough windows replayed from the local price history. Positions without
+# prices in a window move by their beta times the benchmark's move, or times the
+# S&P 500's approximate move when the benchmark has no prices there either.
+HISTORICAL_WINDOWS = {
+    "2008 financial crisis": ("2008-09-19", "2009-03-09", -0.47),
+    "2020 COVID crash": ("2020-02-19", "2020-03-23", -0.34),
+}
+
+# (name, shock to the benchmark's return)
+MARKET_SHOCKS = (("Equity market -20%", -0.20), ("Equity market -35%", -0.35))
+
+# (name, change in yields); the rate proxy moves by -duration * change
+RATE_SHOCKS = (("Rates +100bp", 0.01), ("Rates +200bp", 0.02), ("Rates -100bp", -0.01))
+
+
+def simulate(mean, volatility, horizon=21, paths=100_000, seed=0, dof=5, processes=None, chunk=CHUNK_PATHS):
+    """Draw portfolio return paths and return each path's total return and maximum drawdown.
+
+    A portfolio held at constant weights w has daily return w'r, which for
+    correlated normal or Student-t asset returns is itself normal or t with
+    mean w'mu and variance w'Sigma w. Paths are therefore drawn in that one
+    dimension, which is exact and costs the same for 5 or 500 positions.
+    `dof` sets the Student-t tails (None for normal). Every chunk has its own
+    seed spawned from `seed`, so results do not depend on `processes`.
+    """
+    seeds = np.random.SeedSequence(seed).spawn(-(-paths // chunk))
+    jobs = [
+        (chunk_seed, min(chunk, paths - i * chunk), horizon, mean, volatility, dof)
+        for i, chunk_seed in enumerate(seeds)
+    ]
+    if processes and len(jobs) > 1:
+        results = list(_pool(processes).map(_simulate_chunk, jobs))
+    else:
+        results = [_simulate_chunk(job) for job in jobs]
+    return np.concatenate([r for r, _ in results]), np.concatenate([d for _, d in results])
+
+
+def _simulate_chunk(job):
+    seed, paths, horizon, mean, volatility, dof = job
+    rng = np.random.default_rng(seed)
+    if dof is None:
+        shocks = rng.standard_normal((paths, horizon))
+    else:
+        # Scaled to unit variance so `volatility` keeps its meaning
+        shocks = rng.standard_t(dof, (paths, horizon)) * np.sqrt((dof - 2) / dof)
+    wealth = np.cumprod(1.0 + np.maximum(mean + volatility * shocks, -1.0), axis=1)
+    peak = np.maximum(np.maximum.accumulate(wealth, axis=1), 1.0)
+    return wealth[:, -1] - 1.0, (1.0 - wealth / peak).max(axis=1)
+
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def _pool(processes):
+    """Return the shared process pool with `processes` workers, started on first use"""
+    with _executors_lock:
+        if processes not in _executors:
+            _executors[processes] = ProcessPoolExecutor(max_workers=processes)
+        return _executors[processes]
+
+
+def factor_betas(histories, factor):
+    """Betas of each (dates, prices) series to the `factor` series over their shared dates"""
+    returns = joined_returns(list(histories) + [factor])
+    if returns.shape[0] < MIN_OBSERVATIONS:
+        return None
+    centered = returns - returns.mean(axis=0)
+    return centered[:, :-1].T @ centered[:, -1] / (centered[:, -1] @ centered[:, -1])
+
+
+def window_return(dates, prices, start, end, slack=7):
+    """Buy-and-hold return over [start, end], or None when the series does not cover the window"""
+    start, end = np.datetime64(start), np.datetime64(end)
+    first = np.searchsorted(dates, start)
+    last = np.searchsorted(dates, end, side="right") - 1
+    if first >= len(dates) or last < first or dates[first] - start > slack or end - dates[last] > slack:
+        return None
+    return float(prices[last] / prices[first] - 1.0)
+
+
+def stress_test(weights, history, benchmark="SPY", rate_proxy=("IEF", 7.5), horizon=21, paths=100_000,
+                seed=0, dof=5, processes=None):
+    """Stress a portfolio of {ticker: weight} against simulated, historical and shocked markets.
+
+    `history` is {ticker: (dates, closes)}. Weights are normalized to sum to
+    one. Raises ValueError when the positions share fewer than
+    MIN_OBSERVATIONS daily returns.
+    """
+    tickers = list(weights)
+    w = np.array([weights[t] for t in tickers], dtype=np.float64)
+    w /= w.sum()
+    series = [history[t] for t in tickers]
+    returns = joined_returns(series)
+    if returns.shape[0] < MIN_OBSERVATIONS:
+        raise ValueError(
+            f"Insufficient shared price history: {returns.shape[0]} daily returns, "
+            f"at least {MIN_OBSERVATIONS} are needed"
+        )
+    daily = returns @ w
+    totals, drawdowns = simulate(daily.mean(), daily.std(ddof=1), horizon, paths, seed, dof, processes)
+    result = {
+        "positions": dict(zip(tickers, w)),
+        "observations": int(daily.size),
+        "horizon": horizon,
+        "paths": paths,
+        "monte_carlo": {
+            "median": float(np.median(totals)),
+            "var_95": historical_var(totals, 0.95),
+            "cvar_95": conditional_var(totals, 0.95),
+            "var_99": historical_var(totals, 0.99),
+            "cvar_99": conditional_var(totals, 0.99),
+            "loss_over_10pct": float(np.mean(totals <= -0.10)),
+            "median_drawdown": float(np.median(drawdowns)),
+            "drawdown_95": float(np.quantile(drawdowns, 0.95)),
+        },
+        "scenarios": [],
+    }
+
+    market = history.get(benchmark)
+    betas = factor_betas(series, market) if market is not None else None
+    if betas is None:
+        betas = np.ones(len(tickers))
+    for name, (start, end, fallback) in HISTORICAL_WINDOWS.items():
+        market_move = window_return(*market, start, end) if market is not None else None
+        if market_move is None:
+            market_move = fallback
+        moves = [window_return(dates, prices, start, end) for dates, prices in series]
+        replayed = sum(move is not None for move in moves)
+        moves = np.array([beta * market_move if move is None else move for move, beta in zip(moves, betas)])
+        result["scenarios"].append({
+            "name": f"{name} (replay)",
+            "return": float(moves @ w),
+            "note": "replayed from prices" if replayed == len(tickers)
+            else f"{replayed}/{len(tickers)} positions replayed, rest via beta to {benchmark}",
+        })
+    for name, shock in MARKET_SHOCKS:
+        result["scenarios"].append({"name": name, "return": float(betas @ w * shock), "note": f"beta to {benchmark}"})
+
+    proxy, duration = rate_proxy
+    rate_betas = factor_betas(series, history[proxy]) if proxy in history else None
+    for name, change in RATE_SHOCKS:
+        result["scenarios"].append({
+            "name": name,
+            "return": None if rate_betas is None else float(rate_betas @ w * -duration * change),
+            "note": f"beta to {proxy}, duration {duration:g}" if rate_betas is not None else f"no price history for {proxy}",
+        })
+    return result
+
+
+def stress_settings():
+    """Simulation settings from FINANCE_STRESS_* environment variables"""
+    proxy, _, duration = os.getenv("FINANCE_RATE_PROXY", "IEF:7.5").partition(":")
+    return {
+        "benchmark": os.getenv("FINANCE_BENCHMARK_TICKER", "SPY").upper(),
+        "rate_proxy": (proxy.upper(), float(duration or 7.5)),
+        "horizon": int(os.getenv("FINANCE_STRESS_HORIZON", 21)),
+        "paths": int(os.getenv("FINANCE_STRESS_PATHS", 100_000)),
+        "seed": int(os.getenv("FINANCE_STRESS_SEED", 0)),
+        "processes": int(os.getenv("FINANCE_STRESS_PROCESSES", 0)) or None,
+    }
+
+
+def format_stress(result):
+    """Render a stress test as a compact table for the agent prompt"""
+    largest = sorted(result["positions"].items(), key=lambda item: -item[1])
+    positions = ", ".join(f"{t} {w:.0%}" for t, w in largest[:8])
+    if len(largest) > 8:
+        positions += f" and {len(largest) - 8} more positions"
+    mc = result["monte_carlo"]
+    lines = [
+        f"Stress test for {positions} ({result['observations']} daily returns, "
+        f"{result['paths']:,} simulated {result['horizon']}-day paths):",
+        "| Scenario | Portfolio return | Basis |",
+        "|---|---|---|",
+        f"| Simulated median | {mc['median']:+.1%} | fat-tailed Monte Carlo |",
+        f"| Simulated 95% VaR / CVaR | {-mc['var_95']:+.1%} / {-mc['cvar_95']:+.1%} | fat-tailed Monte Carlo |",
+        f"| Simulated 99% VaR / CVaR | {-mc['var_99']:+.1%} / {-mc['cvar_99']:+.1%} | fat-tailed Monte Carlo |",
+    ]
+    for scenario in result["scenarios"]:
+        value = "n/a" if scenario["return"] is None else f"{scenario['return']:+.1%}"
+        lines.append(f"| {scenario['name']} | {value} | {scenario['note']} |")
+    lines.append(
+        f"Chance of losing more than 10%: {mc['loss_over_10pct']:.1%}; drawdown median "
+        f"{mc['median_drawdown']:.1%}, 95th percentile {mc['drawdown_95']:.1%}"
+    )
+    return "\n".join(lines)
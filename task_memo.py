@@ -0,0 +1,171 @@
+"""
+Persistent per-task memo that lets a crew skip tasks whose effective input is unchanged
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from crewai import Task
+from crewai.tasks.task_output import TaskOutput
+from pydantic import PrivateAttr
+
+# Bump to invalidate every stored output, e.g. after changing how prompts are rendered
+MEMO_VERSION = 1
+
+
+def task_fingerprint(task, agent, context, tools):
+    """Hash everything that determines a task's output.
+
+    That is the task prompt, the agent's role, goal, backstory and LLM
+    settings, the tools it may call and the upstream outputs it reads.
+    """
+    # A routed model's fallbacks answer the same prompt, so the primary identifies it
+    llm = getattr(agent.llm, "runnable", agent.llm)
+    try:
+        llm_string = llm._get_llm_string()
+    except Exception:
+        llm_string = type(llm).__name__
+    payload = {
+        "version": MEMO_VERSION,
+        "description": task.description,
+        "expected_output": task.expected_output,
+        "agent": [agent.role, agent.goal, agent.backstory, agent.allow_delegation],
+        "llm": llm_string,
+        "tools": sorted(getattr(tool, "name", str(tool)) for tool in (tools or [])),
+        "context": context or "",
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class TaskMemo:
+    """SQLite store of task outputs keyed by the fingerprint of their input, with TTL and LRU eviction"""
+
+    def __init__(self, path, ttl=24 * 60 * 60, max_entries=10000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS task_outputs (
+                fingerprint TEXT PRIMARY KEY,
+                role TEXT NOT NULL,
+                output TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        # Memo files written before LRU eviction have no accessed_at column
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(task_outputs)")]
+        if "accessed_at" not in columns:
+            self._conn.execute("ALTER TABLE task_outputs ADD COLUMN accessed_at REAL NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS task_outputs_created_at ON task_outputs (created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS task_outputs_accessed_at ON task_outputs (accessed_at)")
+        self._conn.commit()
+
+    @classmethod
+    def from_env(cls):
+        """Build a memo from FINANCE_TASK_MEMO_* settings, or None if disabled"""
+        path = os.getenv("FINANCE_TASK_MEMO_PATH")
+        if not path:
+            return None
+        return cls(
+            path,
+            ttl=float(os.getenv("FINANCE_TASK_MEMO_TTL", 24 * 60 * 60)),
+            max_entries=int(os.getenv("FINANCE_TASK_MEMO_MAX_ENTRIES", 10000)),
+        )
+
+    def get(self, fingerprint):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT output, created_at FROM task_outputs WHERE fingerprint = ?", (fingerprint,)
+            ).fetchone()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                if row is not None:
+                    self._conn.execute("DELETE FROM task_outputs WHERE fingerprint = ?", (fingerprint,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE task_outputs SET accessed_at = ? WHERE fingerprint = ?", (now, fingerprint))
+            self._conn.commit()
+            self.hits += 1
+        return row[0]
+
+    def put(self, fingerprint, role, output):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO task_outputs (fingerprint, role, output, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (fingerprint, role, output, now, now),
+            )
+            if self.ttl:
+                self._conn.execute("DELETE FROM task_outputs WHERE created_at < ?", (now - self.ttl,))
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        if not self.max_entries:
+            return
+        count = self._conn.execute("SELECT COUNT(*) FROM task_outputs").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM task_outputs WHERE fingerprint IN "
+                "(SELECT fingerprint FROM task_outputs ORDER BY accessed_at ASC LIMIT ?)",
+                (excess,),
+            )
+            self.evictions += excess
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM task_outputs")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM task_outputs").fetchone()[0]
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions, "entries": entries}
+
+
+class MemoizedTask(Task):
+    """Task that reuses its stored output when its fingerprint is unchanged.
+
+    Downstream tasks fingerprint the upstream outputs they read. So when one
+    input changes, only the tasks that depend on it run again.
+    """
+
+    _memo = PrivateAttr(default=None)
+
+    def _execute(self, agent, task, context, tools):
+        if self._memo is None:
+            return super()._execute(agent, task, context, tools)
+
+        fingerprint = task_fingerprint(task, agent, context, tools)
+        result = self._memo.get(fingerprint)
+        if result is None:
+            result = agent.execute_task(task=task, context=context, tools=tools)
+            self._memo.put(fingerprint, agent.role, result)
+
+        # The rest mirrors Task._execute
+        exported_output = self._export_output(result)
+        self.output = TaskOutput(
+            description=self.description,
+            exported_output=exported_output,
+            raw_output=result,
+        )
+        if self.callback:
+            self.callback(self.output)
+        return exported_output
@@ -1,100 +1,112 @@
-from crewai import Task
+from pydantic import BaseModel, PrivateAttr
+
+from crew_registry import shared_registry
+from model_router import RoutedTask
+from schemas import parse_output
+from semantic_cache import profile_fields
+from task_memo import MemoizedTask
+from telemetry import TracedTask
+
+
+class FinanceTask(TracedTask, RoutedTask, MemoizedTask):
+    """Traced task that runs on its routed model and can reuse its output from a TaskMemo.
+
+    CrewAI runs async tasks in bare threads and drops their exceptions, so a
+    failed branch would leave its dependents running on partial context. The
+    error is kept instead and raised by the first task that reads its output.
+    
+    Tasks with an output schema pass their validated output downstream as
+    compact JSON. An answer that does not validate is kept as prose rather
+    than paying for CrewAI's LLM conversion call.
+    """
+
+    _error = PrivateAttr(default=None)
+
+    def execute(self, agent=None, context=None, tools=None):
+        for task in self.context or []:
+            if task.async_execution and task.thread is not None:
+                task.thread.join()
+            error = getattr(task, "_error", None)
+            if error is not None:
+                raise error
+        return super().execute(agent=agent, context=context, tools=tools)
+
+    def _execute(self, agent, task, context, tools):
+        # The crew's task callback (the context budget) must see the JSON that
+        # downstream tasks read, so it is held back until raw_output holds it
+        callback, self.callback = self.callback, None
+        try:
+            output = super()._execute(agent, task, context, tools)
+        except BaseException as e:
+            if not self.async_execution:
+                raise
+            self._error = e
+            return None
+        finally:
+            self.callback = callback
+        if isinstance(output, BaseModel):
+            self.output.raw_output = output.model_dump_json(exclude_defaults=True)
+        if callback:
+            callback(self.output)
+        return output
+    
+    def _export_output(self, result):
+        schema = self.output_pydantic or self.output_json
+        if schema is None:
+            return super()._export_output(result)
+        output = parse_output(schema, result)
+        if output is None:
+            return result
+        return output.model_dump() if self.output_json else output
+
 
 class FinanceTasks:
-    def financial_analysis_task(self, agent, company_or_data):
-        return Task(
-            description=f"""
-            Conduct a comprehensive financial analysis for {company_or_data}. Your analysis should include:
-            
-            1. Revenue and profitability trends over the last 3-5 years
-            2. Key financial ratios (P/E, ROE, ROA, Debt-to-Equity, Current Ratio)
-            3. Comparison with industry peers and benchmarks
-            4. Cash flow analysis and liquidity assessment
-            5. Identification of financial strengths and weaknesses
-            6. Market position and competitive advantages
-            
-            Provide clear, actionable insights with supporting data and reasoning.
-            """,
-            agent=agent,
-            expected_output="A detailed financial analysis report with key metrics, trends, and recommendations"
-        )
+    """Tasks built from the compiled templates of a CrewRegistry (crews.yaml by default)"""
     
-    def risk_assessment_task(self, agent, investment_or_portfolio):
-        return Task(
-            description=f"""
-            Perform a thorough risk assessment for {investment_or_portfolio}. Your assessment should cover:
-            
-            1. Market risk analysis (beta, volatility, correlation with market indices)
-            2. Credit risk evaluation (if applicable to bonds or debt instruments)
-            3. Liquidity risk assessment
-            4. Sector and geographic concentration risks
-            5. Interest rate sensitivity analysis
-            6. Stress testing under different market scenarios
-            7. Value at Risk (VaR) calculations
-            8. Risk-adjusted return metrics (Sharpe ratio, Sortino ratio)
-            
-            Provide specific risk mitigation recommendations and optimal risk levels.
-            """,
-            agent=agent,
-            expected_output="A comprehensive risk assessment report with quantified risk metrics and mitigation strategies"
-        )
+    def __init__(self, memo=None, router=None, registry=None):
+        # Tasks skip their agent run when the memo holds an output for the same input
+        self.memo = memo
+        # Tasks run on the model the router picks for their name, when there is one
+        self.router = router
+        self.registry = registry or shared_registry()
     
-    def budget_planning_task(self, agent, financial_situation):
-        return Task(
-            description=f"""
-            Create a comprehensive budget plan for {financial_situation}. Your plan should include:
-            
-            1. Income analysis and categorization (salary, investments, other sources)
-            2. Expense breakdown by categories (fixed, variable, discretionary)
-            3. Monthly and annual budget allocation recommendations
-            4. Emergency fund planning (3-6 months of expenses)
-            5. Debt repayment strategy (if applicable)
-            6. Savings goals and timelines
-            7. Budget tracking and monitoring methods
-            8. Cost reduction opportunities and optimization strategies
-            
-            Provide practical, actionable budget recommendations with specific dollar amounts and percentages.
-            """,
+    def build(self, name, agent, subject, context=None, async_execution=False):
+        """Create the registry's task `name` for `subject`; only its template slots are filled here"""
+        spec = self.registry.tasks[name]
+        if spec.fields is not None:
+            subject = profile_fields(subject, spec.fields, self.registry.known_fields)
+        task = FinanceTask(
+            description=spec.description.fill(subject=subject),
+            expected_output=spec.expected_output,
+            output_pydantic=spec.schema,
             agent=agent,
-            expected_output="A detailed budget plan with income/expense breakdown, savings targets, and implementation guidance"
+            context=context,
+            async_execution=async_execution
         )
+        task._memo = self.memo
+        task._router = self.router
+        task._route = spec.route
+        return task
     
-    def investment_advisory_task(self, agent, investor_profile):
-        return Task(
-            description=f"""
-            Develop a personalized investment strategy for {investor_profile}. Your recommendations should include:
-            
-            1. Asset allocation strategy based on risk tolerance and time horizon
-            2. Specific investment vehicle recommendations (stocks, bonds, ETFs, mutual funds)
-            3. Diversification strategy across sectors, geographies, and asset classes
-            4. Portfolio rebalancing schedule and triggers
-            5. Tax-efficient investment strategies
-            6. Investment timeline and milestone targets
-            7. Performance monitoring and review schedule
-            8. Exit strategies and profit-taking guidelines
-            
-            Consider the investor's goals, current financial situation, risk tolerance, and investment timeline.
-            """,
-            agent=agent,
-            expected_output="A personalized investment strategy with specific asset allocation, investment recommendations, and implementation plan"
-        )
+    def financial_analysis_task(self, agent, company_or_data, context=None, async_execution=False):
+        return self.build("financial_analysis", agent, company_or_data, context, async_execution)
     
-    def comprehensive_financial_review_task(self, agent, client_data):
-        return Task(
-            description=f"""
-            Synthesize all financial analysis, risk assessment, budgeting, and investment recommendations 
-            for {client_data} into a comprehensive financial review. Your review should:
-            
-            1. Summarize key findings from all financial analyses
-            2. Identify the most critical financial priorities and action items
-            3. Create an integrated financial plan that aligns all recommendations
-            4. Establish clear timelines and milestones for implementation
-            5. Identify potential conflicts or trade-offs between different strategies
-            6. Provide a prioritized action plan with short-term and long-term goals
-            7. Recommend regular review and adjustment schedules
-            
-            Ensure all recommendations work together coherently and support the overall financial objectives.
-            """,
-            agent=agent,
-            expected_output="An integrated comprehensive financial plan with prioritized recommendations and implementation roadmap"
-        )
\ No newline at end of file
+    def risk_assessment_task(self, agent, investment_or_portfolio, context=None, async_execution=False):
+        return self.build("risk_assessment", agent, investment_or_portfolio, context, async_execution)
+    
+    def budget_planning_task(self, agent, financial_situation, context=None, async_execution=False):
+        return self.build("budget_planning", agent, financial_situation, context, async_execution)
+    
+    def investment_advisory_task(self, agent, investor_profile, context=None, async_execution=False):
+        return self.build("investment_advisory", agent, investor_profile, context, async_execution)
+    
+    def comprehensive_financial_review_task(self, agent, client_data, context=None, async_execution=False):
+        return self.build("comprehensive_financial_review", agent, client_data, context, async_execution)
+    
+    def review_draft_task(self, agent, client_data, context=None, async_execution=True):
+        """Speculative review written from the budget plan while the investment task still runs"""
+        return self.build("review_draft", agent, client_data, context, async_execution)
+    
+    def review_reconciliation_task(self, agent, client_data, context=None):
+        """Keep the speculative draft review, or replace it when the investment strategy contradicts it"""
+        return self.build("review_reconciliation", agent, client_data, context)
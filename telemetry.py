@@ -0,0 +1,487 @@
+"""
+Spans, Prometheus-style metrics and run logs for crew runs, tasks, agent steps and LLM calls
+"""
+
+import base64
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from crewai import Task
+from google.protobuf.json_format import MessageToDict
+from opentelemetry import trace
+from opentelemetry.exporter.otlp.proto.common.trace_encoder import encode_spans
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.trace import Status, StatusCode
+from pydantic import PrivateAttr
+
+from callbacks import RoleAwareHandler
+from prompt_budget import count_tokens
+from run_log import RunLog
+
+# Span of the crew run or task executing on this thread
+_current = threading.local()
+
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class OTLPJsonFileExporter(SpanExporter):
+    """Append spans to a file as OTLP/JSON export requests, one per line.
+
+    The format is what the OpenTelemetry Collector's file receiver reads, so
+    traces can be replayed into any backend later without a live collector.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        request = MessageToDict(encode_spans(spans))
+        _hex_ids(request)
+        with self._lock, open(self.path, "a") as f:
+            f.write(json.dumps(request, separators=(",", ":")) + "\n")
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+
+def _hex_ids(value):
+    # Protobuf JSON encodes bytes as base64 but OTLP/JSON requires hex ids
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key in ("traceId", "spanId", "parentSpanId") and isinstance(item, str):
+                value[key] = base64.b64decode(item).hex()
+            else:
+                _hex_ids(item)
+    elif isinstance(value, list):
+        for item in value:
+            _hex_ids(item)
+
+
+class Metrics:
+    """Thread-safe counters and histograms rendered in Prometheus text format"""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+
+    def inc(self, name, labels, value=1, help=""):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._help.setdefault(name, (help, "counter"))
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, labels, value, help=""):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._help.setdefault(name, (help, "histogram"))
+            series = self._histograms.setdefault(name, {})
+            counts, total, count = series.get(key, ([0] * len(self.buckets), 0.0, 0))
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                counts[index] += 1
+            series[key] = (counts, total + value, count + 1)
+
+    def value(self, name, **labels):
+        """Return a counter value, or a histogram's observation count"""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            if name in self._counters:
+                return self._counters[name].get(key, 0)
+            return self._histograms.get(name, {}).get(key, (None, 0.0, 0))[2]
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines += self._header(name)
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_labels(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                lines += self._header(name)
+                for key, (counts, total, count) in sorted(series.items()):
+                    cumulative = 0
+                    for bound, bucket in zip(self.buckets, counts):
+                        cumulative += bucket
+                        lines.append(f"{name}_bucket{_labels(key + (('le', str(bound)),))} {cumulative}")
+                    lines.append(f"{name}_bucket{_labels(key + (('le', '+Inf'),))} {count}")
+                    lines.append(f"{name}_sum{_labels(key)} {total}")
+                    lines.append(f"{name}_count{_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def _header(self, name):
+        help, kind = self._help[name]
+        return [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+
+
+def _labels(key):
+    if not key:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in key)
+    return "{" + pairs + "}"
+
+
+class MetricsServer:
+    """Serve `Metrics.render()` at /metrics from a background thread"""
+
+    def __init__(self, metrics, port, host="127.0.0.1"):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+_metrics = Metrics()
+_server = None
+_server_lock = threading.Lock()
+
+
+def shared_metrics():
+    """Return the process-wide registry every Telemetry records into"""
+    return _metrics
+
+
+def serve_metrics(port):
+    """Serve the shared registry on `port`, once per process; later calls reuse that server"""
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = MetricsServer(_metrics, port)
+        return _server
+
+
+class _Usage:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.llm_calls = 0
+        self.cache_hits = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.retries = 0
+
+    def add(self, prompt_tokens=0, completion_tokens=0, cache_hit=False, retry=False):
+        with self._lock:
+            if retry:
+                self.retries += 1
+                return
+            self.llm_calls += 1
+            self.cache_hits += cache_hit
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def fields(self):
+        with self._lock:
+            return {
+                "llm_calls": self.llm_calls,
+                "cache_hits": self.cache_hits,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "retries": self.retries,
+            }
+
+
+class _CrewTrace(_Usage):
+    def __init__(self, telemetry, span, service, full, usage=None):
+        super().__init__()
+        self.telemetry = telemetry
+        self.span = span
+        self.service = service
+        self.run_id = uuid.uuid4().hex
+        self.full = full
+        # Usage of the enclosing Telemetry.measure() block, if any
+        self.usage = usage
+
+    def add(self, **usage):
+        super().add(**usage)
+        if self.usage is not None:
+            self.usage.add(**usage)
+
+
+class _TaskTrace(_Usage):
+    def __init__(self, crew, span, role):
+        super().__init__()
+        self.crew = crew
+        self.telemetry = crew.telemetry
+        self.span = span
+        self.role = role
+        self.last_step = time.time_ns()
+        self.status = None
+        self.duration = None
+
+    def add(self, **usage):
+        super().add(**usage)
+        self.crew.add(**usage)
+
+
+class Telemetry:
+    """Record crew runs, tasks, agent steps and LLM calls as spans, metrics and logs.
+
+    Spans go to `exporter` (an OTLP/JSON file when FINANCE_TRACE_PATH is set).
+    Metrics go to the process-wide registry, served once per process on
+    FINANCE_METRICS_PORT when it is set, so several crews share one endpoint. A private
+    tracer provider is used so CrewAI's own telemetry is left untouched.
+    Run summaries and full traces are written through `log` (see RunLog).
+    """
+
+    def __init__(self, exporter=None, metrics_port=None, log=None):
+        self.provider = TracerProvider(resource=Resource.create({"service.name": "finance-crew"}))
+        if exporter is not None:
+            self.provider.add_span_processor(BatchSpanProcessor(exporter))
+        self.tracer = self.provider.get_tracer("finance-crew")
+        self.metrics = shared_metrics()
+        self.log = log or RunLog(mode="quiet")
+        self.handler = TelemetryHandler(self)
+        self.server = serve_metrics(metrics_port) if metrics_port is not None else None
+
+    @classmethod
+    def from_env(cls):
+        path = os.getenv("FINANCE_TRACE_PATH")
+        port = os.getenv("FINANCE_METRICS_PORT")
+        return cls(
+            exporter=OTLPJsonFileExporter(path) if path else None,
+            metrics_port=int(port) if port else None,
+            log=RunLog.from_env(),
+        )
+
+    def start_span(self, name, parent=None, attributes=None, start_time=None):
+        context = trace.set_span_in_context(parent) if parent is not None else None
+        return self.tracer.start_span(name, context=context, attributes=attributes, start_time=start_time)
+
+    @contextmanager
+    def crew_span(self, service, crew):
+        """Trace one crew run; tasks started on this thread become its children.
+
+        Yields the run, whose run_id and fields() (LLM usage so far) identify and total it.
+        """
+        span = self.start_span(f"crew.{service}", attributes={
+            "crew.service": service,
+            "crew.tasks": len(crew.tasks),
+            "crew.agents": [agent.role for agent in crew.agents],
+        })
+        run = _CrewTrace(self, span, service, self.log.wants_full_trace(), getattr(_current, "usage", None))
+        previous = getattr(_current, "trace", None)
+        _current.trace = run
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            yield run
+        except BaseException as e:
+            status = "cancelled" if type(e).__name__ == "CrewCancelled" else "error"
+            span.record_exception(e)
+            span.set_status(Status(StatusCode.ERROR, str(e)))
+            self.log.error("crew.error", run_id=run.run_id, service=service, error=repr(e))
+            raise
+        finally:
+            _current.trace = previous
+            span.end()
+            duration = time.perf_counter() - started
+            self.metrics.inc("finance_crew_runs_total", {"service": service, "status": status},
+                             help="Crew runs by service and outcome")
+            self.metrics.observe("finance_crew_duration_seconds", {"service": service},
+                                 duration, help="Crew run latency")
+            self.log.summary("crew", run_id=run.run_id, service=service, status=status,
+                             duration_s=round(duration, 4), tasks=len(crew.tasks), **run.fields())
+
+    @contextmanager
+    def measure(self):
+        """Total the LLM usage of the crew runs started on this thread inside the block.
+
+        Yields an object whose fields() are filled in as the runs make LLM calls.
+        """
+        usage = _Usage()
+        previous = getattr(_current, "usage", None)
+        _current.usage = usage
+        try:
+            yield usage
+        finally:
+            _current.usage = previous
+
+    @contextmanager
+    def task_span(self, run, task, agent):
+        span = self.start_span("task", run.span, attributes={
+            "task.agent": agent.role,
+            "task.async": task.async_execution,
+            "task.description": task.description[:200],
+        })
+        previous = getattr(_current, "task", None)
+        _current.task = task_trace = _TaskTrace(run, span, agent.role)
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            yield task_trace
+        except BaseException as e:
+            status = "error"
+            span.record_exception(e)
+            span.set_status(Status(StatusCode.ERROR, str(e)))
+            raise
+        finally:
+            _current.task = previous
+            span.end()
+            duration = time.perf_counter() - started
+            task_trace.status, task_trace.duration = status, duration
+            self.metrics.observe("finance_task_duration_seconds", {"role": agent.role},
+                                 duration, help="Task latency by agent role")
+            self.log.summary("task", run_id=run.run_id, service=run.service, role=agent.role,
+                             status=status, duration_s=round(duration, 4), **task_trace.fields())
+
+    def step_callback(self, step_output):
+        """Crew step callback recording each agent step since the previous one"""
+        task = getattr(_current, "task", None)
+        if task is None or task.telemetry is not self:
+            return
+        now = time.time_ns()
+        actions = step_output if isinstance(step_output, list) else [step_output]
+        actions = [action[0] if isinstance(action, tuple) else action for action in actions]
+        tools = [tool for tool in (getattr(action, "tool", None) for action in actions) if tool]
+        # CrewAI answers unparsable output with an "_Exception" step and retries
+        retry = "_Exception" in tools
+        span = self.start_span("agent.step", task.span, start_time=task.last_step, attributes={
+            "agent.role": task.role,
+            "agent.tools": tools,
+            "agent.retry": retry,
+        })
+        span.end(end_time=now)
+        if retry:
+            task.add(retry=True)
+            self.metrics.inc("finance_agent_retries_total", {"role": task.role},
+                             help="Agent steps retried after unparsable LLM output")
+        if task.crew.full:
+            self.log.trace("agent.step", run_id=task.crew.run_id, role=task.role, tools=tools,
+                           retry=retry, duration_s=round((now - task.last_step) / 1e9, 4),
+                           log=[getattr(action, "log", "") for action in actions])
+        task.last_step = now
+
+    def shutdown(self):
+        self.provider.shutdown()
+        # The metrics server is shared by every crew in the process and outlives this one
+        self.log.close()
+
+
+class TelemetryHandler(RoleAwareHandler):
+    """LLM callback handler that records one span per LLM call"""
+
+    def __init__(self, telemetry, model="gpt-3.5-turbo"):
+        self.telemetry = telemetry
+        self.model = model
+        self._lock = threading.Lock()
+        self._runs = {}
+
+    def on_agent_llm_start(self, run_id, role, prompt):
+        # LLM callbacks run on the thread executing the task
+        task = getattr(_current, "task", None)
+        if task is not None and task.telemetry is not self.telemetry:
+            task = None
+        prompt_tokens = count_tokens(prompt, self.model)
+        span = self.telemetry.start_span("llm.call", task.span if task else None, attributes={
+            "agent.role": role,
+            "llm.prompt_tokens": prompt_tokens,
+        })
+        with self._lock:
+            self._runs[run_id] = (span, role, task, prompt, prompt_tokens, time.perf_counter())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        span, role, task, prompt, prompt_tokens, started = run
+        duration = time.perf_counter() - started
+        llm_output = response.llm_output or {}
+        cache_hit = bool(llm_output.get("cache_hit"))
+        usage = llm_output.get("token_usage") or {}
+        text = "".join(g.text for gens in response.generations for g in gens)
+        prompt_tokens = usage.get("prompt_tokens", prompt_tokens)
+        completion_tokens = usage.get("completion_tokens", count_tokens(text, self.model))
+        span.set_attributes({
+            "llm.prompt_tokens": prompt_tokens,
+            "llm.completion_tokens": completion_tokens,
+            "llm.cache_hit": cache_hit,
+        })
+        span.end()
+
+        metrics = self.telemetry.metrics
+        metrics.inc("finance_llm_calls_total", {"role": role, "cache": "hit" if cache_hit else "miss"},
+                    help="LLM calls by agent role and response cache outcome")
+        metrics.observe("finance_llm_duration_seconds", {"role": role},
+                        duration, help="LLM call latency by agent role")
+        if not cache_hit:
+            metrics.inc("finance_llm_tokens_total", {"role": role, "type": "prompt"}, prompt_tokens,
+                        help="LLM tokens spent by agent role")
+            metrics.inc("finance_llm_tokens_total", {"role": role, "type": "completion"}, completion_tokens)
+
+        if task is None:
+            return
+        # Cache hits spend no tokens
+        task.add(prompt_tokens=0 if cache_hit else prompt_tokens,
+                 completion_tokens=0 if cache_hit else completion_tokens, cache_hit=cache_hit)
+        if task.crew.full:
+            self.telemetry.log.trace(
+                "llm.call", run_id=task.crew.run_id, role=role, duration_s=round(duration, 4),
+                cache_hit=cache_hit, prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens, prompt=prompt, response=text,
+            )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        span, role, task = run[:3]
+        span.record_exception(error)
+        span.set_status(Status(StatusCode.ERROR, str(error)))
+        span.end()
+        self.telemetry.metrics.inc("finance_llm_errors_total", {"role": role},
+                                   help="Failed LLM calls by agent role")
+        self.telemetry.log.error("llm.error", run_id=task.crew.run_id if task else None,
+                                 role=role, error=repr(error))
+
+
+class TracedTask(Task):
+    """Task that records its execution as a child span of the current crew run"""
+
+    _trace = PrivateAttr(default=None)
+    # Status, duration and LLM usage of the last execution
+    _task_trace = PrivateAttr(default=None)
+
+    def execute(self, agent=None, context=None, tools=None):
+        # Runs on the crew's thread, before async tasks move to their own
+        self._trace = getattr(_current, "trace", None)
+        return super().execute(agent=agent, context=context, tools=tools)
+
+    def _execute(self, agent, task, context, tools):
+        if self._trace is None:
+            return super()._execute(agent, task, context, tools)
+        with self._trace.telemetry.task_span(self._trace, task, agent) as self._task_trace:
+            return super()._execute(agent, task, context, tools)
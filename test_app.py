@@ -14,6 +14,34 @@ def test_imports():
         print(f"❌ Import error: {e}")
         return False
 
+def test_lazy_startup():
+    """Test if creating a FinanceCrew imports no framework and builds no LLM until a crew runs"""
+    try:
+        import subprocess
+        import sys
+        from main import FinanceCrew
+        from mock_llm import MockChatModel
+        
+        check = (
+            "import sys, main; crew = main.FinanceCrew(); "
+            "print(sorted(m for m in ('crewai', 'langchain_core', 'langchain_openai', 'openai') if m in sys.modules))"
+        )
+        output = subprocess.run([sys.executable, "-c", check], capture_output=True, text=True, check=True).stdout
+        assert output.strip() == "[]", output
+        
+        # Attributes are built on first access, keeping ones assigned before that
+        finance_crew = FinanceCrew(llm=MockChatModel(response_tokens=10))
+        assert "agents" not in vars(finance_crew)
+        finance_crew.plan_cache = None
+        assert finance_crew.tasks.memo is finance_crew.task_memo and finance_crew.plan_cache is None
+        assert finance_crew.agents._llm is not None
+        
+        print("✅ Lazy startup successful")
+        return True
+    except Exception as e:
+        print(f"❌ Lazy startup error: {e}")
+        return False
+
 def test_agent_creation():
     """Test if agents can be created successfully"""
     try:
@@ -56,6 +84,1153 @@ def test_task_creation():
         print(f"❌ Task creation error: {e}")
         return False
 
+def test_task_dependencies():
+    """Test if independent tasks run asynchronously and feed their dependents"""
+    try:
+        from agents import FinanceAgents
+        from tasks import FinanceTasks
+        
+        agents = FinanceAgents()
+        tasks = FinanceTasks()
+        
+        analyst = agents.financial_analyst_agent()
+        risk_analyst = agents.risk_assessment_agent()
+        advisor = agents.investment_advisor_agent()
+        
+        analysis = tasks.financial_analysis_task(analyst, "Apple Inc.", async_execution=True)
+        risk = tasks.risk_assessment_task(risk_analyst, "Apple Inc.", async_execution=True)
+        advisory = tasks.investment_advisory_task(advisor, "Apple Inc.", context=[analysis, risk])
+        
+        assert analysis.async_execution and risk.async_execution
+        assert not advisory.async_execution
+        assert advisory.context == [analysis, risk]
+        
+        # A failed concurrent branch fails the run instead of feeding partial context
+        from main import FinanceCrew
+        from mock_llm import MockChatModel
+        
+        class FailingAnalystModel(MockChatModel):
+            def respond(self, prompt):
+                if "You are Financial Analyst." in prompt:
+                    raise RuntimeError("analyst unavailable")
+                return super().respond(prompt)
+        
+        finance_crew = FinanceCrew(llm=FailingAnalystModel(response_tokens=10), task_memo=False)
+        try:
+            finance_crew.run_investment_analysis("Apple Inc.")
+            assert False, "a failed branch should fail the run"
+        except RuntimeError as e:
+            assert "analyst unavailable" in str(e)
+        
+        print("✅ Task dependency wiring successful")
+        return True
+    except Exception as e:
+        print(f"❌ Task dependency error: {e}")
+        return False
+
+def test_async_api():
+    """Test if async runs return results, time out, cancel their crew and return pooled agents"""
+    try:
+        import asyncio
+        from main import FinanceCrew
+        from mock_llm import MockChatModel
+        
+        crews, limits = [], []
+        
+        class LimitRecordingModel(MockChatModel):
+            def respond(self, prompt):
+                limits.append({agent.max_execution_time for agent in crews[-1].agents})
+                return super().respond(prompt)
+        
+        finance_crew = FinanceCrew(llm=LimitRecordingModel(response_tokens=10, latency=0.3), task_memo=False)
+        agents = finance_crew.agents
+        build_crew = finance_crew._crew
+        finance_crew._crew = lambda **kwargs: crews.append(build_crew(**kwargs)) or crews[-1]
+        
+        async def main():
+            # Runs on the thread pool, with the per-task limit on every agent
+            result = await finance_crew.arun_investment_analysis("AAPL", timeout=30, task_timeout=20)
+            assert result.startswith("Investment Advisor summary:")
+            try:
+                await finance_crew.arun_financial_analysis("MSFT", timeout=0.1, task_timeout=20)
+                assert False, "the run should time out"
+            except asyncio.TimeoutError:
+                pass
+        
+        asyncio.run(main())
+        assert limits and all(limit == {20} for limit in limits)
+        # The timed-out crew stops at its next agent step instead of running to the end
+        finance_crew._executor.shutdown(wait=True)
+        assert finance_crew.telemetry.metrics.value(
+            "finance_crew_runs_total", service="financial_analysis", status="cancelled"
+        ) >= 1
+        
+        # Every checked-out agent is back in its pool with its time limit cleared
+        for role in agents.roles:
+            pooled = list(agents._pools[role].queue)
+            assert len(pooled) == agents._pool_counts[role]
+            assert all(agent.max_execution_time is None for agent in pooled)
+        assert len(agents._pools["financial_analyst"].queue) >= 1
+        
+        print("✅ Async API successful")
+        return True
+    except Exception as e:
+        print(f"❌ Async API error: {e}")
+        return False
+
+def test_crew_registry():
+    """Test if crews.yaml compiles into validated task graphs and new services need no code"""
+    try:
+        import copy
+        import yaml
+        from crew_registry import DEFAULT_PATH, CrewConfigError, CrewRegistry, Template, shared_registry
+        
+        registry = shared_registry()
+        assert registry.services() == ["financial_analysis", "personal_finance_planning", "investment_analysis"]
+        graph = registry.crew("investment_analysis")
+        assert graph.stages == (("financial_analysis", "risk_assessment"), ("investment_advisory",))
+        assert graph.critical_path == 2 and not graph.warnings
+        speculative = registry.crew("personal_finance_planning", "speculative")
+        assert speculative.stages[1] == ("review_draft", "investment_advisory")
+        assert speculative.finish == ("reconcile", "review_draft")
+        # Crews without the variant fall back to their default graph
+        assert registry.crew("financial_analysis", "speculative") is registry.crew("financial_analysis")
+        
+        # Constants are filled and whitespace compacted once; requests only fill slots
+        template = Template("""
+            Review {subject}
+            for {quarter}.""", {"quarter": "Q3"}, {"subject"})
+        assert template.slots == ("subject",)
+        assert template.fill(subject="AAPL") == "Review AAPL\nfor Q3."
+        assert "for Apple Inc.." in registry.tasks["financial_analysis"].description.fill(subject="Apple Inc.")
+        
+        with open(DEFAULT_PATH) as f:
+            config = yaml.safe_load(f)
+        
+        def broken(change):
+            bad = copy.deepcopy(config)
+            change(bad)
+            try:
+                CrewRegistry(bad)
+            except CrewConfigError as e:
+                return str(e)
+            raise AssertionError("invalid crew definition accepted")
+        
+        crews = lambda bad: bad["crews"]["investment_analysis"]["tasks"]
+        assert "unknown agent" in broken(lambda bad: crews(bad)[0].update(agent="trader"))
+        assert "not a task declared before it" in broken(lambda bad: crews(bad).reverse())
+        assert "not read by any later task" in broken(lambda bad: crews(bad)[2].update(context=["risk_assessment"]))
+        assert "Unknown template slot" in broken(lambda bad: crews(bad)[2].update(input="{ticker}"))
+        assert "unknown finish hook" in broken(
+            lambda bad: bad["crews"]["personal_finance_planning"]["variants"]["speculative"].update(finish={"merge": "review_draft"})
+        )
+        
+        # A new service is one YAML entry, and independent sync tasks are flagged
+        config["crews"]["quick_check"] = {"tasks": [
+            {"task": "risk_assessment", "agent": "risk_assessment", "input": "{request} quick check"},
+            {"task": "financial_analysis", "agent": "financial_analyst"},
+        ]}
+        custom = CrewRegistry(config)
+        assert custom.crew("quick_check").stages == (("risk_assessment", "financial_analysis"),)
+        assert "mark risk_assessment async" in custom.crew("quick_check").warnings[0]
+        
+        from main import FinanceCrew
+        from mock_llm import MockChatModel
+        
+        finance_crew = FinanceCrew(llm=MockChatModel(response_tokens=10), task_memo=False, registry=custom)
+        assert finance_crew.run("quick_check", "AAPL").startswith("Financial Analyst summary:")
+        try:
+            finance_crew.run("tax_planning", "AAPL")
+            assert False, "unknown services should be rejected"
+        except ValueError:
+            pass
+        
+        print("✅ Crew registry successful")
+        print(f"   - {graph.describe()}")
+        return True
+    except Exception as e:
+        print(f"❌ Crew registry error: {e}")
+        return False
+
+def test_structured_outputs():
+    """Test if task outputs are validated against their schema and passed on as compact JSON"""
+    try:
+        import json
+        from callbacks import RoleAwareHandler
+        from main import FinanceCrew
+        from mock_llm import MockChatModel
+        from schemas import RiskAssessment
+        
+        budget = {
+            "monthly_income": 5000,
+            "line_items": [{"category": "Rent", "kind": "fixed", "monthly_amount": 1500, "percent_of_income": 30}],
+            "emergency_fund_target": 18000,
+        }
+        risk = {"subject": "AAPL", "metrics": {"beta": 1.2, "var_95": 0.021}, "summary": "Moderate risk"}
+        prompts = []
+        
+        class JsonModel(MockChatModel):
+            def respond(self, prompt):
+                prompts.append(prompt)
+                answer = {"Budget Planning Advisor": budget, "Risk Assessment Specialist": risk}.get(
+                    RoleAwareHandler.role_from_prompt(prompt)
+                )
+                if answer is None:
+                    return super().respond(prompt)
+                return f"Thought: I now know the final answer\nFinal Answer: ```json\n{json.dumps(answer, indent=2)}\n```"
+        
+        finance_crew = FinanceCrew(llm=JsonModel(response_tokens=10), plan_cache=False, task_memo=False)
+        finance_crew.run_personal_finance_planning("Age: 30, Income: $60,000, Goals: House")
+        advisor_prompt = next(p for p in prompts if "You are Investment Advisor." in p)
+        assert '{"monthly_income":5000.0,"line_items":[{"category":"Rent"' in advisor_prompt
+        assert '"monthly_income": 5000' not in advisor_prompt
+        
+        # A schema'd final task returns its validated JSON; prose answers pass through unchanged
+        result = finance_crew.run_financial_analysis("AAPL")
+        assert RiskAssessment.model_validate_json(result).metrics["beta"] == 1.2
+        assert finance_crew.run_investment_analysis("AAPL").startswith("Investment Advisor summary:")
+        
+        # The context budget trims the JSON downstream tasks read, not the prose it replaced
+        from prompt_budget import PromptBudget
+        
+        budget["line_items"] = [
+            {"category": f"Item {i}", "kind": "variable", "monthly_amount": 10 + i, "percent_of_income": 0.2}
+            for i in range(60)
+        ]
+        prompts.clear()
+        trimmed_crew = FinanceCrew(llm=JsonModel(response_tokens=10), plan_cache=False, task_memo=False)
+        trimmed_crew.budget = PromptBudget(context_tokens=60)
+        trimmed_crew.run_personal_finance_planning("Age: 30, Income: $60,000, Goals: House")
+        advisor_prompt = next(p for p in prompts if "You are Investment Advisor." in p)
+        assert '{"monthly_income":5000.0,"line_items":[{"category":"Item 0"' in advisor_prompt
+        assert "[... trimmed to fit the context budget ...]" in advisor_prompt
+        assert '"Item 30"' not in advisor_prompt and "```json" not in advisor_prompt
+        
+        print("✅ Structured outputs successful")
+        return True
+    except Exception as e:
+        print(f"❌ Structured outputs error: {e}")
+        return False
+
+def test_speculative_review():
+    """Test if the review is drafted alongside the investment task and kept only when approved"""
+    try:
+        import time
+        from main import FinanceCrew
+        from mock_llm import MockChatModel
+        
+        started = {}
+        
+        class ReviewerModel(MockChatModel):
+            def respond(self, prompt):
+                if "Draft a comprehensive financial review" in prompt:
+                    started["draft"] = time.monotonic()
+                elif "You are Investment Advisor." in prompt:
+                    started["investment"] = time.monotonic()
+                if "answer with exactly APPROVED" in prompt:
+                    return f"Thought: I now know the final answer\nFinal Answer: {started['verdict']}"
+                return super().respond(prompt)
+        
+        profile = "Age: 30, Income: $60,000, Goals: House"
+        finance_crew = FinanceCrew(
+            llm=ReviewerModel(response_tokens=10, latency=0.3), plan_cache=False, task_memo=False,
+            speculative_review=True
+        )
+        metrics = finance_crew.telemetry.metrics
+        kept = metrics.value("finance_speculative_review_total", outcome="kept")
+        
+        started["verdict"] = "APPROVED"
+        plan = finance_crew.run_personal_finance_planning(profile)
+        assert plan.startswith("Financial Analyst summary:")
+        assert abs(started["draft"] - started["investment"]) < 0.2
+        assert metrics.value("finance_speculative_review_total", outcome="kept") == kept + 1
+        
+        # A rejected draft is replaced by the corrected review
+        started["verdict"] = "Corrected review: rebalance toward bonds"
+        assert finance_crew.run_personal_finance_planning(profile) == started["verdict"]
+        
+        print("✅ Speculative review successful")
+        return True
+    except Exception as e:
+        print(f"❌ Speculative review error: {e}")
+        return False
+
+def test_response_cache():
+    """Test if the LLM response cache stores, expires and evicts entries"""
+    try:
+        import os
+        import tempfile
+        from langchain_core.messages import AIMessage
+        from langchain_core.outputs import ChatGeneration
+        from llm_cache import ResponseCache
+        
+        path = os.path.join(tempfile.mkdtemp(), "cache.sqlite")
+        cache = ResponseCache(path, ttl=60, max_entries=2)
+        answer = [ChatGeneration(message=AIMessage(content="Final Answer: 42"))]
+        
+        assert cache.lookup("prompt", "gpt-3.5-turbo") is None
+        cache.update("prompt", "gpt-3.5-turbo", answer)
+        assert cache.lookup("prompt", "gpt-3.5-turbo")[0].text == "Final Answer: 42"
+        assert cache.lookup("prompt", "gpt-4") is None
+        
+        cache.update("second", "gpt-3.5-turbo", answer)
+        cache.update("third", "gpt-3.5-turbo", answer)
+        stats = cache.stats()
+        assert stats["entries"] == 2 and stats["evictions"] == 1
+        assert stats["hits"] == 1 and stats["misses"] == 2
+        
+        print("✅ Response cache successful")
+        print(f"   - Stats: {stats}")
+        return True
+    except Exception as e:
+        print(f"❌ Response cache error: {e}")
+        return False
+
+def test_batch_analysis():
+    """Test if batch analysis streams results and resumes from its checkpoint"""
+    try:
+        import os
+        import tempfile
+        from batch import BatchAnalyzer
+        
+        class StubCrew:
+            def __init__(self):
+                self.analyzed = []
+            
+            def run_financial_analysis(self, company_name):
+                self.analyzed.append(company_name)
+                return f"Report for {company_name}"
+        
+        checkpoint = os.path.join(tempfile.mkdtemp(), "batch.jsonl")
+        first = StubCrew()
+        results = list(BatchAnalyzer(first, concurrency=2, checkpoint_path=checkpoint).run(["AAPL", "MSFT"]))
+        assert sorted(r["company"] for r in results) == ["AAPL", "MSFT"]
+        
+        resumed = StubCrew()
+        list(BatchAnalyzer(resumed, concurrency=2, checkpoint_path=checkpoint).run(["AAPL", "MSFT", "GOOG"]))
+        assert resumed.analyzed == ["GOOG"]
+        
+        # Runs are charged their actual token usage, not the per-run reservation
+        from batch import TokenBudget
+        from main import FinanceCrew
+        from mock_llm import MockChatModel
+        
+        analyzer = BatchAnalyzer(FinanceCrew(llm=MockChatModel(response_tokens=10), task_memo=False),
+                                 tokens_per_minute=60000, tokens_per_run=100)
+        (record,) = analyzer.run(["MSFT"])
+        assert record["tokens"] > 100
+        # The bucket refills at 1000 tokens a second while the run is in flight
+        assert analyzer.budget.available <= 60000 - record["tokens"] + 1000 * (record["elapsed"] + 0.5)
+        budget = TokenBudget(600)
+        budget.acquire(100)
+        budget.settle(100, 900)
+        assert budget.available < 0
+        
+        print("✅ Batch analysis successful")
+        return True
+    except Exception as e:
+        print(f"❌ Batch analysis error: {e}")
+        return False
+
+def test_agent_pool():
+    """Test if pooled agents are reused and never shared between concurrent checkouts"""
+    try:
+        from agents import FinanceAgents
+        
+        agents = FinanceAgents(pool_size=2)
+        
+        with agents.checkout("financial_analyst", "risk_assessment") as (analyst, risk_analyst):
+            assert analyst.role == "Financial Analyst"
+            assert risk_analyst.role == "Risk Assessment Specialist"
+            with agents.checkout("financial_analyst") as (second_analyst,):
+                assert second_analyst is not analyst
+        
+        with agents.checkout("financial_analyst") as (reused,):
+            assert reused in (analyst, second_analyst)
+        
+        # Each agent counts tokens on its own model copy, and a returned agent's counts are reset
+        from crewai.utilities.token_counter_callback import TokenCalcHandler
+        from mock_llm import MockChatModel
+        
+        class NamedModel(MockChatModel):
+            model_name: str = "gpt-3.5-turbo"
+        
+        def counters(llm):
+            return [handler for handler in llm.callbacks if isinstance(handler, TokenCalcHandler)]
+        
+        named = FinanceAgents(pool_size=3, llm=NamedModel())
+        with named.checkout("budget_planner", "financial_analyst") as built:
+            built[0]._token_process.sum_prompt_tokens(7)
+        with named.checkout("budget_planner") as (planner,):
+            pass
+        assert not counters(named.llm)
+        for agent in built:
+            assert [handler.token_cost_process for handler in counters(agent.llm)] == [agent._token_process]
+        assert planner is built[0] and planner._token_process.total_tokens == 0
+        
+        print("✅ Agent pool successful")
+        return True
+    except Exception as e:
+        print(f"❌ Agent pool error: {e}")
+        return False
+
+def test_risk_metrics():
+    """Test if the risk engine computes known values from a price series"""
+    try:
+        import numpy as np
+        from risk_metrics import beta, max_drawdown, risk_summary, simple_returns
+        
+        market = 100 * np.cumprod(1 + np.random.default_rng(0).normal(0.0005, 0.01, 500))
+        levered = 100 * np.cumprod(1 + 2 * simple_returns(np.concatenate([[100.0], market])))
+        
+        assert abs(beta(simple_returns(levered), simple_returns(market)) - 2.0) < 1e-6
+        assert abs(max_drawdown([100, 120, 90, 130]) - 0.25) < 1e-9
+        
+        summary = risk_summary(levered, market_prices=market)
+        assert summary["cvar"] >= summary["historical_var"] > 0
+        
+        # Series with different start and end dates are joined on dates for beta
+        dates = np.datetime64("2020-01-01") + np.arange(500)
+        shifted = risk_summary(levered[:450], dates=dates[:450], market_prices=market[30:], market_dates=dates[30:])
+        assert abs(shifted["beta"] - 2.0) < 1e-6
+        
+        # Too little history is reported instead of producing nan or negative VaR
+        for short in ([100.0], [100.0, 101.0, 99.0]):
+            try:
+                risk_summary(np.array(short))
+                raise AssertionError("short history accepted")
+            except ValueError as e:
+                assert "Insufficient price history" in str(e)
+        
+        print("✅ Risk metrics successful")
+        print(f"   - Beta: {summary['beta']:.2f}, 95% VaR: {summary['historical_var']:.2%}")
+        return True
+    except Exception as e:
+        print(f"❌ Risk metrics error: {e}")
+        return False
+
+def test_planning():
+    """Test if the planning engine reproduces known loan, debt, savings and allocation results"""
+    try:
+        import numpy as np
+        from planning import (amortization_schedule, debt_payoff, mean_variance_weights, portfolio_stats,
+                              risk_parity_weights, savings_projection)
+        
+        # 200,000 at 6% over 30 years is the textbook 1,199.10 a month
+        schedule = amortization_schedule(200000, 0.06, 360)
+        assert abs(schedule["payment"][0] - 1199.10) < 0.01
+        assert abs(schedule["balance"][-1]) < 1e-6
+        assert abs(schedule["principal"].sum() - 200000) < 1e-6
+        
+        debts = ([5000, 12000, 800], [0.22, 0.065, 0.18], [150, 300, 25])
+        avalanche = debt_payoff(*debts, 900, strategy="avalanche")
+        snowball = debt_payoff(*debts, 900, strategy="snowball")
+        assert avalanche["total_interest"] <= snowball["total_interest"]
+        assert avalanche["order"][0] == 0 and snowball["order"][0] == 2
+        try:
+            debt_payoff(*debts, 400)
+            raise AssertionError("budget below the minimum payments accepted")
+        except ValueError:
+            pass
+        
+        projection = savings_projection(20000, 500, 0.05, 120, target=100000)
+        exact = savings_projection(20000, projection["required_contribution"], 0.05, 120)
+        assert abs(exact["final_balance"] - 100000) < 1e-6
+        
+        rng = np.random.default_rng(0)
+        factors = rng.normal(size=(4, 4))
+        cov = factors @ factors.T / 10 + np.eye(4) * 0.01
+        mean = np.array([0.08, 0.04, 0.06, 0.05])
+        parity = portfolio_stats(risk_parity_weights(cov), mean, cov)
+        assert np.allclose(parity["risk_contributions"], 0.25, atol=1e-6)
+        weights = mean_variance_weights(mean, cov, risk_aversion=3.0)
+        assert abs(weights.sum() - 1) < 1e-9 and (weights >= 0).all()
+        # No long-only portfolio scores better on the same objective
+        score = lambda w: w @ mean - 1.5 * w @ cov @ w
+        for w in rng.dirichlet(np.ones(4), 200):
+            assert score(w) <= score(weights) + 1e-9
+        
+        # The allocation tool joins the tickers' local prices on their shared dates
+        import csv
+        import os
+        import tempfile
+        from unittest import mock
+        from tools import portfolio_allocation_tool
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "prices.csv")
+            dates = np.datetime64("2022-01-03") + np.arange(300)
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["date", "ticker", "close"])
+                for ticker, scale, start in (("SPY", 0.012, 0), ("AGG", 0.004, 20)):
+                    closes = 100 * np.cumprod(1 + rng.normal(0.0003, scale, 300))
+                    writer.writerows((str(d), ticker, c) for d, c in zip(dates[start:], closes[start:]))
+            with mock.patch.dict(os.environ, {"FINANCE_PRICE_HISTORY": path, "FINANCE_MARKET_DATA": ""}):
+                report = portfolio_allocation_tool.run("SPY AGG risk_aversion=4")
+        assert "from 279 shared trading days" in report and "Risk parity" in report, report
+        
+        print("✅ Planning engine successful")
+        print(f"   - Avalanche interest: {avalanche['total_interest']:,.2f}, snowball: {snowball['total_interest']:,.2f}")
+        return True
+    except Exception as e:
+        print(f"❌ Planning engine error: {e}")
+        return False
+
+def test_stress_testing():
+    """Test if the stress engine is reproducible and its scenarios follow betas and history"""
+    try:
+        import numpy as np
+        from stress import format_stress, simulate, stress_test, window_return
+        
+        # Chunks are seeded independently, so a process pool draws the same paths
+        totals, drawdowns = simulate(0.0, 0.01, horizon=21, paths=40_000, dof=None, chunk=10_000)
+        pooled, _ = simulate(0.0, 0.01, horizon=21, paths=40_000, dof=None, chunk=10_000, processes=2)
+        assert np.array_equal(totals, pooled)
+        assert abs(-np.quantile(totals, 0.05) - 1.645 * 0.01 * np.sqrt(21)) < 0.003
+        assert (drawdowns >= np.maximum(-totals, 0) - 1e-12).all()
+        
+        rng = np.random.default_rng(0)
+        dates = np.datetime64("2019-01-02") + np.arange(700)
+        market = 100 * np.cumprod(1 + rng.normal(0.0003, 0.01, 700))
+        levered = 100 * np.cumprod(1 + 2 * (market[1:] / market[:-1] - 1))
+        history = {"SPY": (dates, market), "LEV": (dates[1:], levered)}
+        result = stress_test({"LEV": 50, "SPY": 50}, history, paths=20_000)
+        scenarios = {s["name"]: s for s in result["scenarios"]}
+        # Beta 1.5 to the market; 2020 is replayed from prices, 2008 is not covered
+        assert abs(scenarios["Equity market -20%"]["return"] + 0.30) < 1e-9
+        covid = [window_return(*history[t], "2020-02-19", "2020-03-23") for t in ("LEV", "SPY")]
+        assert abs(scenarios["2020 COVID crash (replay)"]["return"] - np.mean(covid)) < 1e-9
+        assert abs(scenarios["2008 financial crisis (replay)"]["return"] - 1.5 * -0.47) < 1e-9
+        assert scenarios["Rates +100bp"]["return"] is None
+        
+        table = format_stress(result)
+        assert "| Equity market -20% | -30.0% | beta to SPY |" in table
+        assert stress_test({"LEV": 1}, history, paths=20_000)["monte_carlo"] == \
+            stress_test({"LEV": 1}, history, paths=20_000)["monte_carlo"]
+        
+        print("✅ Stress testing successful")
+        print(f"   - 95% 21-day VaR: {result['monte_carlo']['var_95']:.1%}")
+        return True
+    except Exception as e:
+        print(f"❌ Stress testing error: {e}")
+        return False
+
+def test_streaming_printer():
+    """Test if streamed answers print per agent without interleaving"""
+    try:
+        import io
+        import uuid
+        from langchain_core.outputs import LLMResult
+        from callbacks import StreamingPrinter
+        
+        out = io.StringIO()
+        printer = StreamingPrinter(stream=out)
+        analyst, risk = uuid.uuid4(), uuid.uuid4()
+        printer.on_llm_start({}, ["You are Financial Analyst. Seasoned analyst"], run_id=analyst)
+        printer.on_llm_start({}, ["You are Risk Assessment Specialist. Risk expert"], run_id=risk)
+        
+        for token in ["Thought: done\n", "Final Answer:", " Revenue", " grew"]:
+            printer.on_llm_new_token(token, run_id=analyst)
+        for token in ["Final Answer:", " Beta", " 1.1"]:
+            printer.on_llm_new_token(token, run_id=risk)
+        printer.on_llm_end(LLMResult(generations=[]), run_id=analyst)
+        printer.on_llm_end(LLMResult(generations=[]), run_id=risk)
+        
+        text = out.getvalue()
+        assert "Thought" not in text
+        assert text.index("Revenue grew") < text.index("Risk Assessment Specialist") < text.index("Beta 1.1")
+        
+        print("✅ Streaming printer successful")
+        return True
+    except Exception as e:
+        print(f"❌ Streaming printer error: {e}")
+        return False
+
+def test_prompt_budget():
+    """Test if prompts are compacted, contexts trimmed and token usage reported"""
+    try:
+        import uuid
+        from langchain_core.outputs import Generation, LLMResult
+        from prompt_budget import PromptBudget, TokenUsageTracker, compact, count_tokens
+        
+        assert compact("""
+            Line one
+            
+            
+            Line two
+            """) == "Line one\n\nLine two"
+        
+        budget = PromptBudget(context_tokens=50)
+        report = "Revenue grew strongly. " * 200
+        trimmed = budget.fit(report)
+        assert count_tokens(trimmed) < count_tokens(report)
+        assert trimmed.startswith("Revenue grew") and "trimmed" in trimmed
+        
+        tracker = TokenUsageTracker()
+        run_id = uuid.uuid4()
+        tracker.on_llm_start({}, ["You are Budget Planning Advisor. A planner"], run_id=run_id)
+        tracker.on_llm_end(LLMResult(generations=[[Generation(text="Final Answer: save more")]]), run_id=run_id)
+        usage = tracker.report()["Budget Planning Advisor"]
+        assert usage["calls"] == 1 and usage["prompt_tokens"] > 0 and usage["completion_tokens"] > 0
+        
+        print("✅ Prompt budget successful")
+        return True
+    except Exception as e:
+        print(f"❌ Prompt budget error: {e}")
+        return False
+
+def test_mock_crew_kickoff():
+    """Test if a crew runs end to end against the mock LLM"""
+    try:
+        from benchmark import union_length
+        from main import FinanceCrew
+        from mock_llm import MockChatModel
+        
+        finance_crew = FinanceCrew(llm=MockChatModel(response_tokens=10))
+        result = finance_crew.run_investment_analysis("AAPL")
+        assert result.startswith("Investment Advisor summary:")
+        assert result == finance_crew.run_investment_analysis("AAPL")
+        assert union_length([(0, 2), (1, 3), (5, 6)]) == 4
+        
+        # Concurrent benchmark iterations each run their own crew instead of sharing one
+        from benchmark import CrewBenchmark
+        
+        report = CrewBenchmark(iterations=4, concurrency=4, warmup=0, services=["run_financial_analysis"]).run()
+        assert report["services"]["run_financial_analysis"]["runs"] == 4
+        
+        print("✅ Mock crew kickoff successful")
+        return True
+    except Exception as e:
+        print(f"❌ Mock crew kickoff error: {e}")
+        return False
+
+def test_telemetry():
+    """Test if crew runs, LLM calls and tokens are recorded as metrics"""
+    try:
+        import urllib.request
+        from main import FinanceCrew
+        from mock_llm import MockChatModel
+        from telemetry import Telemetry
+        
+        finance_crew = FinanceCrew(llm=MockChatModel(response_tokens=10))
+        metrics = finance_crew.telemetry.metrics
+        names = [
+            ("finance_crew_runs_total", {"service": "financial_analysis", "status": "ok"}),
+            ("finance_llm_calls_total", {"role": "Financial Analyst", "cache": "miss"}),
+            ("finance_task_duration_seconds", {"role": "Risk Assessment Specialist"}),
+            ("finance_llm_tokens_total", {"role": "Financial Analyst", "type": "completion"}),
+        ]
+        before = [metrics.value(name, **labels) for name, labels in names]
+        finance_crew.run_financial_analysis("MSFT")
+        
+        runs, calls, tasks, tokens = [metrics.value(name, **labels) - b for (name, labels), b in zip(names, before)]
+        assert runs == calls == tasks == 1 and tokens > 0
+        text = metrics.render()
+        assert 'finance_crew_duration_seconds_bucket{service="financial_analysis",le="+Inf"}' in text
+        
+        # Every crew in the process records into one registry served on one port
+        first, second = Telemetry(metrics_port=0), Telemetry(metrics_port=0)
+        assert first.server is second.server and second.metrics is metrics
+        with urllib.request.urlopen(f"http://127.0.0.1:{first.server.port}/metrics") as response:
+            assert "finance_crew_runs_total" in response.read().decode()
+        
+        print("✅ Telemetry successful")
+        return True
+    except Exception as e:
+        print(f"❌ Telemetry error: {e}")
+        return False
+
+def test_run_log():
+    """Test if run summaries and selected full traces are logged as JSON lines"""
+    try:
+        import io
+        import json
+        from main import FinanceCrew
+        from mock_llm import MockChatModel
+        from run_log import RunLog
+        
+        finance_crew = FinanceCrew(llm=MockChatModel(response_tokens=10))
+        out = io.StringIO()
+        finance_crew.telemetry.log = RunLog(mode="summary", stream=out)
+        finance_crew.run_financial_analysis("MSFT")
+        with finance_crew.full_trace():
+            finance_crew.run_financial_analysis("AAPL")
+        finance_crew.telemetry.log.flush()
+        
+        events = [json.loads(line) for line in out.getvalue().splitlines()]
+        crews = [e for e in events if e["event"] == "crew"]
+        assert len(crews) == 2 and all(e["status"] == "ok" and e["llm_calls"] == 2 for e in crews)
+        llm_calls = [e for e in events if e["event"] == "llm.call"]
+        assert len(llm_calls) == 2 and all(e["run_id"] == crews[1]["run_id"] for e in llm_calls)
+        
+        quiet = io.StringIO()
+        log = RunLog(mode="quiet", stream=quiet)
+        log.summary("crew", service="financial_analysis")
+        log.flush()
+        assert quiet.getvalue() == ""
+        
+        print("✅ Run log successful")
+        return True
+    except Exception as e:
+        print(f"❌ Run log error: {e}")
+        return False
+
+def test_semantic_plan_cache():
+    """Test if plans are reused for near-duplicate client profiles only"""
+    try:
+        import os
+        import tempfile
+        from main import FinanceCrew
+        from mock_llm import MockChatModel
+        from semantic_cache import SemanticPlanCache, parse_profile
+        
+        numbers, texts, _ = parse_profile("Age: 35, Income: $85k, Savings: $30,000, Goals: Retirement")
+        assert numbers == {"age": 35, "income": 85000, "savings": 30000} and texts == {"goals": ["retirement"]}
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            plan_cache = SemanticPlanCache(os.path.join(tmp, "plans.sqlite"))
+            finance_crew = FinanceCrew(llm=MockChatModel(response_tokens=10), plan_cache=plan_cache)
+            hits = finance_crew.telemetry.metrics.value("finance_plan_cache_total", outcome="hit")
+            plan_cache.store(
+                "Age: 35, Income: $85,000, Savings: $30,000, Goals: Retirement planning and emergency fund",
+                "Plan for a 35-year-old earning $85,000"
+            )
+            reused = finance_crew.run_personal_finance_planning(
+                "Age: 35, Income: $86,000, Savings: $30,000, Goals: emergency fund, retirement planning"
+            )
+            assert reused == "Plan for a 35-year-old earning $86,000"
+            assert plan_cache.lookup("Age: 35, Income: $150,000, Savings: $30,000, Goals: Retirement planning") is None
+            finance_crew.run_personal_finance_planning("Age: 62, Income: $40,000, Savings: $500,000, Goals: Income")
+            assert plan_cache.stats()["entries"] == 2
+            assert plan_cache.lookup("Age: 35, Income: $85,000, Savings: $30,000, Goals: Buy a house") is None
+            assert finance_crew.telemetry.metrics.value("finance_plan_cache_total", outcome="hit") == hits + 1
+            
+            # Repeated profiles replace their plan; the least recently used plans are evicted
+            small = SemanticPlanCache(os.path.join(tmp, "small.sqlite"), max_entries=2)
+            small.store("Age: 30, Income: $50,000, Goals: Travel and savings", "Plan A")
+            small.store("Age: 30, Income: $50,000, Goals: savings, travel", "Plan A2")
+            assert small.stats()["entries"] == 1
+            small.store("Age: 50, Income: $90,000, Goals: Retirement", "Plan B")
+            assert small.lookup("Age: 30, Income: $50,000, Goals: Travel, savings") == "Plan A2"
+            small.store("Age: 70, Income: $20,000, Goals: Income", "Plan C")
+            assert small.stats()["entries"] == 2 and small.stats()["evictions"] == 1
+            assert small.lookup("Age: 50, Income: $90,000, Goals: Retirement") is None
+            
+            # Expired plans are deleted, not just skipped, and are not loaded again
+            small.ttl = 1e-9
+            small.store("Age: 40, Income: $60,000, Goals: House", "Plan D")
+            reopened = SemanticPlanCache(os.path.join(tmp, "small.sqlite"), max_entries=2)
+            assert reopened.stats()["entries"] == 1
+        
+        print("✅ Semantic plan cache successful")
+        return True
+    except Exception as e:
+        print(f"❌ Semantic plan cache error: {e}")
+        return False
+
+def test_task_memo():
+    """Test if tasks with unchanged inputs reuse their stored outputs"""
+    try:
+        import os
+        import tempfile
+        from main import FinanceCrew
+        from mock_llm import MockChatModel
+        from task_memo import TaskMemo
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            memo = TaskMemo(os.path.join(tmp, "tasks.sqlite"))
+            finance_crew = FinanceCrew(llm=MockChatModel(response_tokens=10), task_memo=memo)
+            first = finance_crew.run_investment_analysis("MSFT")
+            assert memo.stats()["misses"] == 3
+            assert finance_crew.run_investment_analysis("MSFT") == first
+            assert memo.stats()["hits"] == 3
+            
+            # The analysis task has the same input here; the risk task does not
+            calls = finance_crew.telemetry.metrics.value("finance_llm_calls_total", role="Financial Analyst", cache="miss")
+            finance_crew.run_financial_analysis("MSFT")
+            assert memo.stats()["hits"] == 4
+            assert finance_crew.telemetry.metrics.value(
+                "finance_llm_calls_total", role="Financial Analyst", cache="miss"
+            ) == calls
+            
+            # A one-field edit re-runs only the tasks that read that field
+            profile = "Age: 35, Income: $85,000, Savings: $30,000, Risk tolerance: {}, Goals: Retirement"
+            finance_crew.plan_cache = None
+            finance_crew.run_personal_finance_planning(profile.format("low"))
+            budget_calls = finance_crew.telemetry.metrics.value(
+                "finance_llm_calls_total", role="Budget Planning Advisor", cache="miss"
+            )
+            hits = memo.stats()["hits"]
+            finance_crew.run_personal_finance_planning(profile.format("high"))
+            assert memo.stats()["hits"] == hits + 1
+            assert finance_crew.telemetry.metrics.value(
+                "finance_llm_calls_total", role="Budget Planning Advisor", cache="miss"
+            ) == budget_calls
+            
+            # Expired outputs are deleted and the least recently used evicted beyond max_entries
+            small = TaskMemo(os.path.join(tmp, "small.sqlite"), ttl=60, max_entries=2)
+            small.put("a", "Analyst", "A")
+            small.put("b", "Analyst", "B")
+            assert small.get("a") == "A"
+            small.put("c", "Analyst", "C")
+            assert small.get("b") is None and small.get("a") == "A"
+            small._conn.execute("UPDATE task_outputs SET created_at = created_at - 120 WHERE fingerprint = 'a'")
+            assert small.get("a") is None
+            assert small.stats()["entries"] == 1 and small.stats()["evictions"] == 1
+            small.put("d", "Analyst", "D")
+            small._conn.execute("UPDATE task_outputs SET created_at = created_at - 120 WHERE fingerprint = 'c'")
+            small.put("e", "Analyst", "E")
+            assert small.stats()["entries"] == 2 and small.get("d") == "D"
+        
+        print("✅ Task memo successful")
+        return True
+    except Exception as e:
+        print(f"❌ Task memo error: {e}")
+        return False
+
+def test_result_store():
+    """Test if crew results are stored with their task outputs and served again without the LLM"""
+    try:
+        import os
+        import tempfile
+        import time
+        from main import FinanceCrew
+        from mock_llm import MockChatModel
+        from result_store import ResultStore, ticker_of
+        
+        assert ticker_of("AAPL stock investment") == "AAPL" and ticker_of("Apple Inc.") is None
+        assert ticker_of("Compare US exposure of BRK.B") == "BRK.B"
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            store = ResultStore(os.path.join(tmp, "results.sqlite"))
+            now = time.time()
+            store.save("financial_analysis", "MSFT", "Old view: cloud margins", created_at=now - 10 * 3600)
+            store.save("financial_analysis", " MSFT ", "New view: AI capex", created_at=now - 3600)
+            store.save("personal_finance_planning", "Age: 40", "Pay down the mortgage", client_id="c-1")
+            
+            assert store.latest(ticker="msft")["result"] == "New view: AI capex"
+            assert store.latest("financial_analysis", inputs="MSFT", max_age=6 * 3600)["result"] == "New view: AI capex"
+            assert store.latest(ticker="MSFT", max_age=1800) is None
+            assert [r["result"] for r in store.history(client_id="c-1")] == ["Pay down the mortgage"]
+            assert [r["result"] for r in store.search("cloud margins")] == ["Old view: cloud margins"]
+            assert store.search('AND "(') == []
+            assert store.purge(5 * 3600) == 1 and store.search("cloud") == []
+            
+            calls = []
+            
+            class CountingModel(MockChatModel):
+                def respond(self, prompt):
+                    calls.append(prompt)
+                    return super().respond(prompt)
+            
+            finance_crew = FinanceCrew(llm=CountingModel(response_tokens=10), plan_cache=False, task_memo=False,
+                                       result_store=store, result_max_age=3600)
+            first = finance_crew.run_financial_analysis("NVDA")
+            record = store.latest("financial_analysis", ticker="NVDA")
+            assert record["result"] == first and record["prompt_tokens"] > 0 and record["run_id"]
+            assert [task["name"] for task in record["tasks"]] == ["financial_analysis", "risk_assessment"]
+            assert all(task["output"] and task["duration_s"] is not None for task in record["tasks"])
+            
+            made = len(calls)
+            assert finance_crew.run_financial_analysis("  nvda") == first
+            assert len(calls) == made
+            
+            # Nothing streams for a stored result, so streaming mode prints it whole
+            import contextlib
+            import io
+            from main import print_result
+            
+            finance_crew.stream = True
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                print_result("RESULTS", lambda: finance_crew.run_financial_analysis("NVDA"), finance_crew)
+            assert first in out.getvalue()
+        
+        print("✅ Result store successful")
+        return True
+    except Exception as e:
+        print(f"❌ Result store error: {e}")
+        return False
+
+def test_single_flight():
+    """Test if concurrent identical requests share one crew run and waiting callers can time out"""
+    try:
+        import threading
+        import time
+        from main import FinanceCrew
+        from mock_llm import MockChatModel
+        from single_flight import SingleFlight, SingleFlightTimeout
+        
+        release = threading.Event()
+        prompts = []
+        
+        class GatedModel(MockChatModel):
+            def respond(self, prompt):
+                prompts.append(prompt)
+                release.wait(5)
+                return super().respond(prompt)
+        
+        finance_crew = FinanceCrew(llm=GatedModel(response_tokens=10), task_memo=False, single_flight_timeout=5)
+        results = []
+        threads = [
+            threading.Thread(target=lambda request=request: results.append(finance_crew.run_financial_analysis(request)))
+            for request in ("NVDA", " nvda", "NVDA  ", "Nvda", "nvda")
+        ]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while finance_crew.flights.stats()["shared"] < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        
+        # A caller with a short wait limit gives up instead of starting its own run
+        try:
+            finance_crew.run("financial_analysis", "NVDA", wait_timeout=0.05)
+            assert False, "the waiting caller should time out"
+        except SingleFlightTimeout:
+            pass
+        release.set()
+        for thread in threads:
+            thread.join()
+        
+        # One crew run (two LLM calls) answered all five callers
+        assert len(results) == 5 and len(set(results)) == 1 and len(prompts) == 2
+        assert finance_crew.flights.stats() == {"in_flight": 0, "leaders": 1, "shared": 5, "timeouts": 1}
+        # Finished runs are not reused: the next identical request runs the crew again
+        finance_crew.run_financial_analysis("NVDA")
+        assert len(prompts) == 4
+        
+        # A failed run fails every caller that shared it
+        flights = SingleFlight()
+        started, gate, calls = threading.Event(), threading.Event(), []
+        
+        def failing():
+            calls.append(1)
+            started.set()
+            gate.wait(5)
+            raise RuntimeError("model unavailable")
+        
+        errors = []
+        
+        def lead():
+            try:
+                flights.do("key", failing)
+            except RuntimeError as e:
+                errors.append(e)
+        
+        leader = threading.Thread(target=lead)
+        leader.start()
+        started.wait(5)
+        threading.Timer(0.05, gate.set).start()
+        try:
+            flights.do("key", failing)
+            assert False, "the shared failure should be raised"
+        except RuntimeError as e:
+            assert "model unavailable" in str(e)
+        leader.join()
+        assert calls == [1] and len(errors) == 1
+        
+        print("✅ Single flight successful")
+        print(f"   - Stats: {finance_crew.flights.stats()}")
+        return True
+    except Exception as e:
+        print(f"❌ Single flight error: {e}")
+        return False
+
+def test_market_data():
+    """Test if the market data store answers range queries and feeds the tools"""
+    try:
+        import os
+        import tempfile
+        from market_data import MarketDataStore, ingest
+        from tools import fundamentals_tool, market_store, price_history_tool
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            prices = os.path.join(tmp, "prices.csv")
+            with open(prices, "w") as f:
+                f.write("date,ticker,close,volume\n")
+                for day in range(1, 29):
+                    f.write(f"2024-02-{day:02d},msft,{400 + day},1000\n")
+                    f.write(f"2024-02-{day:02d},SPY,{500 - day},2000\n")
+            fundamentals = os.path.join(tmp, "fundamentals.csv")
+            with open(fundamentals, "w") as f:
+                f.write("date,ticker,revenue,net_income,shares_outstanding\n")
+                f.write('2022-06-30,MSFT,"198,000",72000,7.5\n')
+                f.write("2023-06-30,MSFT,212000,72000,7.4\n")
+            
+            store = ingest(os.path.join(tmp, "store"), prices=prices, fundamentals=fundamentals)
+            assert store.tickers() == ["MSFT", "SPY"]
+            window = MarketDataStore(store.root).prices("MSFT", "2024-02-10", "2024-02-12")
+            assert list(window["close"]) == [410, 411, 412]
+            assert window["close"].base is not None  # a view of the memory-mapped column
+            assert list(store.fundamentals("msft")["revenue"]) == [198000, 212000]
+            
+            os.environ["FINANCE_MARKET_DATA"] = store.root
+            try:
+                assert market_store() is not None
+                assert "total return" in price_history_tool.run("MSFT 2024-02-01 2024-02-28")
+                assert "Revenue growth" in fundamentals_tool.run("MSFT")
+            finally:
+                del os.environ["FINANCE_MARKET_DATA"]
+        
+        print("✅ Market data store successful")
+        return True
+    except Exception as e:
+        print(f"❌ Market data store error: {e}")
+        return False
+
+def test_model_routing():
+    """Test if tasks run on their routed model and fall back when it times out"""
+    try:
+        from main import FinanceCrew
+        from mock_llm import MockChatModel
+        from model_router import ModelRouter
+        
+        router = ModelRouter({
+            "models": {
+                "fast": {"provider": "mock", "response_tokens": 5},
+                "strong": {"provider": "mock", "latency": 0.2, "timeout": 0.01},
+            },
+            "default": ["fast"],
+            "tasks": {"comprehensive_financial_review": {"models": ["strong", "fast"]}},
+        }, min_samples=2)
+        finance_crew = FinanceCrew(llm=MockChatModel(response_tokens=10), router=router, plan_cache=False, task_memo=False)
+        assert ModelRouter.parse_routes("default=a;budget_planning=b|c")["tasks"]["budget_planning"] == ["b", "c"]
+        
+        finance_crew.run_personal_finance_planning("Age: 35, Income: $85,000")
+        stats = router.stats()
+        assert stats["strong"]["timeouts"] == 1 and stats["fast"]["calls"] == 3
+        finance_crew.run_personal_finance_planning("Age: 36, Income: $85,000")
+        # Timing out on every recent call moves the strong model behind its fallback
+        assert router.rank({"models": ["strong", "fast"]}) == ["fast", "strong"]
+        finance_crew.run_personal_finance_planning("Age: 37, Income: $85,000")
+        assert router.stats()["strong"]["timeouts"] == 2
+        
+        print("✅ Model routing successful")
+        return True
+    except Exception as e:
+        print(f"❌ Model routing error: {e}")
+        return False
+
+def test_http_pool():
+    """Test if LLM clients share one pooled HTTP client that retries and trips its circuit"""
+    try:
+        import httpx
+        from agents import FinanceAgents
+        from http_pool import CircuitOpenError, RetryTransport, shared_client
+        from llm_cache import CachedChatOpenAI
+        
+        first, second = FinanceAgents(cache=False), FinanceAgents(cache=False)
+        assert first.llm.client._client._client is second.llm.client._client._client is shared_client()
+        
+        statuses = [429, 200, 503, 503, 503]
+        def handler(request):
+            status = statuses.pop(0)
+            body = {"id": "1", "object": "chat.completion", "created": 0, "model": "gpt-3.5-turbo", "choices": [
+                {"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}]}
+            return httpx.Response(status, json=body, headers={"Retry-After": "2"} if status == 429 else {})
+        sleeps = []
+        transport = RetryTransport(httpx.MockTransport(handler), max_retries=1, breaker_threshold=3, sleep=sleeps.append)
+        llm = CachedChatOpenAI(http_client=httpx.Client(transport=transport), max_retries=0)
+        
+        assert llm.invoke("hi").content == "ok"
+        assert sleeps[0] >= 2 and transport.retries == 1
+        for _ in range(2):
+            try:
+                llm.invoke("hi")
+            except Exception:
+                pass
+        # Three 503s in a row open the circuit, so the next call never reaches the API
+        assert not statuses and transport.stats()["circuits"] == {"api.openai.com": "open"}
+        try:
+            transport.handle_request(httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+            assert False, "circuit should be open"
+        except CircuitOpenError:
+            pass
+        
+        print("✅ HTTP pool successful")
+        return True
+    except Exception as e:
+        print(f"❌ HTTP pool error: {e}")
+        return False
+
+def test_worker_queue():
+    """Test if jobs are leased, requeued when their worker is lost and failed after max_attempts"""
+    try:
+        import os
+        import tempfile
+        import time
+        from worker import JobQueue, WorkerCrashLoop, WorkerPool
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "jobs.sqlite")
+            queue = JobQueue(path, lease=0.2)
+            job_id = queue.submit("financial_analysis", "AAPL", max_attempts=2)
+            assert queue.claim("w1")["id"] == job_id
+            assert queue.claim("w2") is None
+            
+            # w1 goes silent: its lease expires and another worker claims the job
+            time.sleep(0.3)
+            job = queue.claim("w2")
+            assert job["id"] == job_id and job["attempts"] == 2
+            assert not queue.complete(job_id, "w1", "stale result")
+            
+            # A failure on the last attempt fails the job instead of requeueing it
+            assert queue.fail(job_id, "w2", "RuntimeError('boom')")
+            assert queue.get(job_id)["status"] == "failed" and queue.claim("w3") is None
+            
+            retried = queue.submit("financial_analysis", "MSFT")
+            queue.claim("w1")
+            queue.fail(retried, "w1", "RuntimeError('boom')")
+            assert queue.get(retried)["status"] == "queued"
+            assert queue.claim("w2")["attempts"] == 2 and queue.complete(retried, "w2", "ok")
+            
+            # Expired leases are failed, not reclaimed, once the attempts are used up
+            lost = queue.submit("investment_analysis", "TSLA", max_attempts=1)
+            queue.claim("w1")
+            time.sleep(0.3)
+            assert queue.claim("w2") is None
+            assert queue.get(lost)["error"] == "worker lost"
+            assert queue.stats() == {"queued": 0, "running": 0, "done": 1, "failed": 2}
+            
+            # Dead workers are restarted after a growing backoff, then given up on
+            class DeadProcess:
+                pid, exitcode = 4242, 1
+                def is_alive(self):
+                    return False
+            
+            pool = WorkerPool(path, processes=1, backoff=0.05, max_backoff=1.0, max_crashes=3)
+            pool._spawn = DeadProcess
+            pool.start()
+            pool.supervise()
+            assert pool.restarts == 0
+            time.sleep(0.06)
+            pool.supervise()
+            assert pool.restarts == 1
+            pool.supervise()
+            time.sleep(0.06)
+            pool.supervise()
+            assert pool.restarts == 1
+            time.sleep(0.06)
+            pool.supervise()
+            assert pool.restarts == 2
+            pool.supervise()
+            time.sleep(0.21)
+            pool.supervise()
+            assert pool.restarts == 3
+            try:
+                pool.supervise()
+                raise AssertionError("crash loop not detected")
+            except WorkerCrashLoop:
+                pass
+            queue.close()
+            pool.queue.close()
+        
+        print("✅ Worker queue successful")
+        return True
+    except Exception as e:
+        print(f"❌ Worker queue error: {e}")
+        return False
+
 def test_crew_initialization():
     """Test if the main crew class can be initialized"""
     try:
@@ -74,8 +1249,33 @@ if __name__ == "__main__":
     
     tests = [
         test_imports,
+        test_lazy_startup,
         test_agent_creation,
         test_task_creation,
+        test_task_dependencies,
+        test_async_api,
+        test_crew_registry,
+        test_structured_outputs,
+        test_speculative_review,
+        test_agent_pool,
+        test_response_cache,
+        test_batch_analysis,
+        test_risk_metrics,
+        test_planning,
+        test_stress_testing,
+        test_streaming_printer,
+        test_prompt_budget,
+        test_mock_crew_kickoff,
+        test_telemetry,
+        test_run_log,
+        test_semantic_plan_cache,
+        test_task_memo,
+        test_result_store,
+        test_single_flight,
+        test_market_data,
+        test_model_routing,
+        test_http_pool,
+        test_worker_queue,
         test_crew_initialization
     ]
     
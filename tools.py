@@ -0,0 +1,323 @@
+"""
+Deterministic tools that give agents exact figures instead of generated estimates
+"""
+
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+from crewai_tools import tool
+
+from market_data import MarketDataStore
+from planning import (amortization_schedule, debt_payoff, mean_variance_weights, portfolio_stats,
+                      rebalance_bands, return_moments, risk_parity_weights, savings_projection)
+from risk_metrics import TRADING_DAYS, format_summary, load_price_history, risk_summary
+from stress import format_stress, stress_settings, stress_test
+
+
+@lru_cache(maxsize=4)
+def _price_history(path, mtime):
+    return load_price_history(path)
+
+
+@lru_cache(maxsize=4)
+def _market_store(root, mtime):
+    return MarketDataStore(root)
+
+
+def market_store():
+    """Return the store configured by FINANCE_MARKET_DATA, or None"""
+    root = os.getenv("FINANCE_MARKET_DATA")
+    if not root or not os.path.exists(os.path.join(root, "index.json")):
+        return None
+    # Re-ingesting replaces index.json, which opens the new store
+    return _market_store(root, os.path.getmtime(os.path.join(root, "index.json")))
+
+
+def price_history():
+    """Return {ticker: (dates, closes)} from the market data store or FINANCE_PRICE_HISTORY, or None"""
+    store = market_store()
+    if store is not None and "prices" in store.index:
+        return store.closes()
+    path = os.getenv("FINANCE_PRICE_HISTORY")
+    if not path or not os.path.exists(path):
+        return None
+    return _price_history(path, os.path.getmtime(path))
+
+
+def _parse_query(query):
+    # "MSFT", "MSFT 2022-01-01" or "MSFT 2022-01-01 2023-12-31"
+    parts = query.replace(",", " ").split()
+    if not parts:
+        return "", None, None
+    return parts[0].upper(), parts[1] if len(parts) > 1 else None, parts[2] if len(parts) > 2 else None
+
+
+def _parse_options(query):
+    # "SPY AGG risk_aversion=3" -> (["SPY", "AGG"], {"risk_aversion": 3.0})
+    words, options = [], {}
+    # Thousands separators are part of a number, other commas separate items
+    for part in re.sub(r"(?<=\d),(?=\d{3}\b)", "", query).replace(",", " ").split():
+        key, sep, value = part.partition("=")
+        if not sep:
+            words.append(part)
+            continue
+        try:
+            options[key.lower()] = float(value.rstrip("%").replace("_", ""))
+        except ValueError:
+            options[key.lower()] = value
+    return words, options
+
+
+@tool("Risk Metrics")
+def risk_metrics_tool(ticker: str) -> str:
+    """Exact beta, volatility, VaR (historical, parametric, Monte Carlo), CVaR, Sharpe, Sortino and max drawdown for a ticker symbol such as MSFT, from local daily prices."""
+    history = price_history()
+    if history is None:
+        return "No local price history is configured; state that quantitative metrics are unavailable."
+
+    ticker = ticker.strip().upper()
+    if ticker not in history:
+        return f"No price history for {ticker}. Available tickers: {', '.join(sorted(history)[:20])}"
+
+    benchmark = os.getenv("FINANCE_BENCHMARK_TICKER", "SPY").upper()
+    dates, prices = history[ticker]
+    market_dates, market_prices = history.get(benchmark, (None, None)) if benchmark != ticker else (None, None)
+    try:
+        summary = risk_summary(
+            prices,
+            market_prices=market_prices,
+            risk_free_rate=float(os.getenv("FINANCE_RISK_FREE_RATE", 0.0)),
+            dates=dates,
+            market_dates=market_dates,
+        )
+    except ValueError as e:
+        return f"{e} for {ticker}; state that quantitative metrics are unavailable."
+    return format_summary(ticker, summary)
+
+
+@tool("Price History")
+def price_history_tool(query: str) -> str:
+    """Exact price performance for a ticker from local daily prices. Input is a ticker, optionally followed by start and end dates, e.g. "MSFT" or "MSFT 2022-01-01 2023-12-31"."""
+    store = market_store()
+    if store is None:
+        return "No local market data is configured; state that price figures are unavailable."
+    ticker, start, end = _parse_query(query)
+    prices = store.prices(ticker, start, end)
+    if prices is None or prices["date"].size < 2:
+        return f"No price history for {ticker}. Available tickers: {', '.join(store.tickers()[:20])}"
+
+    dates, close = prices["date"], prices["close"]
+    years = max((dates[-1] - dates[0]).astype(int) / 365.25, 1 / 365.25)
+    returns = close[1:] / close[:-1] - 1.0
+    lines = [
+        f"Price history for {ticker} from {dates[0]} to {dates[-1]} ({dates.size} trading days):",
+        f"- Close: {close[0]:.2f} -> {close[-1]:.2f} (total return {close[-1] / close[0] - 1:.2%}, "
+        f"annualized {(close[-1] / close[0]) ** (1 / years) - 1:.2%})",
+        f"- Range: low {close.min():.2f}, high {close.max():.2f}",
+        f"- Annualized volatility: {returns.std(ddof=1) * np.sqrt(TRADING_DAYS):.2%}",
+    ]
+    if "volume" in prices and not np.isnan(prices["volume"]).all():
+        lines.append(f"- Average daily volume: {np.nanmean(prices['volume']):,.0f}")
+    # Year-end closes give the trend without listing every day
+    years_of = dates.astype("datetime64[Y]")
+    last_of_year = np.flatnonzero(np.append(years_of[1:] != years_of[:-1], True))
+    lines.append("- Year-end closes: " + ", ".join(
+        f"{str(years_of[i])}: {close[i]:.2f}" for i in last_of_year
+    ))
+    return "\n".join(lines)
+
+
+@tool("Company Fundamentals")
+def fundamentals_tool(ticker: str) -> str:
+    """Reported revenue, net income, margins, growth, ROE, ROA, debt-to-equity, current ratio and P/E for a ticker symbol such as MSFT, from local fundamentals data, for up to the last five reporting periods."""
+    store = market_store()
+    if store is None or "fundamentals" not in store.index:
+        return "No local fundamentals data is configured; state that reported figures are unavailable."
+    ticker = ticker.strip().upper()
+    data = store.fundamentals(ticker)
+    if data is None or data["date"].size == 0:
+        return f"No fundamentals for {ticker}. Available tickers: {', '.join(store.tickers('fundamentals')[:20])}"
+
+    periods = slice(-5, None)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        def column(name):
+            values = data.get(name)
+            return np.asarray(values[periods]) if values is not None else np.full(data["date"][periods].size, np.nan)
+
+        revenue, net_income = column("revenue"), column("net_income")
+        equity, assets = column("total_equity"), column("total_assets")
+        rows = {
+            "Revenue": revenue,
+            "Revenue growth": np.append(np.nan, revenue[1:] / revenue[:-1] - 1.0),
+            "Net income": net_income,
+            "Net margin": net_income / revenue,
+            "Operating cash flow": column("operating_cash_flow"),
+            "ROE": net_income / equity,
+            "ROA": net_income / assets,
+            "Debt-to-equity": column("total_debt") / equity,
+            "Current ratio": column("current_assets") / column("current_liabilities"),
+        }
+        eps = net_income[-1] / column("shares_outstanding")[-1]
+
+    percentages = {"Revenue growth", "Net margin", "ROE", "ROA"}
+    lines = [f"Fundamentals for {ticker} (periods ending {', '.join(str(d) for d in data['date'][periods])}):"]
+    for label, values in rows.items():
+        if np.isnan(values).all():
+            continue
+        if label in percentages:
+            cells = ["n/a" if np.isnan(v) else f"{v:.1%}" for v in values]
+        elif label in ("Debt-to-equity", "Current ratio"):
+            cells = ["n/a" if np.isnan(v) else f"{v:.2f}" for v in values]
+        else:
+            cells = ["n/a" if np.isnan(v) else f"{v:,.0f}" for v in values]
+        lines.append(f"- {label}: {' | '.join(cells)}")
+
+    prices = store.prices(ticker, columns=("close",))
+    if prices is not None and prices["close"].size and np.isfinite(eps) and eps > 0:
+        lines.append(f"- P/E (last close / latest EPS): {prices['close'][-1] / eps:.1f}")
+    return "\n".join(lines)
+
+
+@tool("Loan Payment")
+def loan_payment_tool(query: str) -> str:
+    """Exact monthly payment, total interest and year-end balances of a fixed-rate loan. Input is the principal, annual rate in percent and term in years, e.g. "principal=300000 rate=6.5 years=30"."""
+    _, options = _parse_options(query)
+    try:
+        principal, rate, years = options["principal"], options["rate"], options["years"]
+        schedule = amortization_schedule(principal, rate / 100, int(round(years * 12)))
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        return 'Input must look like "principal=300000 rate=6.5 years=30".'
+    return "\n".join([
+        f"Loan of {principal:,.0f} at {rate:.2f}% over {years:g} years:",
+        f"- Monthly payment: {schedule['payment'][0]:,.2f}",
+        f"- Total interest: {schedule['interest'].sum():,.2f}",
+        "- Balance at year end: " + ", ".join(
+            f"{year}: {balance:,.0f}" for year, balance in enumerate(schedule["balance"][11::12], start=1)
+        ),
+    ])
+
+
+@tool("Debt Payoff Plan")
+def debt_payoff_tool(query: str) -> str:
+    """Exact payoff months and total interest for several debts under the avalanche (highest rate first) and snowball (smallest balance first) strategies. Input is "name balance rate% minimum" per debt, separated by semicolons, and the total monthly budget, e.g. "card 5000 22 150; car 12000 6.5 300; budget=900"."""
+    names, balances, rates, minimums, budget = [], [], [], [], None
+    for item in query.split(";"):
+        words, options = _parse_options(item)
+        budget = options.get("budget", budget)
+        if not words:
+            continue
+        try:
+            balance, rate, minimum = (float(word.rstrip("%")) for word in words[-3:])
+        except ValueError:
+            return f'Could not read debt "{item.strip()}"; use "name balance rate% minimum", e.g. "card 5000 22 150".'
+        names.append(" ".join(words[:-3]) or f"debt {len(names) + 1}")
+        balances.append(balance)
+        rates.append(rate / 100)
+        minimums.append(minimum)
+    if not names or not isinstance(budget, float):
+        return 'Input must list debts and a budget, e.g. "card 5000 22 150; car 12000 6.5 300; budget=900".'
+
+    lines = [f"Debt payoff with a monthly budget of {budget:,.2f}:"]
+    for strategy in ("avalanche", "snowball"):
+        try:
+            plan = debt_payoff(balances, rates, minimums, budget, strategy=strategy)
+        except ValueError as e:
+            return f"{e}; state that the debts cannot be repaid at this budget."
+        order = ", ".join(f"{names[i]} (month {plan['payoff_month'][i]})" for i in plan["order"])
+        lines.append(
+            f"- {strategy.title()}: debt-free in {plan['months']} months, total interest "
+            f"{plan['total_interest']:,.2f}; payoff order {order}"
+        )
+    return "\n".join(lines)
+
+
+@tool("Savings Projection")
+def savings_projection_tool(query: str) -> str:
+    """Exact projected balance of a savings plan, the month it reaches a target and the monthly contribution the target needs. Input is current savings, monthly contribution, annual return in percent, horizon in years and an optional target, e.g. "current=20000 monthly=500 return=5 years=10 target=100000"."""
+    _, options = _parse_options(query)
+    try:
+        current, monthly = options.get("current", 0.0), options.get("monthly", 0.0)
+        annual_return, years, target = options.get("return", 0.0), options["years"], options.get("target")
+        projection = savings_projection(current, monthly, annual_return / 100, int(round(years * 12)), target)
+    except (KeyError, TypeError, ValueError, IndexError):
+        return 'Input must look like "current=20000 monthly=500 return=5 years=10 target=100000".'
+
+    lines = [
+        f"Saving {monthly:,.2f} a month on top of {current:,.2f} at {annual_return:.2f}% for {years:g} years:",
+        f"- Final balance: {projection['final_balance']:,.2f} (contributed {projection['contributed']:,.2f})",
+    ]
+    if target is not None:
+        reached = projection["months_to_target"]
+        lines.append(f"- Target {target:,.2f}: " + (f"reached in month {reached}" if reached else "not reached"))
+        lines.append(
+            f"- Monthly contribution that reaches it in {years:g} years: {projection['required_contribution']:,.2f}"
+        )
+    return "\n".join(lines)
+
+
+@tool("Portfolio Allocation")
+def portfolio_allocation_tool(query: str) -> str:
+    """Exact long-only mean-variance and risk-parity weights, expected return, volatility, risk contributions and rebalancing bands for tickers or ETFs, from local daily prices. Input is the tickers and an optional risk aversion, e.g. "SPY AGG GLD VNQ risk_aversion=3"."""
+    history = price_history()
+    if history is None:
+        return "No local price history is configured; state that optimized weights are unavailable."
+    words, options = _parse_options(query)
+    tickers = list(dict.fromkeys(word.upper() for word in words))
+    missing = [ticker for ticker in tickers if ticker not in history]
+    if missing:
+        return f"No price history for {', '.join(missing)}. Available tickers: {', '.join(sorted(history)[:20])}"
+    if len(tickers) < 2:
+        return "Give at least two tickers to allocate between."
+    risk_aversion = options.get("risk_aversion", 3.0)
+    if not isinstance(risk_aversion, float) or risk_aversion <= 0:
+        return "risk_aversion must be a positive number."
+
+    try:
+        mean, cov, days = return_moments([history[ticker] for ticker in tickers])
+    except ValueError as e:
+        return f"{e} for {', '.join(tickers)}; state that optimized weights are unavailable."
+
+    lines = [f"Allocation across {', '.join(tickers)} from {days} shared trading days (annualized):"]
+    for label, weights in (
+        (f"Mean-variance (risk aversion {risk_aversion:g})", mean_variance_weights(mean, cov, risk_aversion)),
+        ("Risk parity", risk_parity_weights(cov)),
+    ):
+        stats = portfolio_stats(weights, mean, cov)
+        low, high = rebalance_bands(weights)
+        lines.append(f"- {label}: expected return {stats['expected_return']:.2%}, volatility {stats['volatility']:.2%}")
+        lines.extend(
+            f"  - {ticker}: {weight:.1%} (risk share {share:.1%}, rebalance outside {lo:.1%}-{hi:.1%})"
+            for ticker, weight, share, lo, hi in zip(tickers, weights, stats["risk_contributions"], low, high)
+        )
+    return "\n".join(lines)
+
+
+@tool("Stress Test")
+def stress_test_tool(portfolio: str) -> str:
+    """Exact Monte Carlo VaR and CVaR, 2008 and 2020 crisis replays and equity market and interest rate shocks for a ticker or a portfolio, from local daily prices. Input is tickers with optional weights, e.g. "MSFT" or "AAPL=40 MSFT=30 AGG=30"."""
+    history = price_history()
+    if history is None:
+        return "No local price history is configured; state that stress test results are unavailable."
+    words, options = _parse_options(portfolio)
+    # Tickers given without a weight share the rest of the portfolio equally
+    weights = {key.upper(): value for key, value in options.items()}
+    weights.update({word.upper(): None for word in words if word.upper() not in weights})
+    if not weights or any(isinstance(w, str) or (w is not None and w < 0) for w in weights.values()):
+        return 'Input must be tickers with optional weights, e.g. "AAPL=40 MSFT=30 AGG=30".'
+    missing = [ticker for ticker in weights if ticker not in history]
+    if missing:
+        return f"No price history for {', '.join(missing)}. Available tickers: {', '.join(sorted(history)[:20])}"
+    given = sum(w for w in weights.values() if w is not None)
+    unweighted = [ticker for ticker, w in weights.items() if w is None]
+    share = max(100.0 - given, 0.0) / len(unweighted) if unweighted else 0.0
+    weights = {ticker: share if w is None else w for ticker, w in weights.items()}
+    if sum(weights.values()) <= 0:
+        return "Weights must add up to more than zero."
+
+    try:
+        result = stress_test(weights, history, **stress_settings())
+    except ValueError as e:
+        return f"{e} for {', '.join(weights)}; state that stress test results are unavailable."
+    return format_stress(result)
@@ -0,0 +1,395 @@
+"""
+SQLite-backed job queue and a multi-process pool of warm FinanceCrew workers
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+from crew_registry import shared_registry
+
+
+class WorkerCrashLoop(RuntimeError):
+    """Raised by WorkerPool.supervise when a worker keeps crashing right after it starts"""
+
+
+def worker_id(pid=None):
+    return f"{socket.gethostname()}:{pid or os.getpid()}"
+
+
+class JobQueue:
+    """Durable job queue in a SQLite file shared by every worker process.
+
+    A claimed job is leased to its worker, which renews the lease while the
+    crew runs. If the worker dies, the job is queued again once the lease
+    expires, or as soon as the pool notices, and fails after `max_attempts`
+    claims so a job that crashes workers cannot crash them forever.
+    """
+
+    def __init__(self, path, lease=60.0):
+        self.path = path
+        self.lease = lease
+        self._lock = threading.Lock()
+        # Autocommit, so claims can take the write lock with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                type TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                worker TEXT,
+                lease_until REAL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.getenv("FINANCE_JOB_QUEUE_PATH", "jobs.sqlite"),
+                   lease=float(os.getenv("FINANCE_JOB_LEASE", 60.0)))
+
+    def submit(self, job_type, payload, max_attempts=3):
+        """Queue a job and return its id"""
+        # Job types are the services declared in crews.yaml
+        services = shared_registry().services()
+        if job_type not in services:
+            raise ValueError(f"Unknown job type {job_type!r}, expected one of: {', '.join(services)}")
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, type, payload, status, max_attempts, created_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, job_type, json.dumps(payload), max_attempts, time.time()),
+            )
+        return job_id
+
+    def claim(self, worker):
+        """Lease the oldest runnable job to `worker`, or return None when there is none"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Expired leases whose job has used up its attempts fail here
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'worker lost', finished_at = ? "
+                    "WHERE status = 'running' AND lease_until < ? AND attempts >= max_attempts",
+                    (now, now),
+                )
+                row = self._conn.execute(
+                    "SELECT id, type, payload, attempts FROM jobs "
+                    "WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, "
+                        "lease_until = ?, started_at = ? WHERE id = ?",
+                        (worker, now + self.lease, now, row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return {"id": row[0], "type": row[1], "payload": json.loads(row[2]), "attempts": row[3] + 1}
+
+    def renew(self, job_id, worker):
+        """Extend a running job's lease; False if the worker no longer holds it"""
+        return self._update(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time() + self.lease, job_id, worker),
+        )
+
+    def complete(self, job_id, worker, result):
+        return self._update(
+            "UPDATE jobs SET status = 'done', result = ?, error = NULL, finished_at = ? "
+            "WHERE id = ? AND worker = ? AND status = 'running'",
+            (result, time.time(), job_id, worker),
+        )
+
+    def fail(self, job_id, worker, error):
+        """Queue the job again, or mark it failed once it has used up its attempts"""
+        return self._update(
+            "UPDATE jobs SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END, "
+            "error = ?, finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE ? END "
+            "WHERE id = ? AND worker = ? AND status = 'running'",
+            (error, time.time(), job_id, worker),
+        )
+
+    def release(self, worker):
+        """Expire the leases of a dead worker so its jobs can be claimed right away"""
+        return self._update(
+            "UPDATE jobs SET lease_until = 0 WHERE worker = ? AND status = 'running'", (worker,)
+        )
+
+    def _update(self, sql, params):
+        with self._lock:
+            return self._conn.execute(sql, params).rowcount > 0
+
+    def get(self, job_id):
+        """Return the job's status, attempts, result and error, or None if unknown"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT id, type, payload, status, attempts, worker, result, error, "
+                "created_at, started_at, finished_at FROM jobs WHERE id = ?",
+                (job_id,),
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        job = dict(zip((column[0] for column in cursor.description), row))
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def wait(self, job_id, timeout=None, poll=0.2):
+        """Block until the job is done or failed and return it"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job["status"] in ("done", "failed"):
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Job {job_id} still {job['status']} after {timeout}s")
+            time.sleep(poll)
+
+    def stats(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {"queued": 0, "running": 0, "done": 0, "failed": 0}
+        counts.update(rows)
+        return counts
+
+    def close(self):
+        self._conn.close()
+
+
+def _renew_lease(queue, job_id, worker, finished):
+    while not finished.wait(queue.lease / 3):
+        if not queue.renew(job_id, worker):
+            return
+
+
+def _work(queue, finance_crew, worker, stop, poll):
+    while not stop.is_set():
+        job = queue.claim(worker)
+        if job is None:
+            stop.wait(poll)
+            continue
+        finished = threading.Event()
+        heartbeat = threading.Thread(target=_renew_lease, args=(queue, job["id"], worker, finished), daemon=True)
+        heartbeat.start()
+        try:
+            result = finance_crew.run(job["type"], job["payload"])
+        except Exception as e:
+            queue.fail(job["id"], worker, repr(e))
+        else:
+            queue.complete(job["id"], worker, str(result))
+        finally:
+            finished.set()
+            heartbeat.join()
+
+
+def worker_main(path, lease, threads, poll):
+    """Entry point of a worker process: one warm FinanceCrew shared by `threads` job loops"""
+    # The pool stops workers with SIGTERM, which lets their current jobs finish.
+    # A local event is used because a process killed while waiting on a shared
+    # multiprocessing.Event leaves it deadlocked for everyone else.
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    # Ctrl-C reaches the whole process group; the pool decides how to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Imported here so submitting jobs and checking status stay light
+    from main import FinanceCrew
+
+    queue = JobQueue(path, lease)
+    finance_crew = FinanceCrew()
+    finance_crew.agents.warm(threads)
+    loops = [
+        threading.Thread(target=_work, args=(queue, finance_crew, worker_id(), stop, poll))
+        for _ in range(threads)
+    ]
+    for loop in loops:
+        loop.start()
+    # Joined with a timeout so the SIGTERM handler gets to run
+    while any(loop.is_alive() for loop in loops):
+        for loop in loops:
+            loop.join(poll)
+    queue.close()
+    finance_crew.telemetry.shutdown()
+
+
+class WorkerPool:
+    """Run `processes` worker processes against a JobQueue and replace any that die.
+
+    Each process builds its FinanceCrew once and keeps it warm for every job
+    it runs. Processes sidestep the GIL, so the pool scales across cores.
+    A worker that dies is restarted after an exponential backoff (`backoff`
+    seconds, doubling up to `max_backoff`). After `max_crashes` crashes in a
+    row the pool gives up with WorkerCrashLoop instead of restarting forever.
+    A worker that stayed up longer than `max_backoff` starts counting again.
+    """
+
+    def __init__(self, path, processes=None, threads=1, lease=60.0, poll=0.5,
+                 backoff=1.0, max_backoff=60.0, max_crashes=5):
+        self.path = path
+        self.processes = processes or os.cpu_count() or 1
+        self.threads = threads
+        self.lease = lease
+        self.poll = poll
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_crashes = max_crashes
+        self.queue = JobQueue(path, lease)
+        self.restarts = 0
+        # Spawned children start clean instead of inheriting the parent's threads and connections
+        self._context = multiprocessing.get_context("spawn")
+        self._stopping = False
+        self._workers = []
+        self._started = []
+        self._crashes = []
+        # Slot -> monotonic time its dead worker may be restarted
+        self._restart_at = {}
+
+    def start(self):
+        self._stopping = False
+        self._workers = [self._spawn() for _ in range(self.processes)]
+        self._started = [time.monotonic()] * self.processes
+        self._crashes = [0] * self.processes
+        self._restart_at = {}
+        return self
+
+    def _spawn(self):
+        process = self._context.Process(
+            target=worker_main,
+            args=(self.path, self.lease, self.threads, self.poll),
+            daemon=True,
+        )
+        process.start()
+        return process
+
+    def supervise(self):
+        """Hand dead workers' jobs back to the queue and restart them once their backoff has passed"""
+        if self._stopping:
+            return
+        now = time.monotonic()
+        for i, process in enumerate(self._workers):
+            if process.is_alive():
+                continue
+            if i not in self._restart_at:
+                self.queue.release(worker_id(process.pid))
+                crashes = 1 if now - self._started[i] > self.max_backoff else self._crashes[i] + 1
+                if crashes > self.max_crashes:
+                    raise WorkerCrashLoop(
+                        f"Worker crashed {crashes} times in a row (last exit code {process.exitcode})"
+                    )
+                self._crashes[i] = crashes
+                self._restart_at[i] = now + min(self.max_backoff, self.backoff * 2 ** (crashes - 1))
+            if now >= self._restart_at[i]:
+                del self._restart_at[i]
+                self._workers[i] = self._spawn()
+                self._started[i] = now
+                self.restarts += 1
+
+    def serve(self, interval=1.0):
+        """Start the workers and supervise them until interrupted"""
+        self.start()
+        try:
+            while True:
+                self.supervise()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self, timeout=30.0):
+        """Let workers finish their current job, then stop them"""
+        self._stopping = True
+        for process in self._workers:
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in self._workers:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                process.kill()
+                process.join()
+                self.queue.release(worker_id(process.pid))
+        self._workers = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    """Serve, submit and inspect FinanceCrew jobs"""
+    parser = argparse.ArgumentParser(description="Finance crew job queue and worker pool")
+    parser.add_argument("--db", default=os.getenv("FINANCE_JOB_QUEUE_PATH", "jobs.sqlite"),
+                        help="Job queue SQLite file (FINANCE_JOB_QUEUE_PATH)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Run worker processes until interrupted")
+    serve.add_argument("--processes", type=int, default=None, help="Worker processes (default: CPU count)")
+    serve.add_argument("--threads", type=int, default=1, help="Concurrent jobs per process")
+    serve.add_argument("--lease", type=float, default=float(os.getenv("FINANCE_JOB_LEASE", 60.0)),
+                       help="Seconds before a silent worker's job is requeued")
+
+    submit = commands.add_parser("submit", help="Queue a job and print its id")
+    submit.add_argument("type", choices=shared_registry().services())
+    submit.add_argument("payload", help="Company, client profile or investment details")
+    submit.add_argument("--max-attempts", type=int, default=3)
+    submit.add_argument("--wait", action="store_true", help="Wait for the job and print its result")
+
+    status = commands.add_parser("status", help="Print a job as JSON")
+    status.add_argument("job_id")
+
+    commands.add_parser("stats", help="Print job counts by status")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        WorkerPool(args.db, processes=args.processes, threads=args.threads, lease=args.lease).serve()
+        return
+
+    queue = JobQueue(args.db)
+    if args.command == "submit":
+        job_id = queue.submit(args.type, args.payload, max_attempts=args.max_attempts)
+        if not args.wait:
+            print(job_id)
+            return
+        job = queue.wait(job_id)
+        print(job["result"] if job["status"] == "done" else f"Job {job_id} failed: {job['error']}")
+        if job["status"] != "done":
+            sys.exit(1)
+    elif args.command == "status":
+        job = queue.get(args.job_id)
+        if job is None:
+            sys.exit(f"Unknown job {args.job_id}")
+        print(json.dumps(job, indent=2))
+    else:
+        print(json.dumps(queue.stats()))
+
+
+if __name__ == "__main__":
+    main()